@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import io
+import itertools
 import os
 import zipfile
 import tempfile
@@ -8,18 +9,46 @@ import tempfile
 # Importando suas lógicas existentes e adaptadas
 from utils import digits, mask_cnpj, fmt_period
 from logic_extrator import processar_extracao_cloud
-from logic_resumo import summarize_zipfile_resumo, build_detail_from_zip_resumo, build_items_from_zip_resumo
-from logic_sped import parse_sped_from_any
+from logic_resumo import EstadoResumo
+from logic_sped import exportar_sped, gravar_sped_particionado, parse_sped_from_any, tabelas_particionadas
 from logic_nfse_split import split_nfse_abrasf, make_zip_bytes
 from logic_converter import converter_txt_para_xml_lote
+from core.cache_parse import obter_cache_parse
+from core.dedupe import ORCAMENTO_DEDUPE_PADRAO
+from core.exportacao import FORMATOS_EXPORTACAO
+from core.instrumentacao import MEDIDOR_NULO, Medidor
 
 
-def to_excel(df):
+def to_excel(df, medidor=None):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
+    with (medidor or MEDIDOR_NULO).etapa("excel.escrita"):
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False, sheet_name='Sheet1')
     return output.getvalue()
 
+
+def mostrar_medicoes(medidor, chave):
+    """Expander com tempos por etapa e contadores do processamento + download em JSON."""
+    rel = medidor.relatorio()
+    with st.expander("⏱️ Medições de desempenho"):
+        st.caption(f"Tempo total: {rel['total_wall_s']:.2f}s (CPU: {rel['total_cpu_s']:.2f}s)")
+        if rel["etapas"]:
+            df_etapas = pd.DataFrame([
+                {"Etapa": nome, "Chamadas": e["chamadas"], "Tempo (s)": round(e["wall_s"], 3), "CPU (s)": round(e["cpu_s"], 3)}
+                for nome, e in sorted(rel["etapas"].items(), key=lambda kv: -kv[1]["wall_s"])
+            ])
+            st.dataframe(df_etapas, use_container_width=True, hide_index=True)
+        if rel["contadores"]:
+            df_cont = pd.DataFrame([{"Contador": k, "Valor": v} for k, v in sorted(rel["contadores"].items())])
+            st.dataframe(df_cont, use_container_width=True, hide_index=True)
+        st.download_button(
+            "📥 Baixar medições (JSON)",
+            medidor.to_json(),
+            file_name=f"medicoes_{chave}.json",
+            mime="application/json",
+            key=f"medicoes_{chave}",
+        )
+
 # Configuração da Página
 st.set_page_config(page_title="Central de Ferramentas XML", layout="wide", page_icon="🧟")
 
@@ -98,6 +127,9 @@ if check_password():
         
         uploaded_zip = st.file_uploader("Suba o arquivo compactado de origem", type=["zip", "7z"])
         modo_ext = st.radio("Modo de Processamento", ["Juntar Tudo", "Separar pelo Emitente (Classificação)"])
+        dedupe_ext = False
+        if modo_ext == "Juntar Tudo":
+            dedupe_ext = st.checkbox("Ignorar arquivos repetidos (conteúdo idêntico)", value=False)
         
         # --- NOVOS CAMPOS DE FILTRO (Aparecem apenas na Classificação) ---
         filtros = {"data_ini": None, "data_fim": None, "cfops": None}
@@ -115,6 +147,13 @@ if check_password():
                     # Transforma a string "5102, 6102" em uma lista ['5102', '6102']
                     filtros["cfops"] = [c.strip() for c in cfop_raw.split(",") if c.strip()]
 
+        with st.expander("⚙️ Desempenho (arquivos grandes)"):
+            col_w1, col_w2 = st.columns(2)
+            with col_w1:
+                extrator_workers = st.number_input("Processos paralelos", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1, key="extrator_workers")
+            with col_w2:
+                extrator_lote = st.number_input("XMLs por lote", min_value=10, max_value=5000, value=200, step=10, key="extrator_lote")
+
         if st.button("🚀 Iniciar Extração"):
             if not uploaded_zip:
                 st.error("Selecione um arquivo primeiro.")
@@ -122,6 +161,7 @@ if check_password():
                 st.error("Para classificar, adicione pelo menos um CNPJ no topo.")
             else:
                 with st.spinner("Processando arquivos e aplicando filtros..."):
+                    medidor = Medidor()
                     # Chamada atualizada com os novos argumentos
                     zip_bytes, logs = processar_extracao_cloud(
                         uploaded_file=uploaded_zip, 
@@ -129,7 +169,12 @@ if check_password():
                         cnpjs_proprios=st.session_state.cnpjs,
                         data_ini=filtros["data_ini"],
                         data_fim=filtros["data_fim"],
-                        cfops_filtro=filtros["cfops"]
+                        cfops_filtro=filtros["cfops"],
+                        cache=obter_cache_parse(),
+                        medidor=medidor,
+                        workers=int(extrator_workers),
+                        tamanho_lote=int(extrator_lote),
+                        dedupe=dedupe_ext
                     )
                     
                     st.success(f"Processamento concluído!")
@@ -143,19 +188,53 @@ if check_password():
                         file_name="XMLs_Organizados.zip",
                         mime="application/zip"
                     )
+                    mostrar_medicoes(medidor, "extrator")
     # --- ABA 2: RESUMO ---
     with tab2:
         st.header("Resumo e Análise de Itens")
         zip_resumo = st.file_uploader("Selecione o arquivo .zip para análise", type=["zip"], key="resumo_uploader")
+
+        with st.expander("⚙️ Desempenho (arquivos grandes)"):
+            col_w1, col_w2 = st.columns(2)
+            with col_w1:
+                resumo_workers = st.number_input("Processos paralelos", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1)
+            with col_w2:
+                resumo_lote = st.number_input("XMLs por lote", min_value=10, max_value=5000, value=200, step=10)
+            # Acima disso, cada índice de chaves já vistas (duplicados) passa para um SQLite em disco
+            resumo_dedupe_mb = st.number_input(
+                "Memória por índice de duplicados (MB)", min_value=16, max_value=4096,
+                value=ORCAMENTO_DEDUPE_PADRAO // (1024 * 1024), step=16, key="resumo_dedupe_mb",
+                help="Arquivos com milhões de itens: passando deste limite, as chaves já vistas vão para o disco."
+            )
+
+        with st.expander("💾 Estado acumulado (pacotes do mês)"):
+            st.caption("Envie o estado baixado numa análise anterior para somar este zip aos pacotes já processados, sem reprocessá-los.")
+            estado_file = st.file_uploader("Estado anterior (.resumo)", type=["resumo"], key="estado_resumo_uploader")
         
         if zip_resumo:
             if not st.session_state.cnpjs:
                 st.warning("⚠️ Adicione CNPJs próprios no topo para identificar emissões Próprias vs Terceiros.")
             
             own_set = set(st.session_state.cnpjs)
+            orcamento_dedupe = int(resumo_dedupe_mb) * 1024 * 1024
+            medidor = Medidor()
+            estado = None
+            if estado_file:
+                try:
+                    estado = EstadoResumo.carregar(estado_file, own_set, orcamento_dedupe=orcamento_dedupe)
+                except ValueError as e:
+                    st.error(f"Estado anterior ignorado: {e}")
+            if estado is None:
+                estado = EstadoResumo(own_set, orcamento_dedupe=orcamento_dedupe)
+
             with zipfile.ZipFile(zip_resumo, 'r') as zf:
-                # Chamada da lógica (agora retorna os totais simplificados e o breakdown detalhado)
-                res = summarize_zipfile_resumo(zf, own_set)
+                # Uma única leitura do zip alimenta totais, detalhe e itens
+                estado.mesclar_zip(
+                    zf, nome=zip_resumo.name, workers=int(resumo_workers), tamanho_lote=int(resumo_lote),
+                    cache=obter_cache_parse(), medidor=medidor
+                )
+                resultado = estado.resultado(medidor)
+                res = resultado.resumo
                 
                 # Desempacotando todos os retornos conforme logic_resumo.py
                 rows, breakdown, total_docs, warns, total_xmls, total_out, total_evt, total_dup, total_inter, min_p, max_p = res
@@ -194,11 +273,11 @@ if check_password():
                 
                 with col_res1:
                     # DETALHE AGREGADO
-                    detalhe_data = build_detail_from_zip_resumo(zf, own_set)
+                    detalhe_data = resultado.detalhe
                     df_det = pd.DataFrame(detalhe_data)
                 
                     # Conversão para Excel
-                    excel_detalhe = to_excel(df_det)
+                    excel_detalhe = to_excel(df_det, medidor)
                 
                     st.download_button(
                         label="📊 Baixar Detalhe (Excel)",
@@ -209,11 +288,11 @@ if check_password():
                 
                 with col_res2:
                     # PLANILHA DE ITENS
-                    itens_data = build_items_from_zip_resumo(zf, own_set)
+                    itens_data = resultado.itens
                     df_itens = pd.DataFrame(itens_data)
                 
                     # Conversão para Excel
-                    excel_itens = to_excel(df_itens)
+                    excel_itens = to_excel(df_itens, medidor)
                 
                     st.download_button(
                         label="📦 Baixar Itens (Excel)",
@@ -221,21 +300,74 @@ if check_password():
                         file_name="itens_extraidos.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
+
+                # --- ESTADO ACUMULADO ---
+                if len(estado.pacotes) > 1:
+                    st.write("**Pacotes acumulados:**")
+                    st.dataframe(pd.DataFrame(estado.pacotes), use_container_width=True, hide_index=True)
+                buf_estado = io.BytesIO()
+                estado.salvar(buf_estado)
+                st.download_button(
+                    label="💾 Baixar Estado Acumulado",
+                    data=buf_estado.getvalue(),
+                    file_name="estado_resumo.resumo",
+                    mime="application/zip"
+                )
+
+                mostrar_medicoes(medidor, "resumo")
     # --- ABA 3: SPED ---
     with tab3:
         st.header("Análise de SPED Fiscal")
         sped_file = st.file_uploader("Selecione o arquivo SPED (.txt, .zip, .docx)", type=["txt", "zip", "docx"])
+        formatos_sped = {
+            "Excel (.xlsx, abas divididas a cada 1.048.575 linhas)": "xlsx",
+            "CSV compactado (.csv.gz em ZIP)": "csv.gz",
+            "Parquet (.parquet em ZIP)": "parquet",
+        }
+        formato_sped = formatos_sped[st.selectbox("Formato de saída", list(formatos_sped), key="sped_formato")]
+        with st.expander("⚙️ Desempenho (ZIP com vários arquivos)"):
+            sped_workers = st.number_input("Processos paralelos", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1, key="sped_workers")
+            sped_particionado = st.checkbox(
+                "Gravar em partes no disco (arquivos muito grandes)", key="sped_particionado",
+                help="Os lotes lidos vão para arquivos temporários e a tabela C100/C170 é exportada lote a lote, sem ficar inteira na memória."
+            )
         if sped_file:
             with st.spinner("Lendo SPED..."):
-                df_0190, df_0200, df_c100 = parse_sped_from_any(sped_file.read(), sped_file.name)
-                st.write(f"**Registros C100/C170 encontrados:** {len(df_c100)}")
-                st.dataframe(df_c100.head(50), use_container_width=True)
-                output_sped = io.BytesIO()
-                with pd.ExcelWriter(output_sped, engine='xlsxwriter') as writer:
-                    if not df_0190.empty: df_0190.to_excel(writer, sheet_name='Unidades_0190', index=False)
-                    if not df_0200.empty: df_0200.to_excel(writer, sheet_name='Produtos_0200', index=False)
-                    if not df_c100.empty: df_c100.to_excel(writer, sheet_name='Itens_C100_C170', index=False)
-                st.download_button("📥 Baixar SPED Convertido (Excel)", output_sped.getvalue(), "sped_analise.xlsx")
+                medidor = Medidor()
+                # Gravado em disco, em lotes; só o arquivo pronto vai para o download
+                nome_saida = "sped_analise" + FORMATOS_EXPORTACAO[formato_sped]
+                try:
+                    with tempfile.TemporaryDirectory() as tmp_sped:
+                        caminho_saida = os.path.join(tmp_sped, nome_saida)
+                        if sped_particionado:
+                            particoes = gravar_sped_particionado(sped_file.read(), sped_file.name, os.path.join(tmp_sped, "partes"),
+                                                                 medidor=medidor, tipado=True, workers=int(sped_workers))
+                            df_0190, df_0200, lotes_c100 = tabelas_particionadas(particoes, medidor)
+                            primeiro = next(lotes_c100, None)
+                            if primeiro is not None:
+                                st.dataframe(primeiro.head(50), use_container_width=True)
+                            n_itens = [0]
+
+                            def _contar_itens(lotes):
+                                for df in lotes:
+                                    n_itens[0] += len(df)
+                                    yield df
+
+                            itens = _contar_itens([] if primeiro is None else itertools.chain([primeiro], lotes_c100))
+                            exportar_sped((df_0190, df_0200, itens), caminho_saida, formato_sped, medidor=medidor)
+                            st.write(f"**Registros C100/C170 encontrados:** {n_itens[0]}")
+                        else:
+                            df_0190, df_0200, df_c100 = parse_sped_from_any(sped_file.read(), sped_file.name, medidor=medidor, tipado=True,
+                                                                            workers=int(sped_workers))
+                            st.write(f"**Registros C100/C170 encontrados:** {len(df_c100)}")
+                            st.dataframe(df_c100.head(50), use_container_width=True)
+                            exportar_sped((df_0190, df_0200, df_c100), caminho_saida, formato_sped, medidor=medidor)
+                        with open(caminho_saida, "rb") as f:
+                            saida_sped = f.read()
+                    st.download_button("📥 Baixar SPED Convertido", saida_sped, nome_saida)
+                except ImportError as e:
+                    st.error(str(e))
+                mostrar_medicoes(medidor, "sped")
 
 # --- ABA 4: SEPARAR NFSE ---
     with tab4:
@@ -245,6 +377,7 @@ if check_password():
     
         if st.button("✂️ Desmembrar Notas"):
             if nfse_file:
+                medidor = Medidor()
                 todas_partes = []
                 file_content = nfse_file.read()
             
@@ -259,7 +392,7 @@ if check_password():
                                 content = f.read()
                                 if filename.lower().endswith(".xml"):
                                     # Tenta desmembrar; se tiver só uma ou não for lote, traz a original
-                                    partes = split_nfse_abrasf(content, filename_original=filename)
+                                    partes = split_nfse_abrasf(content, filename_original=filename, medidor=medidor)
                                     todas_partes.extend(partes)
                                 else:
                                     # Se for PDF ou outro formato, mantém no ZIP final
@@ -267,7 +400,7 @@ if check_password():
             
                 # CASO 2: O usuário subiu um XML único
                 else:
-                    partes = split_nfse_abrasf(file_content, filename_original=nfse_file.name)
+                    partes = split_nfse_abrasf(file_content, filename_original=nfse_file.name, medidor=medidor)
                     # Se partes retornar vazio ou a própria nota, garantimos que ela vá para o ZIP
                     todas_partes.extend(partes if partes else [(nfse_file.name, file_content)])
 
@@ -275,9 +408,10 @@ if check_password():
                     st.success(f"Processamento concluído. {len(todas_partes)} arquivos gerados/mantidos.")
                     st.download_button(
                         "📥 Baixar Arquivos (ZIP)", 
-                        make_zip_bytes(todas_partes), 
+                        make_zip_bytes(todas_partes, medidor), 
                         "nfse_processadas.zip"
                     )
+                    mostrar_medicoes(medidor, "nfse_split")
 
     # --- ABA 5: CONVERSOR (Versão com suporte a ZIP) ---
     with tab5:
@@ -317,9 +451,11 @@ if check_password():
                         st.error("Nenhum arquivo TXT ou CSV encontrado para converter.")
                     else:
                         with st.spinner(f"Convertendo {len(files_to_process)} arquivo(s)..."):
+                            medidor = Medidor()
                             mensagens = []
                             for f_path in files_to_process:
-                                res_msg = converter_txt_para_xml_lote(f_path, out_dir, path_ref_custom=ref_path)
+                                with medidor.etapa("conversor.arquivo"):
+                                    res_msg = converter_txt_para_xml_lote(f_path, out_dir, path_ref_custom=ref_path, medidor=medidor)
                                 mensagens.append(f"{os.path.basename(f_path)}: {res_msg}")
                         
                             st.success("Processamento concluído!")
@@ -333,5 +469,6 @@ if check_password():
                                     for f in files: zf.write(os.path.join(root, f), arcname=f)
                         
                             st.download_button("📥 Baixar XMLs Gerados", zip_conv.getvalue(), "conversao_nfse.zip")
+                            mostrar_medicoes(medidor, "conversor")
             else:
                 st.error("É necessário subir ambos os arquivos (Referência e Dados).")
\ No newline at end of file
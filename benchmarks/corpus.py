@@ -0,0 +1,298 @@
+"""
+Gerador de corpus fiscal sintético (reprodutível pela semente) para os benchmarks.
+
+Tipos gerados: NF-e 55/65 com N itens, CT-e (toma3/toma4), NFS-e ABRASF e
+Prefeitura (SP), eventos, inutilizações, zip/7z aninhados e EFD ICMS/IPI TXT.
+"""
+import io
+import random
+import zipfile
+from dataclasses import dataclass, field
+
+import py7zr
+
+from core.chave_acesso import dv_chave_acesso
+
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+NS_CTE = "http://www.portalfiscal.inf.br/cte"
+NS_ABRASF = "http://www.abrasf.org.br/nfse.xsd"
+NS_PREFEITURA_SP = "http://www.prefeitura.sp.gov.br/nfe"
+
+# CNPJs usados como "próprios" nos cenários
+CNPJS_PROPRIOS = ("12345678000195", "98765432000198")
+
+_CFOPS = ("5102", "5405", "6102", "6108", "1102", "2102", "5929")
+_UNIDADES = ("UN", "KG", "CX", "LT", "PC")
+
+
+@dataclass
+class ConfigCorpus:
+    semente: int = 42
+    nfe: int = 2000
+    nfce: int = 500
+    itens_por_nota: int = 5
+    cte: int = 300
+    nfse_abrasf: int = 200
+    nfse_prefeitura: int = 200
+    eventos: int = 200
+    inutilizacoes: int = 20
+    duplicados: int = 50
+    # Quantos documentos vão para dentro de compactados aninhados
+    aninhados_zip: int = 200
+    aninhados_7z: int = 200
+    # EFD ICMS/IPI
+    efd_notas: int = 5000
+    efd_itens_por_nota: int = 5
+
+
+@dataclass
+class Corpus:
+    zip_bytes: bytes
+    documentos: int
+    bytes_xml: int
+    por_tipo: dict = field(default_factory=dict)
+
+
+def _cnpj(rng: random.Random) -> str:
+    return "".join(rng.choice("0123456789") for _ in range(14))
+
+
+def chave_acesso(rng: random.Random, cnpj_emit: str, modelo: str, aamm: str = "2401") -> str:
+    n = rng.randrange(1, 10**9)
+    c43 = f"35{aamm}{cnpj_emit}{modelo}001{n:09d}1{rng.randrange(10**8):08d}"
+    return c43 + dv_chave_acesso(c43)
+
+
+def _data(rng: random.Random) -> str:
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00-03:00"
+
+
+def _emit_dest(rng: random.Random):
+    """Metade próprios (P), parte terceiros (T), parte sem relação."""
+    outro = _cnpj(rng)
+    r = rng.random()
+    if r < 0.45:
+        return rng.choice(CNPJS_PROPRIOS), outro
+    if r < 0.9:
+        return outro, rng.choice(CNPJS_PROPRIOS)
+    return outro, _cnpj(rng)
+
+
+def nfe_xml(rng: random.Random, *, modelo: str = "55", itens: int = 5) -> tuple[str, bytes]:
+    emit, dest = _emit_dest(rng)
+    chave = chave_acesso(rng, emit, modelo)
+    dets = "".join(
+        f'<det nItem="{i}"><prod><cProd>P{rng.randrange(10**5)}</cProd><cEAN>SEM GTIN</cEAN>'
+        f"<xProd>PRODUTO SINTETICO {i}</xProd><NCM>{rng.randrange(10**7, 10**8)}</NCM>"
+        f"<CFOP>{rng.choice(_CFOPS)}</CFOP><uCom>{rng.choice(_UNIDADES)}</uCom>"
+        f"<qCom>{rng.randint(1, 99)}.0000</qCom><vUnCom>{rng.uniform(1, 500):.2f}</vUnCom>"
+        f"<vProd>{rng.uniform(1, 5000):.2f}</vProd><rastro><nLote>L{rng.randrange(10**4)}</nLote></rastro></prod>"
+        f"<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vBC>100.00</vBC><pICMS>18.00</pICMS>"
+        f"<vICMS>18.00</vICMS></ICMS00></ICMS></imposto></det>"
+        for i in range(1, itens + 1)
+    )
+    xml = (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NS_NFE}" versao="4.00">'
+        f'<NFe><infNFe Id="NFe{chave}" versao="4.00"><ide><cUF>35</cUF><natOp>VENDA</natOp>'
+        f"<mod>{modelo}</mod><serie>1</serie><nNF>{chave[25:34]}</nNF><dhEmi>{_data(rng)}</dhEmi></ide>"
+        f"<emit><CNPJ>{emit}</CNPJ><xNome>EMITENTE {emit}</xNome></emit>"
+        f"<dest><CNPJ>{dest}</CNPJ><xNome>DESTINATARIO {dest}</xNome></dest>{dets}"
+        f"<total><ICMSTot><vNF>{rng.uniform(10, 10**5):.2f}</vNF></ICMSTot></total>"
+        f"<transp><modFrete>9</modFrete></transp></infNFe></NFe>"
+        f"<protNFe><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>"
+    )
+    return chave, xml.encode("utf-8")
+
+
+def cte_xml(rng: random.Random, *, toma4: bool = False) -> tuple[str, bytes]:
+    emit, dest = _emit_dest(rng)
+    chave = chave_acesso(rng, emit, "57")
+    if toma4:
+        toma = f"<toma4><toma>4</toma><CNPJ>{_cnpj(rng)}</CNPJ></toma4>"
+    else:
+        toma = f"<toma3><toma>{rng.choice((0, 3))}</toma></toma3>"
+    xml = (
+        f'<?xml version="1.0" encoding="UTF-8"?><cteProc xmlns="{NS_CTE}" versao="4.00"><CTe>'
+        f'<infCte Id="CTe{chave}" versao="4.00"><ide><cUF>35</cUF><CFOP>{rng.choice(("5353", "6353"))}</CFOP>'
+        f"<mod>57</mod><dhEmi>{_data(rng)}</dhEmi>{toma}</ide>"
+        f"<emit><CNPJ>{emit}</CNPJ></emit><rem><CNPJ>{_cnpj(rng)}</CNPJ></rem>"
+        f"<dest><CNPJ>{dest}</CNPJ></dest><vPrest><vTPrest>{rng.uniform(50, 5000):.2f}</vTPrest></vPrest>"
+        f"</infCte></CTe><protCTe><infProt><chCTe>{chave}</chCTe></infProt></protCTe></cteProc>"
+    )
+    return chave, xml.encode("utf-8")
+
+
+def nfse_abrasf_xml(rng: random.Random, numero: int) -> bytes:
+    prest, tom = _emit_dest(rng)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><CompNfse xmlns="{NS_ABRASF}"><Nfse><InfNfse>'
+        f"<Numero>{numero}</Numero><CodigoVerificacao>V{rng.randrange(10**6)}</CodigoVerificacao>"
+        f"<DataEmissao>{_data(rng)[:19]}</DataEmissao><Competencia>2024-01-01</Competencia>"
+        f"<Servico><Valores><ValorServicos>{rng.uniform(100, 10**4):.2f}</ValorServicos>"
+        f"<IssRetido>{rng.choice((1, 2))}</IssRetido><Aliquota>0.05</Aliquota></Valores>"
+        f"<ItemListaServico>01.07</ItemListaServico><Discriminacao>SERVICO SINTETICO</Discriminacao></Servico>"
+        f"<PrestadorServico><IdentificacaoPrestador><Cnpj>{prest}</Cnpj>"
+        f"<InscricaoMunicipal>{rng.randrange(10**6)}</InscricaoMunicipal></IdentificacaoPrestador></PrestadorServico>"
+        f"<TomadorServico><IdentificacaoTomador><CpfCnpj><Cnpj>{tom}</Cnpj></CpfCnpj></IdentificacaoTomador>"
+        f"</TomadorServico></InfNfse></Nfse></CompNfse>"
+    ).encode("utf-8")
+
+
+def nfse_prefeitura_xml(rng: random.Random, numero: int) -> bytes:
+    prest, tom = _emit_dest(rng)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><NFe xmlns="{NS_PREFEITURA_SP}"><ChaveNFe>'
+        f"<InscricaoPrestador>{rng.randrange(10**7)}</InscricaoPrestador><NumeroNFe>{numero}</NumeroNFe>"
+        f"<CodigoVerificacao>V{rng.randrange(10**6)}</CodigoVerificacao></ChaveNFe>"
+        f"<DataEmissaoNFe>{_data(rng)[:19]}</DataEmissaoNFe>"
+        f"<CPFCNPJPrestador><CNPJ>{prest}</CNPJ></CPFCNPJPrestador>"
+        f"<CPFCNPJTomador><CNPJ>{tom}</CNPJ></CPFCNPJTomador>"
+        f"<ValorServicos>{rng.uniform(100, 10**4):.2f}</ValorServicos><CodigoServico>02660</CodigoServico>"
+        f"<ISSRetido>false</ISSRetido><Discriminacao>SERVICO SINTETICO</Discriminacao></NFe>"
+    ).encode("utf-8")
+
+
+def evento_xml(rng: random.Random, chave: str) -> bytes:
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><procEventoNFe xmlns="{NS_NFE}" versao="1.00">'
+        f'<evento><infEvento Id="ID110111{chave}01"><chNFe>{chave}</chNFe><tpEvento>110111</tpEvento>'
+        f"<nSeqEvento>1</nSeqEvento></infEvento></evento></procEventoNFe>"
+    ).encode("utf-8")
+
+
+def inutilizacao_xml(rng: random.Random) -> bytes:
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><procInutNFe xmlns="{NS_NFE}" versao="4.00"><inutNFe>'
+        f"<infInut><ano>24</ano><CNPJ>{rng.choice(CNPJS_PROPRIOS)}</CNPJ><mod>55</mod><serie>1</serie>"
+        f"<nNFIni>{rng.randrange(10**5)}</nNFIni></infInut></inutNFe></procInutNFe>"
+    ).encode("utf-8")
+
+
+def gerar_documentos(config: ConfigCorpus):
+    """Lista de (nome, bytes, tipo) na ordem em que vão para o zip."""
+    rng = random.Random(config.semente)
+    docs = []
+    chaves = []
+    for i in range(config.nfe):
+        chave, xml = nfe_xml(rng, modelo="55", itens=config.itens_por_nota)
+        chaves.append(chave)
+        docs.append((f"nfe/{chave}-procNFe.xml", xml, "nfe55"))
+    for i in range(config.nfce):
+        chave, xml = nfe_xml(rng, modelo="65", itens=max(1, config.itens_por_nota // 2))
+        chaves.append(chave)
+        docs.append((f"nfce/{chave}-procNFe.xml", xml, "nfe65"))
+    for i in range(config.cte):
+        chave, xml = cte_xml(rng, toma4=(i % 3 == 0))
+        chaves.append(chave)
+        docs.append((f"cte/{chave}-procCTe.xml", xml, "cte"))
+    for i in range(config.nfse_abrasf):
+        docs.append((f"nfse/abrasf_{i}.xml", nfse_abrasf_xml(rng, i + 1), "nfse_abrasf"))
+    for i in range(config.nfse_prefeitura):
+        docs.append((f"nfse/sp_{i}.xml", nfse_prefeitura_xml(rng, i + 1), "nfse_prefeitura"))
+    for i in range(config.eventos):
+        docs.append((f"eventos/ev_{i}.xml", evento_xml(rng, rng.choice(chaves) if chaves else "0" * 44), "evento"))
+    for i in range(config.inutilizacoes):
+        docs.append((f"eventos/inut_{i}.xml", inutilizacao_xml(rng), "inutilizacao"))
+    originais = [d for d in docs if d[2] in ("nfe55", "nfe65", "cte")]
+    for i in range(min(config.duplicados, len(originais))):
+        nome, xml, tipo = rng.choice(originais)
+        docs.append((f"duplicados/{i}_{nome.rsplit('/', 1)[-1]}", xml, tipo))
+    rng.shuffle(docs)
+    return docs
+
+
+def _zip_bytes(docs) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for nome, xml, _tipo in docs:
+            z.writestr(nome, xml)
+    return buf.getvalue()
+
+
+def _7z_bytes(docs) -> bytes:
+    buf = io.BytesIO()
+    with py7zr.SevenZipFile(buf, mode="w") as z:
+        for nome, xml, _tipo in docs:
+            z.writestr(xml, nome)
+    return buf.getvalue()
+
+
+def gerar_corpus_zip(config: ConfigCorpus | None = None) -> Corpus:
+    """
+    Zip de entrada das Abas 1 e 2: documentos soltos + um .zip e um .7z
+    aninhados (o .7z dentro de outro zip, para testar dois níveis).
+    """
+    config = config or ConfigCorpus()
+    docs = gerar_documentos(config)
+    n_zip = min(config.aninhados_zip, len(docs))
+    n_7z = min(config.aninhados_7z, len(docs) - n_zip)
+    no_zip = docs[:n_zip]
+    no_7z = docs[n_zip:n_zip + n_7z]
+    soltos = docs[n_zip + n_7z:]
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for nome, xml, _tipo in soltos:
+            z.writestr(nome, xml)
+        if no_zip:
+            z.writestr("aninhados/lote.zip", _zip_bytes(no_zip))
+        if no_7z:
+            z.writestr("aninhados/nivel2.zip", _zip_bytes([("lote.7z", _7z_bytes(no_7z), "7z")]))
+
+    por_tipo = {}
+    for _nome, _xml, tipo in docs:
+        por_tipo[tipo] = por_tipo.get(tipo, 0) + 1
+    return Corpus(
+        zip_bytes=buf.getvalue(),
+        documentos=len(docs),
+        bytes_xml=sum(len(x) for _n, x, _t in docs),
+        por_tipo=por_tipo,
+    )
+
+
+def gerar_efd_txt(config: ConfigCorpus | None = None) -> bytes:
+    """EFD ICMS/IPI (latin-1) com 0190/0200 e blocos C100/C170/C190."""
+    config = config or ConfigCorpus()
+    rng = random.Random(config.semente + 1)
+    linhas = ["|0000|017|0|01012024|31012024|EMPRESA SINTETICA|12345678000195||SP|123456|3550308|||A|1|"]
+    for u in _UNIDADES:
+        linhas.append(f"|0190|{u}|UNIDADE {u}|")
+    itens = [f"P{i:05d}" for i in range(max(1, config.efd_notas // 10))]
+    for cod in itens:
+        linhas.append(
+            f"|0200|{cod}|PRODUTO {cod} ÇÃO||||00|{rng.randrange(10**7, 10**8)}||||18,00|"
+        )
+    for n in range(config.efd_notas):
+        chave = chave_acesso(rng, rng.choice(CNPJS_PROPRIOS), "55")
+        dia = rng.randint(1, 28)
+        linhas.append(
+            f"|C100|{rng.choice((0, 1))}|0|PART{rng.randrange(500)}|55|00|1|{n + 1}|{chave}"
+            f"|{dia:02d}012024|{dia:02d}012024|{rng.uniform(10, 10**5):.2f}".replace(".", ",")
+            + "|0|0,00|0,00|0,00|0,00|0|0,00|0,00|0,00|0,00|0,00|0,00|0,00|0,00|0,00|0,00|"
+        )
+        for i in range(1, config.efd_itens_por_nota + 1):
+            cfop = rng.choice(_CFOPS)
+            linhas.append(
+                f"|C170|{i}|{rng.choice(itens)}||{rng.randint(1, 99)},00000|{rng.choice(_UNIDADES)}"
+                f"|{rng.uniform(1, 5000):.2f}|0,00|0|000|{cfop}|".replace(".", ",")
+                + "|100,00|18,00|18,00|0,00|0,00|0,00|0|||0,00|0,00|0,00|"
+            )
+        linhas.append(
+            f"|C190|000|{rng.choice(_CFOPS)}|18,00|{rng.uniform(10, 10**5):.2f}|0,00|0,00|0,00|0,00|0,00|0,00||".replace(".", ",", 1)
+        )
+    linhas.append(f"|9999|{len(linhas) + 1}|")
+    return ("\r\n".join(linhas) + "\r\n").encode("latin-1")
+
+
+def gerar_lote_abrasf(n: int, semente: int = 42) -> bytes:
+    """Um único XML ABRASF com n notas (entrada do separador de NFS-e)."""
+    rng = random.Random(semente + 2)
+    notas = []
+    for i in range(n):
+        xml = nfse_abrasf_xml(rng, i + 1).decode("utf-8")
+        corpo = xml.split("<Nfse>", 1)[1].rsplit("</Nfse>", 1)[0]
+        notas.append(f"<CompNfse><Nfse>{corpo}</Nfse></CompNfse>")
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><ConsultarLoteRpsResposta xmlns="{NS_ABRASF}">'
+        f"<ListaNfse>{''.join(notas)}</ListaNfse></ConsultarLoteRpsResposta>"
+    ).encode("utf-8")
@@ -0,0 +1,405 @@
+"""
+Benchmarks dos pontos de entrada públicos.
+
+    python -m benchmarks.run                         # corpus padrão, relatório em benchmarks/resultados/
+    python -m benchmarks.run --escala 5 --saida r.json
+    python -m benchmarks.run --cenarios resumo_analisar,sped_txt
+    python -m benchmarks.run --comparar antes.json depois.json
+
+Cada cenário roda em um subprocesso próprio (pico de RSS isolado) sobre o
+mesmo corpus sintético, gerado uma vez por execução a partir da semente.
+"""
+import argparse
+import datetime
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import asdict, fields
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.corpus import (
+    CNPJS_PROPRIOS,
+    ConfigCorpus,
+    gerar_corpus_zip,
+    gerar_documentos,
+    gerar_efd_txt,
+    gerar_lote_abrasf,
+)
+
+_ARQ_ZIP = "corpus.zip"
+_ARQ_EFD = "efd.txt"
+_ARQ_LOTE = "lote_abrasf.xml"
+_ARQ_META = "meta.json"
+
+
+class _Upload:
+    """Imita o UploadedFile do Streamlit (só getbuffer é usado)."""
+
+    def __init__(self, dados: bytes):
+        self._dados = dados
+
+    def getbuffer(self):
+        return memoryview(self._dados)
+
+
+# --- Cenários (executados no subprocesso) ---
+# Cada um recebe o diretório do corpus e retorna (unidades processadas, bytes de entrada
+# descompactados).
+
+def _resumo(diretorio, meta, **kw):
+    from logic_resumo import analisar_zip_resumo
+
+    dados = _ler(diretorio, _ARQ_ZIP)
+    with zipfile.ZipFile(io.BytesIO(dados)) as zf:
+        analisar_zip_resumo(zf, set(CNPJS_PROPRIOS), **kw)
+    return meta["documentos"], meta["bytes_xml"]
+
+
+def _cenario_resumo_analisar(diretorio, meta):
+    return _resumo(diretorio, meta)
+
+
+def _cenario_resumo_paralelo(diretorio, meta):
+    return _resumo(diretorio, meta, workers=min(4, os.cpu_count() or 1))
+
+
+def _cenario_resumo_summarize(diretorio, meta):
+    return _resumo(diretorio, meta, com_detalhe=False, com_itens=False)
+
+
+def _cenario_resumo_detalhe(diretorio, meta):
+    return _resumo(diretorio, meta, com_itens=False)
+
+
+def _cenario_resumo_itens(diretorio, meta):
+    return _resumo(diretorio, meta, com_detalhe=False)
+
+
+def _extrator(diretorio, meta, modo, **kw):
+    from logic_extrator import processar_extracao_cloud
+
+    dados = _ler(diretorio, _ARQ_ZIP)
+    processar_extracao_cloud(_Upload(dados), modo, list(CNPJS_PROPRIOS), **kw)
+    return meta["documentos"], meta["bytes_xml"]
+
+
+def _cenario_extrator_classificacao(diretorio, meta):
+    return _extrator(diretorio, meta, "Separar pelo Emitente (Classificação)")
+
+
+def _cenario_extrator_paralelo(diretorio, meta):
+    return _extrator(diretorio, meta, "Separar pelo Emitente (Classificação)", workers=min(4, os.cpu_count() or 1))
+
+
+def _cenario_extrator_juntar(diretorio, meta):
+    return _extrator(diretorio, meta, "Juntar Tudo")
+
+
+def _cenario_nfse_detect(diretorio, meta):
+    from parsers.nfse_abrasf import MEMORIA_ABRASF
+    from parsers.nfse_prefeitura import MEMORIA_PREFEITURA
+    from parsers.router import detect_and_parse_nfse
+
+    config = ConfigCorpus(**meta["config"])
+    docs = [x for _n, x, t in gerar_documentos(config) if t.startswith("nfse")]
+    textos = [x.decode("utf-8") for x in docs]
+    inicio = time.perf_counter()
+    for t in textos:
+        detect_and_parse_nfse(t)
+    meta["_inicio"] = inicio
+    meta["_extra"] = {
+        "memoria_abrasf": MEMORIA_ABRASF.estatisticas(),
+        "memoria_prefeitura": MEMORIA_PREFEITURA.estatisticas(),
+    }
+    return len(textos), sum(len(x) for x in docs)
+
+
+def _cenario_nfse_split(diretorio, meta):
+    from logic_nfse_split import split_nfse_abrasf
+
+    dados = _ler(diretorio, _ARQ_LOTE)
+    partes = split_nfse_abrasf(dados, "lote.xml")
+    return len(partes), len(dados)
+
+
+def _cenario_sped_txt(diretorio, meta):
+    import logic_sped
+
+    dados = _ler(diretorio, _ARQ_EFD)
+    logic_sped.parse_sped_from_any(dados, "efd.txt")
+    return dados.count(b"\n"), len(dados)
+
+
+def _sped_zip(diretorio, meta, workers=1):
+    import logic_sped
+
+    efd = _ler(diretorio, _ARQ_EFD)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for i in range(4):
+            z.writestr(f"efd_{i}.txt", efd)
+    dados = buf.getvalue()
+    meta["_inicio"] = time.perf_counter()
+    logic_sped.parse_sped_from_any(dados, "efd.zip", workers=workers)
+    return efd.count(b"\n") * 4, len(efd) * 4
+
+
+def _cenario_sped_zip(diretorio, meta):
+    return _sped_zip(diretorio, meta)
+
+
+def _cenario_sped_zip_paralelo(diretorio, meta):
+    return _sped_zip(diretorio, meta, workers=min(4, os.cpu_count() or 1))
+
+
+# Módulos importados antes do cronômetro (o import do pandas não entra na medida)
+_MODULOS = {
+    "resumo": ("logic_resumo",),
+    "extrator": ("logic_extrator",),
+    "nfse": ("parsers.router", "logic_nfse_split"),
+    "sped": ("logic_sped",),
+}
+
+CENARIOS = {
+    "resumo_analisar": _cenario_resumo_analisar,
+    "resumo_paralelo": _cenario_resumo_paralelo,
+    "resumo_summarize": _cenario_resumo_summarize,
+    "resumo_detalhe": _cenario_resumo_detalhe,
+    "resumo_itens": _cenario_resumo_itens,
+    "extrator_classificacao": _cenario_extrator_classificacao,
+    "extrator_paralelo": _cenario_extrator_paralelo,
+    "extrator_juntar": _cenario_extrator_juntar,
+    "nfse_detect": _cenario_nfse_detect,
+    "nfse_split": _cenario_nfse_split,
+    "sped_txt": _cenario_sped_txt,
+    "sped_zip": _cenario_sped_zip,
+    "sped_zip_paralelo": _cenario_sped_zip_paralelo,
+}
+
+
+def _ler(diretorio, nome) -> bytes:
+    with open(os.path.join(diretorio, nome), "rb") as f:
+        return f.read()
+
+
+def _rss_pico_mb(quem) -> float | None:
+    if resource is None:
+        return None
+    kb = resource.getrusage(quem).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    if sys.platform == "darwin":
+        kb /= 1024
+    return round(kb / 1024, 1)
+
+
+def _executar_cenario(nome: str, diretorio: str) -> dict:
+    """Roda um cenário neste processo e devolve as medidas."""
+    with open(os.path.join(diretorio, _ARQ_META), encoding="utf-8") as f:
+        meta = json.load(f)
+    for modulo in _MODULOS.get(nome.split("_", 1)[0], ()):
+        importlib.import_module(modulo)
+    rss_inicial = _rss_pico_mb(resource.RUSAGE_SELF) if resource else None
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    unidades, bytes_entrada = CENARIOS[nome](diretorio, meta)
+    t1 = time.perf_counter()
+    cpu1 = time.process_time()
+
+    # Cenários que preparam dados dentro da função marcam onde a medida começa
+    if "_inicio" in meta:
+        t0 = meta["_inicio"]
+    segundos = max(t1 - t0, 1e-9)
+    medidas = {
+        "segundos": round(segundos, 4),
+        "cpu_segundos": round(cpu1 - cpu0, 4),
+        "unidades": unidades,
+        "bytes_entrada": bytes_entrada,
+        "unidades_por_s": round(unidades / segundos, 1),
+        "mb_por_s": round(bytes_entrada / 1048576 / segundos, 2),
+        "rss_inicial_mb": rss_inicial,
+        "rss_pico_mb": _rss_pico_mb(resource.RUSAGE_SELF) if resource else None,
+        "rss_pico_filhos_mb": _rss_pico_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+    # Estatísticas próprias do cenário (ex.: taxa de acerto de caches)
+    if "_extra" in meta:
+        medidas["extra"] = meta["_extra"]
+    return medidas
+
+
+def preparar_corpus(diretorio: str, config: ConfigCorpus) -> dict:
+    corpus = gerar_corpus_zip(config)
+    efd = gerar_efd_txt(config)
+    lote = gerar_lote_abrasf(max(1, config.nfse_abrasf), config.semente)
+    for nome, dados in ((_ARQ_ZIP, corpus.zip_bytes), (_ARQ_EFD, efd), (_ARQ_LOTE, lote)):
+        with open(os.path.join(diretorio, nome), "wb") as f:
+            f.write(dados)
+    meta = {
+        "config": asdict(config),
+        "documentos": corpus.documentos,
+        "bytes_xml": corpus.bytes_xml,
+        "bytes_zip": len(corpus.zip_bytes),
+        "bytes_efd": len(efd),
+        "por_tipo": corpus.por_tipo,
+    }
+    with open(os.path.join(diretorio, _ARQ_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def executar(cenarios, config: ConfigCorpus, repeticoes: int = 3, xml_backend: str | None = None) -> dict:
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    resultados = {}
+    env = dict(os.environ)
+    if xml_backend:
+        # Lido por core.xml_backend na importação, em cada subprocesso
+        env["CENTRAL_XML_BACKEND"] = xml_backend
+    with tempfile.TemporaryDirectory(prefix="bench_central_xml_") as diretorio:
+        meta = preparar_corpus(diretorio, config)
+        for nome in cenarios:
+            medidas = []
+            erro = None
+            for _ in range(max(1, repeticoes)):
+                proc = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run", "--_executar", nome, "--_dir", diretorio],
+                    capture_output=True, text=True, cwd=raiz, env=env,
+                )
+                if proc.returncode != 0:
+                    erro = proc.stderr.strip().splitlines()[-1:] or ["erro"]
+                    break
+                medidas.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            if erro:
+                resultados[nome] = {"erro": erro[0]}
+                print(f"{nome:<26} ERRO: {erro[0]}", file=sys.stderr)
+                continue
+            # Mediana do tempo; a repetição mediana fornece as demais medidas
+            medidas.sort(key=lambda m: m["segundos"])
+            res = dict(medidas[len(medidas) // 2])
+            res["segundos_todas"] = [m["segundos"] for m in medidas]
+            res["segundos_desvio"] = round(statistics.pstdev(res["segundos_todas"]), 4)
+            res["rss_pico_mb"] = max((m["rss_pico_mb"] or 0) for m in medidas) or None
+            resultados[nome] = res
+            print(
+                f"{nome:<26} {res['segundos']:>8.3f}s {res['unidades_por_s']:>12.1f} un/s "
+                f"{res['mb_por_s']:>8.2f} MB/s  pico {res['rss_pico_mb']} MB",
+                file=sys.stderr,
+            )
+
+    return {
+        "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeticoes": repeticoes,
+        "xml_backend": xml_backend or "padrão",
+        "corpus": meta,
+        "resultados": resultados,
+    }
+
+
+def comparar(antes: dict, depois: dict) -> list[str]:
+    """Linhas de texto com a variação de tempo e de pico de memória por cenário."""
+    linhas = [
+        f"{'cenário':<26} {'antes (s)':>10} {'depois (s)':>10} {'ganho':>8} {'RSS antes':>10} {'RSS depois':>10}"
+    ]
+    ra, rd = antes.get("resultados", {}), depois.get("resultados", {})
+    for nome in [n for n in ra if n in rd]:
+        a, d = ra[nome], rd[nome]
+        if "erro" in a or "erro" in d:
+            linhas.append(f"{nome:<26} {'erro':>10}")
+            continue
+        ganho = a["segundos"] / d["segundos"] if d["segundos"] else float("inf")
+        linhas.append(
+            f"{nome:<26} {a['segundos']:>10.3f} {d['segundos']:>10.3f} {ganho:>7.2f}x "
+            f"{a.get('rss_pico_mb') or '-':>10} {d.get('rss_pico_mb') or '-':>10}"
+        )
+    if antes.get("corpus", {}).get("config") != depois.get("corpus", {}).get("config"):
+        linhas.append("aviso: os relatórios usaram corpus com configurações diferentes")
+    return linhas
+
+
+def _config_escalada(escala: float, semente: int) -> ConfigCorpus:
+    base = ConfigCorpus(semente=semente)
+    valores = {}
+    for f in fields(ConfigCorpus):
+        v = getattr(base, f.name)
+        if f.name in ("semente", "itens_por_nota", "efd_itens_por_nota"):
+            valores[f.name] = v
+        else:
+            valores[f.name] = max(1, int(v * escala))
+    return ConfigCorpus(**valores)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--cenarios", default="", help="lista separada por vírgula (padrão: todos)")
+    p.add_argument("--escala", type=float, default=1.0, help="multiplica a quantidade de documentos do corpus")
+    p.add_argument("--itens", type=int, default=None, help="itens por NF-e")
+    p.add_argument("--semente", type=int, default=42)
+    p.add_argument("--repeticoes", type=int, default=3)
+    p.add_argument("--saida", default=None, help="arquivo JSON do relatório")
+    p.add_argument("--xml-backend", choices=("lxml", "stdlib"), default=None,
+                   help="força o backend XML (padrão: lxml se instalado)")
+    p.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"))
+    p.add_argument("--_executar", help=argparse.SUPPRESS)
+    p.add_argument("--_dir", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args._executar:
+        print(json.dumps(_executar_cenario(args._executar, args._dir)))
+        return 0
+
+    if args.comparar:
+        with open(args.comparar[0], encoding="utf-8") as fa, open(args.comparar[1], encoding="utf-8") as fd:
+            print("\n".join(comparar(json.load(fa), json.load(fd))))
+        return 0
+
+    cenarios = [c.strip() for c in args.cenarios.split(",") if c.strip()] or list(CENARIOS)
+    desconhecidos = [c for c in cenarios if c not in CENARIOS]
+    if desconhecidos:
+        p.error(f"cenário(s) desconhecido(s): {', '.join(desconhecidos)}")
+
+    config = _config_escalada(args.escala, args.semente)
+    if args.itens is not None:
+        config.itens_por_nota = max(1, args.itens)
+
+    relatorio = executar(cenarios, config, args.repeticoes, args.xml_backend)
+
+    saida = args.saida
+    if not saida:
+        pasta = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+        os.makedirs(pasta, exist_ok=True)
+        carimbo = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        saida = os.path.join(pasta, f"bench_{relatorio['commit'] or 'local'}_{carimbo}.json")
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"relatório: {saida}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
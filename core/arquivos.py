@@ -0,0 +1,447 @@
+import io
+import queue
+import shutil
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+import py7zr
+from py7zr.io import Py7zIO, WriterFactory
+
+# Memória máxima (bytes) ocupada por arquivos compactados aninhados abertos
+ORCAMENTO_MEMORIA_PADRAO = 64 * 1024 * 1024
+
+EXTENSOES_COMPACTADAS = (".zip", ".7z")
+
+# Assinaturas (primeiros bytes) dos formatos aceitos
+_ASSINATURAS = ((b"7z\xbc\xaf\x27\x1c", ".7z"), (b"PK", ".zip"))
+
+_BLOCO_COPIA = 1024 * 1024
+
+
+class OrcamentoMemoria:
+    """Contabiliza quantos bytes de compactados aninhados estão em RAM."""
+
+    def __init__(self, limite: int = ORCAMENTO_MEMORIA_PADRAO):
+        self.limite = max(0, int(limite))
+        self.usado = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, n: int) -> bool:
+        with self._lock:
+            if self.usado + n > self.limite:
+                return False
+            self.usado += n
+            return True
+
+    def liberar(self, n: int):
+        with self._lock:
+            self.usado = max(0, self.usado - n)
+
+
+@contextmanager
+def abrir_membro_seekable(abrir, tamanho: int, orcamento: OrcamentoMemoria):
+    """
+    Entrega o conteúdo de um membro como arquivo "seekable" (necessário para
+    abrir um zip/7z aninhado): em memória se couber no orçamento, senão em um
+    arquivo temporário copiado em blocos (o membro nunca fica inteiro na RAM).
+    Membros de 7z (iter_membros) já são seekable e passam sem cópia.
+    """
+    reservado = 0
+    with abrir() as src:
+        if isinstance(src, _Membro7z):
+            yield src.arquivo()
+            return
+        if orcamento.reservar(tamanho):
+            reservado = tamanho
+            try:
+                buf = io.BytesIO(src.read())
+            except BaseException:
+                orcamento.liberar(reservado)
+                raise
+        else:
+            buf = tempfile.TemporaryFile(prefix="aninhado_")
+            try:
+                shutil.copyfileobj(src, buf, _BLOCO_COPIA)
+            except BaseException:
+                buf.close()
+                raise
+            buf.seek(0)
+    try:
+        yield buf
+    finally:
+        buf.close()
+        orcamento.liberar(reservado)
+
+
+class _Cancelado(Exception):
+    pass
+
+
+class _Membro7z(Py7zIO):
+    """
+    Destino de um membro do 7z: em memória enquanto couber no orçamento,
+    transbordando para arquivo temporário quando passa do limite.
+    """
+
+    def __init__(self, nome: str, orcamento: OrcamentoMemoria, parar: threading.Event):
+        self.nome = nome
+        self._orcamento = orcamento
+        self._parar = parar
+        self._buf = io.BytesIO()
+        self._reservado = 0
+        self._em_disco = False
+        self.entregue = False
+
+    def write(self, s) -> int:
+        if self._parar.is_set():
+            raise _Cancelado()
+        if not self._em_disco and not self._orcamento.reservar(len(s)):
+            tmp = tempfile.TemporaryFile(prefix="membro7z_")
+            tmp.write(self._buf.getbuffer())
+            self._buf = tmp
+            self._orcamento.liberar(self._reservado)
+            self._reservado = 0
+            self._em_disco = True
+        elif not self._em_disco:
+            self._reservado += len(s)
+        return self._buf.write(s)
+
+    def read(self, size=None) -> bytes:
+        return self._buf.read(-1 if size is None else size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._buf.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._buf.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        self._buf.flush()
+
+    def size(self) -> int:
+        pos = self._buf.tell()
+        self._buf.seek(0, io.SEEK_END)
+        tamanho = self._buf.tell()
+        self._buf.seek(pos)
+        return tamanho
+
+    def close(self) -> None:
+        # O py7zr fecha o membro antes de conferir o CRC; a entrega ao
+        # consumidor só acontece no próximo create() ou no fim da extração.
+        return None
+
+    def arquivo(self):
+        """Buffer de dados (BytesIO ou arquivo temporário) no início: um io.IOBase
+        de verdade, que o py7zr aceita para abrir um 7z aninhado."""
+        self._buf.seek(0)
+        return self._buf
+
+    def descartar(self):
+        self._buf.close()
+        self._orcamento.liberar(self._reservado)
+        self._reservado = 0
+
+
+def iter_membros_7z(arquivo, nomes, orcamento: OrcamentoMemoria):
+    """
+    Descompacta apenas os membros `nomes` de um SevenZipFile aberto e os
+    entrega um a um, na ordem dos blocos sólidos, sem extrair para pasta.
+    Cada item é um objeto de arquivo (seekable) que é liberado quando o
+    consumidor pede o próximo. No máximo dois membros ficam vivos por vez:
+    o que está com o consumidor e o que está sendo escrito (ou pronto, na
+    fila); o seguinte só é criado depois que o consumidor solta o seu.
+    """
+    fila = queue.Queue(maxsize=1)
+    parar = threading.Event()
+    vagas = threading.Semaphore(2)  # membros vivos
+    fim = object()
+
+    def _soltar(membro):
+        membro.descartar()
+        vagas.release()
+
+    def _entregar(membro):
+        if membro.entregue:
+            return
+        membro.entregue = True
+        membro.seek(0)
+        while not parar.is_set():
+            try:
+                fila.put(membro, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        _soltar(membro)
+
+    class _Fabrica(WriterFactory):
+        def __init__(self):
+            self.atual = None
+
+        def create(self, filename):
+            if self.atual is not None:
+                _entregar(self.atual)
+                self.atual = None
+            # Espera o consumidor soltar um membro antes de criar o próximo
+            while not vagas.acquire(timeout=0.1):
+                if parar.is_set():
+                    raise _Cancelado()
+            self.atual = _Membro7z(filename, orcamento, parar)
+            return self.atual
+
+    def _trabalhar():
+        fabrica = _Fabrica()
+        try:
+            arquivo.extract(targets=list(nomes), factory=fabrica)
+            if fabrica.atual is not None:
+                _entregar(fabrica.atual)
+            resultado = fim
+        except _Cancelado:
+            if fabrica.atual is not None and not fabrica.atual.entregue:
+                _soltar(fabrica.atual)
+            return
+        except Exception as e:
+            if fabrica.atual is not None and not fabrica.atual.entregue:
+                _soltar(fabrica.atual)
+            resultado = e
+        while not parar.is_set():
+            try:
+                fila.put(resultado, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    t = threading.Thread(target=_trabalhar, daemon=True)
+    t.start()
+    try:
+        while True:
+            item = fila.get()
+            if item is fim:
+                return
+            if isinstance(item, Exception):
+                raise item
+            try:
+                yield item.nome, item
+            finally:
+                _soltar(item)
+    finally:
+        parar.set()
+        t.join()
+        # Membro que ficou pronto na fila quando o consumidor parou antes
+        while not fila.empty():
+            item = fila.get_nowait()
+            if isinstance(item, _Membro7z):
+                item.descartar()
+
+
+def ler_adiante(iteravel, limite: int = 64):
+    """
+    Consome `iteravel` numa thread de leitura, até `limite` itens à frente
+    de quem itera: a descompactação (zlib/LZMA soltam o GIL) corre junto com
+    o resto do processamento. Itens e exceções chegam na ordem original.
+    """
+    fila = queue.Queue(maxsize=max(1, limite))
+    parar = threading.Event()
+    fim = object()
+
+    def _por(item) -> bool:
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _trabalhar():
+        it = iter(iteravel)
+        try:
+            for item in it:
+                if not _por((item, None)):
+                    return
+            _por((fim, None))
+        except Exception as e:
+            _por((None, e))
+        finally:
+            fechar = getattr(it, "close", None)
+            if fechar is not None:
+                fechar()
+
+    t = threading.Thread(target=_trabalhar, daemon=True)
+    t.start()
+    try:
+        while True:
+            item, erro = fila.get()
+            if erro is not None:
+                raise erro
+            if item is fim:
+                return
+            yield item
+    finally:
+        parar.set()
+        t.join()
+
+
+def iter_xml_compactado(
+    origem,
+    tipo: str,
+    *,
+    max_depth: int = 3,
+    orcamento: OrcamentoMemoria | None = None,
+    extensoes=(".xml",),
+):
+    """
+    Gera (nome, bytes) dos membros com as extensões pedidas dentro de um
+    zip/7z, descendo em .zip/.7z aninhados até max_depth níveis.
+
+    `origem` é um zipfile.ZipFile / py7zr.SevenZipFile aberto ou um objeto
+    de arquivo seekable; `tipo` é ".zip" ou ".7z". Compactados aninhados
+    ficam em memória só se couberem no orçamento; acima disso vão para
+    arquivo temporário, então o pico de memória não depende do tamanho
+    do compactado.
+    """
+    if max_depth < 0:
+        return
+    orcamento = orcamento or OrcamentoMemoria()
+
+    if tipo == ".zip":
+        if isinstance(origem, zipfile.ZipFile):
+            yield from _iter_zip(origem, max_depth, orcamento, extensoes)
+        else:
+            with zipfile.ZipFile(origem, "r") as zf:
+                yield from _iter_zip(zf, max_depth, orcamento, extensoes)
+    elif tipo == ".7z":
+        if isinstance(origem, py7zr.SevenZipFile):
+            yield from _iter_7z(origem, max_depth, orcamento, extensoes)
+        else:
+            with py7zr.SevenZipFile(origem, mode="r") as arq:
+                yield from _iter_7z(arq, max_depth, orcamento, extensoes)
+
+
+def _tipo_compactado(lname: str):
+    for ext in EXTENSOES_COMPACTADAS:
+        if lname.endswith(ext):
+            return ext
+    return None
+
+
+def tipo_por_assinatura(cabeca: bytes):
+    """".zip"/".7z" pelos primeiros bytes do arquivo (None se não for nenhum dos dois)."""
+    for assinatura, tipo in _ASSINATURAS:
+        if cabeca[:len(assinatura)] == assinatura:
+            return tipo
+    return None
+
+
+def _data_hora_7z(info):
+    try:
+        return info.creationtime.astimezone().timetuple()[:6]
+    except Exception:
+        return None
+
+
+def iter_membros(origem, tipo: str, orcamento: OrcamentoMemoria | None = None):
+    """
+    Gera (nome, tamanho, data_hora, abrir) de cada arquivo (pastas não) de
+    um zip/7z, na ordem em que o compactado os guarda, sem extrair nada
+    para pasta. `abrir()` devolve o conteúdo como objeto de arquivo (use
+    com "with") e só vale enquanto o membro é o atual da iteração;
+    data_hora é a tupla de 6 campos do ZipInfo, ou None.
+
+    `origem` como em iter_xml_compactado. Compactados aninhados não são
+    abertos: quem chama decide o que fazer com eles.
+    """
+    if tipo == ".zip":
+        if isinstance(origem, zipfile.ZipFile):
+            yield from _membros_zip(origem)
+        else:
+            with zipfile.ZipFile(origem, "r") as zf:
+                yield from _membros_zip(zf)
+    elif tipo == ".7z":
+        orcamento = orcamento or OrcamentoMemoria()
+        if isinstance(origem, py7zr.SevenZipFile):
+            yield from _membros_7z(origem, orcamento)
+        else:
+            with py7zr.SevenZipFile(origem, mode="r") as arq:
+                yield from _membros_7z(arq, orcamento)
+    else:
+        raise ValueError(f"Tipo de compactado não suportado: {tipo!r}")
+
+
+def _membros_zip(zf):
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        yield info.filename, info.file_size, info.date_time, partial(zf.open, info)
+
+
+def _membros_7z(arq, orcamento):
+    infos = {f.filename: f for f in arq.list() if not f.is_directory}
+    if not infos:
+        return
+
+    def _abrir(membro):
+        membro.seek(0)
+        return nullcontext(membro)
+
+    for name, membro in iter_membros_7z(arq, list(infos), orcamento):
+        info = infos.get(name)
+        tamanho = info.uncompressed if info is not None else membro.size()
+        data_hora = _data_hora_7z(info) if info is not None else None
+        yield name, tamanho, data_hora, partial(_abrir, membro)
+
+
+def _iter_zip(zf, max_depth, orcamento, extensoes):
+    for info in zf.infolist():
+        name = info.filename
+        lname = name.lower()
+        if lname.endswith(extensoes):
+            try:
+                yield name, zf.read(info)
+            except Exception:
+                continue
+            continue
+
+        tipo = _tipo_compactado(lname)
+        if tipo is None or max_depth - 1 < 0:
+            continue
+        try:
+            with abrir_membro_seekable(lambda: zf.open(info), info.file_size, orcamento) as f:
+                yield from iter_xml_compactado(
+                    f, tipo, max_depth=max_depth - 1, orcamento=orcamento, extensoes=extensoes
+                )
+        except Exception:
+            continue
+
+
+def _iter_7z(arq, max_depth, orcamento, extensoes):
+    alvos = [
+        f.filename
+        for f in arq.list()
+        if not f.is_directory
+        and (f.filename.lower().endswith(extensoes) or _tipo_compactado(f.filename.lower()))
+    ]
+    if not alvos:
+        return
+    for name, membro in iter_membros_7z(arq, alvos, orcamento):
+        lname = name.lower()
+        if lname.endswith(extensoes):
+            yield name, membro.read()
+            continue
+        tipo = _tipo_compactado(lname)
+        if max_depth - 1 < 0:
+            continue
+        try:
+            yield from iter_xml_compactado(
+                membro.arquivo(), tipo, max_depth=max_depth - 1, orcamento=orcamento, extensoes=extensoes
+            )
+        except Exception:
+            continue
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Tamanho máximo padrão do cache em disco (bytes de payload)
+CACHE_MAX_BYTES_PADRAO = 512 * 1024 * 1024
+
+# Quantas operações acumular antes de gravar (commit) no SQLite
+_COMMIT_A_CADA = 500
+
+
+def diretorio_cache_padrao() -> str:
+    """Diretório do cache: CENTRAL_XML_CACHE_DIR ou <tmp>/central_xml_cache."""
+    return os.environ.get("CENTRAL_XML_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), "central_xml_cache"
+    )
+
+
+def hash_xml(xml_bytes: bytes) -> bytes:
+    return hashlib.blake2b(xml_bytes, digest_size=20).digest()
+
+
+class CacheParse:
+    """
+    Cache persistente (SQLite) de resultados de parse, endereçado pelo
+    conteúdo do XML.
+
+    Cada entrada é identificada por (namespace, hash dos bytes) e guarda a
+    versão do parser que a gerou; se a versão pedida for outra, a entrada é
+    descartada. O tamanho total é limitado por max_bytes, removendo as
+    entradas usadas há mais tempo (LRU).
+
+    Os valores são serializados em JSON; quem usa o cache converte de volta
+    para os tipos originais (tuplas, datas...).
+    """
+
+    def __init__(self, diretorio: str | None = None, *, max_bytes: int = CACHE_MAX_BYTES_PADRAO):
+        self.diretorio = diretorio or diretorio_cache_padrao()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pendentes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.diretorio, "parse_cache.sqlite3"),
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS parse_cache (
+                namespace TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                versao TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                acesso REAL NOT NULL,
+                PRIMARY KEY (namespace, hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_parse_cache_acesso ON parse_cache (acesso)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM parse_cache"
+        ).fetchone()[0]
+
+    # --- API ---
+    def get(self, namespace: str, versao: str, xml_bytes: bytes, *, chave: bytes | None = None):
+        """Retorna o valor salvo ou None (ausente ou de outra versão do parser)."""
+        h = chave or hash_xml(xml_bytes)
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT versao, valor FROM parse_cache WHERE namespace = ? AND hash = ?",
+                    (namespace, h),
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                if row[0] != versao:
+                    self._remover(namespace, h)
+                    self.misses += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE parse_cache SET acesso = ? WHERE namespace = ? AND hash = ?",
+                    (time.time(), namespace, h),
+                )
+                self._tick()
+                self.hits += 1
+                return json.loads(row[1])
+            except (sqlite3.Error, ValueError):
+                self.misses += 1
+                return None
+
+    def set(self, namespace: str, versao: str, xml_bytes: bytes, valor, *, chave: bytes | None = None):
+        h = chave or hash_xml(xml_bytes)
+        try:
+            payload = json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            try:
+                antigo = self._conn.execute(
+                    "SELECT tamanho FROM parse_cache WHERE namespace = ? AND hash = ?",
+                    (namespace, h),
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO parse_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, h, versao, payload, len(payload), time.time()),
+                )
+                self._total_bytes += len(payload) - (antigo[0] if antigo else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+                self._tick()
+            except sqlite3.Error:
+                pass
+
+    def estatisticas(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taxa_acerto": (self.hits / total) if total else 0.0,
+            "bytes": self._total_bytes,
+        }
+
+    def limpar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM parse_cache")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.commit()
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+
+    # --- internos ---
+    def _tick(self):
+        self._pendentes += 1
+        if self._pendentes >= _COMMIT_A_CADA:
+            self._conn.commit()
+            self._pendentes = 0
+
+    def _remover(self, namespace, h):
+        row = self._conn.execute(
+            "SELECT tamanho FROM parse_cache WHERE namespace = ? AND hash = ?",
+            (namespace, h),
+        ).fetchone()
+        if row:
+            self._conn.execute(
+                "DELETE FROM parse_cache WHERE namespace = ? AND hash = ?",
+                (namespace, h),
+            )
+            self._total_bytes -= row[0]
+
+    def _evict(self):
+        """Remove as entradas menos usadas até ficar em ~90% do limite."""
+        alvo = int(self.max_bytes * 0.9)
+        cur = self._conn.execute(
+            "SELECT namespace, hash, tamanho FROM parse_cache ORDER BY acesso"
+        )
+        remover = []
+        total = self._total_bytes
+        for namespace, h, tamanho in cur:
+            if total <= alvo:
+                break
+            remover.append((namespace, h))
+            total -= tamanho
+        self._conn.executemany(
+            "DELETE FROM parse_cache WHERE namespace = ? AND hash = ?", remover
+        )
+        self._conn.commit()
+        self._pendentes = 0
+        self._total_bytes = total
+
+
+_cache_global = None
+_cache_global_lock = threading.Lock()
+
+
+def obter_cache_parse() -> CacheParse | None:
+    """
+    Instância compartilhada do cache (uma por processo).
+    Desligado com CENTRAL_XML_CACHE=0; tamanho via CENTRAL_XML_CACHE_MB.
+    """
+    global _cache_global
+    if os.environ.get("CENTRAL_XML_CACHE", "1") == "0":
+        return None
+    with _cache_global_lock:
+        if _cache_global is None:
+            try:
+                mb = int(os.environ.get("CENTRAL_XML_CACHE_MB", "0"))
+            except ValueError:
+                mb = 0
+            try:
+                _cache_global = CacheParse(
+                    max_bytes=mb * 1024 * 1024 if mb > 0 else CACHE_MAX_BYTES_PADRAO
+                )
+            except (OSError, sqlite3.Error):
+                return None
+        return _cache_global
@@ -0,0 +1,46 @@
+import re
+
+# 44 dígitos isolados (não faz parte de um número maior)
+_RE_CHAVE_BYTES = re.compile(rb"(?<![0-9])[0-9]{44}(?![0-9])")
+
+_PESOS_DV = (2, 3, 4, 5, 6, 7, 8, 9)
+
+
+def dv_chave_acesso(chave43: str) -> str:
+    """Dígito verificador (módulo 11) dos 43 primeiros dígitos da chave."""
+    soma = 0
+    for i, d in enumerate(reversed(chave43)):
+        soma += (ord(d) - 48) * _PESOS_DV[i % 8]
+    resto = soma % 11
+    return "0" if resto < 2 else str(11 - resto)
+
+
+def chave_acesso_valida(chave: str | None) -> bool:
+    """True se a chave tem 44 dígitos e o DV confere."""
+    if not chave or len(chave) != 44 or not chave.isdigit():
+        return False
+    return dv_chave_acesso(chave[:43]) == chave[43]
+
+
+def chave_do_id(valor_id: str | None) -> str:
+    """Remove o prefixo ("NFe", "CTe") do atributo Id de infNFe/infCTe."""
+    return (
+        (valor_id or "")
+        .replace("NFe", "")
+        .replace("nfe", "")
+        .replace("CTe", "")
+        .replace("cte", "")
+        .strip()
+    )
+
+
+def buscar_chave_acesso(xml_bytes: bytes) -> str:
+    """
+    Procura diretamente nos bytes do XML a primeira sequência de 44 dígitos
+    com DV válido. Retorna "" se não houver.
+    """
+    for m in _RE_CHAVE_BYTES.finditer(xml_bytes):
+        chave = m.group(0).decode("ascii")
+        if chave_acesso_valida(chave):
+            return chave
+    return ""
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import tempfile
+
+# Memória máxima (bytes) de um índice antes de passar para o disco
+ORCAMENTO_DEDUPE_PADRAO = 256 * 1024 * 1024
+
+# 44 dígitos cabem em 19 bytes (10**44 < 2**152); chave + nItem (até 999)
+# cabe em 20 bytes (10**47 < 2**160)
+_BYTES_CHAVE = 19
+_BYTES_CHAVE_ITEM = 20
+
+_CAPACIDADE_INICIAL = 1024
+_CARGA_MAXIMA = 0.6
+
+
+def empacotar_chave(chave: str, n_item=None) -> bytes | None:
+    """
+    Representação binária de uma chave de acesso (44 dígitos) ou do par
+    (chave, nItem). Retorna None quando a chave não é numérica (ex.: NFS-e),
+    e quem chama guarda o valor original.
+    """
+    if not chave or len(chave) != 44 or not chave.isdigit():
+        return None
+    if n_item is None:
+        return int(chave).to_bytes(_BYTES_CHAVE, "big")
+    n = str(n_item).strip()
+    if not n.isdigit() or len(n) > 3:
+        return None
+    return (int(chave) * 1000 + int(n)).to_bytes(_BYTES_CHAVE_ITEM, "big")
+
+
+class _TabelaHash:
+    """
+    Conjunto de chaves binárias de tamanho fixo em um único bytearray
+    (endereçamento aberto com sondagem linear). Cada posição ocupa
+    `largura` bytes + 1 byte de ocupação, sem objeto Python por chave.
+    """
+
+    def __init__(self, largura: int, capacidade: int = _CAPACIDADE_INICIAL):
+        self.largura = largura
+        self.capacidade = capacidade
+        self.tamanho = 0
+        self._dados = bytearray(largura * capacidade)
+        self._ocupado = bytearray(capacidade)
+
+    def bytes_usados(self) -> int:
+        return len(self._dados) + len(self._ocupado)
+
+    def adicionar(self, k: bytes) -> bool:
+        if (self.tamanho + 1) > self.capacidade * _CARGA_MAXIMA:
+            self._crescer()
+        if self._inserir(k):
+            self.tamanho += 1
+            return True
+        return False
+
+    def __contains__(self, k: bytes) -> bool:
+        w = self.largura
+        mascara = self.capacidade - 1
+        i = hash(k) & mascara
+        while self._ocupado[i]:
+            if self._dados[i * w:(i + 1) * w] == k:
+                return True
+            i = (i + 1) & mascara
+        return False
+
+    def __iter__(self):
+        w = self.largura
+        for i in range(self.capacidade):
+            if self._ocupado[i]:
+                yield bytes(self._dados[i * w:(i + 1) * w])
+
+    def _inserir(self, k: bytes) -> bool:
+        w = self.largura
+        mascara = self.capacidade - 1
+        i = hash(k) & mascara
+        while self._ocupado[i]:
+            if self._dados[i * w:(i + 1) * w] == k:
+                return False
+            i = (i + 1) & mascara
+        self._dados[i * w:(i + 1) * w] = k
+        self._ocupado[i] = 1
+        return True
+
+    def _crescer(self):
+        # Reinsere direto do bytearray antigo, posição a posição: só uma chave
+        # por vez vira bytes (para o hash), em vez de uma lista com todas.
+        w = self.largura
+        capacidade_antiga = self.capacidade
+        ocupado_antigo = self._ocupado
+        antigos = memoryview(self._dados)
+        self.capacidade *= 2
+        self._dados = bytearray(w * self.capacidade)
+        self._ocupado = bytearray(self.capacidade)
+        try:
+            for i in range(capacidade_antiga):
+                if ocupado_antigo[i]:
+                    self._inserir(bytes(antigos[i * w:(i + 1) * w]))
+        finally:
+            antigos.release()
+
+
+class IndiceChaves:
+    """
+    Conjunto de chaves já vistas (dedupe) com baixo uso de memória.
+
+    Chaves de acesso de 44 dígitos (e pares chave + nItem) são guardadas
+    empacotadas em uma tabela hash binária; chaves não numéricas (NFS-e)
+    ficam em um set comum. Se `orcamento_bytes` for informado e a tabela
+    passar dele, o índice migra para um SQLite temporário em disco.
+
+    Uso: `if not indice.adicionar(chave): ...duplicado...`
+    """
+
+    def __init__(self, *, com_item: bool = False, orcamento_bytes: int | None = None, diretorio: str | None = None):
+        self.com_item = com_item
+        self.orcamento_bytes = orcamento_bytes
+        self.diretorio = diretorio
+        self._tabela = _TabelaHash(_BYTES_CHAVE_ITEM if com_item else _BYTES_CHAVE)
+        self._outras = set()
+        self._conn = None
+        self._arquivo = None
+        self._tamanho_disco = 0
+
+    # --- API ---
+    def adicionar(self, chave: str, n_item=None) -> bool:
+        """Registra a chave; True se ainda não tinha sido vista."""
+        k = empacotar_chave(chave, n_item if self.com_item else None)
+        if k is None:
+            orig = (chave, n_item) if self.com_item else chave
+            if orig in self._outras:
+                return False
+            self._outras.add(orig)
+            return True
+
+        if self._conn is not None:
+            return self._adicionar_disco(k)
+        novo = self._tabela.adicionar(k)
+        if novo and self.orcamento_bytes and self._tabela.bytes_usados() > self.orcamento_bytes:
+            self._ir_para_disco()
+        return novo
+
+    def __contains__(self, item) -> bool:
+        chave, n_item = item if self.com_item else (item, None)
+        k = empacotar_chave(chave, n_item)
+        if k is None:
+            return item in self._outras
+        if self._conn is not None:
+            return self._conn.execute("SELECT 1 FROM chaves WHERE k = ?", (k,)).fetchone() is not None
+        return k in self._tabela
+
+    def __len__(self) -> int:
+        base = self._tamanho_disco if self._conn is not None else self._tabela.tamanho
+        return base + len(self._outras)
+
+    @property
+    def em_disco(self) -> bool:
+        return self._conn is not None
+
+    @property
+    def largura(self) -> int:
+        """Tamanho (bytes) de cada chave empacotada."""
+        return _BYTES_CHAVE_ITEM if self.com_item else _BYTES_CHAVE
+
+    def exportar(self):
+        """
+        (bytes com as chaves empacotadas concatenadas, lista das chaves não
+        numéricas). Usado para salvar o índice junto com o estado do Resumo.
+        """
+        if self._conn is not None:
+            empacotadas = b"".join(k for (k,) in self._conn.execute("SELECT k FROM chaves"))
+        else:
+            empacotadas = b"".join(self._tabela)
+        outras = [list(o) if isinstance(o, tuple) else o for o in self._outras]
+        return empacotadas, outras
+
+    def importar(self, empacotadas: bytes, outras=()):
+        """Inverso de exportar: adiciona as chaves a este índice."""
+        w = self.largura
+        if len(empacotadas) % w:
+            raise ValueError("Índice de chaves corrompido (tamanho inválido).")
+        for i in range(0, len(empacotadas), w):
+            k = bytes(empacotadas[i:i + w])
+            if self._conn is not None:
+                self._adicionar_disco(k)
+                continue
+            self._tabela.adicionar(k)
+            if self.orcamento_bytes and self._tabela.bytes_usados() > self.orcamento_bytes:
+                self._ir_para_disco()
+        for o in outras:
+            self._outras.add(tuple(o) if self.com_item else o)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+        if self._arquivo:
+            try:
+                os.remove(self._arquivo)
+            except OSError:
+                pass
+            self._arquivo = None
+
+    def __del__(self):
+        self.close()
+
+    # --- modo disco ---
+    def _ir_para_disco(self):
+        fd, caminho = tempfile.mkstemp(prefix="dedupe_", suffix=".sqlite3", dir=self.diretorio)
+        os.close(fd)
+        self._arquivo = caminho
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE chaves (k BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._conn.executemany("INSERT INTO chaves VALUES (?)", ((k,) for k in self._tabela))
+        self._tamanho_disco = self._tabela.tamanho
+        self._tabela = _TabelaHash(self._tabela.largura, 1)
+
+    def _adicionar_disco(self, k: bytes) -> bool:
+        cur = self._conn.execute("INSERT OR IGNORE INTO chaves VALUES (?)", (k,))
+        if cur.rowcount > 0:
+            self._tamanho_disco += 1
+            return True
+        return False
@@ -0,0 +1,216 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from itertools import chain
+
+import pandas as pd
+import xlsxwriter
+
+try:
+    import pyarrow as _pa
+    import pyarrow.parquet as _pq
+except ImportError:  # pyarrow é opcional (só para Parquet)
+    _pa = _pq = None
+
+from core.instrumentacao import MEDIDOR_NULO
+
+# Limite de linhas de uma planilha do Excel (cabeçalho incluído)
+LIMITE_LINHAS_EXCEL = 1_048_576
+# Linhas convertidas e gravadas por vez
+TAMANHO_LOTE_EXPORTACAO = 50_000
+
+# Formato -> extensão do arquivo gerado
+FORMATOS_EXPORTACAO = {
+    "xlsx": ".xlsx",
+    "parquet": ".zip",  # um .parquet por tabela
+    "csv.gz": ".zip",   # um .csv.gz por tabela
+}
+
+_OPCOES_EXCEL = {
+    # Linhas vão para o disco conforme são escritas, em vez de ficarem na memória
+    "constant_memory": True,
+    # Texto do SPED é texto: nada de virar fórmula, link ou número
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+    "strings_to_numbers": False,
+    "default_date_format": "dd/mm/yyyy",
+}
+
+
+def _lotes(tabela, tamanho_lote):
+    """DataFrames de até `tamanho_lote` linhas: fatias de um DataFrame ou os lotes de um iterável."""
+    if isinstance(tabela, pd.DataFrame):
+        for inicio in range(0, len(tabela), tamanho_lote):
+            yield tabela.iloc[inicio:inicio + tamanho_lote]
+        return
+    for df in tabela:
+        if df is not None and not df.empty:
+            yield from _lotes(df, tamanho_lote)
+
+
+def _valores_excel(df) -> list:
+    """Colunas do lote como listas prontas para o xlsxwriter (NaN/NaT viram célula vazia)."""
+    colunas = []
+    for col in df.columns:
+        s = df[col]
+        valores = s.astype(object).to_numpy(copy=True)
+        ausentes = s.isna().to_numpy()
+        if ausentes.any():
+            valores[ausentes] = None
+        colunas.append(valores)
+    return colunas
+
+
+def _nome_aba(base: str, n: int) -> str:
+    sufixo = "" if n == 1 else f"_{n}"
+    return base[:31 - len(sufixo)] + sufixo
+
+
+def exportar_excel(tabelas: dict, destino, medidor=None, linhas_por_aba: int = LIMITE_LINHAS_EXCEL - 1,
+                   tamanho_lote: int = TAMANHO_LOTE_EXPORTACAO) -> list:
+    """
+    Grava {nome da aba: tabela} num .xlsx com o xlsxwriter em constant_memory:
+    cada linha vai para o disco assim que é escrita. Uma tabela com mais de
+    `linhas_por_aba` linhas continua em abas numeradas ("Itens", "Itens_2",
+    ...), cada uma com o cabeçalho. Tabelas vazias não geram aba.
+
+    tabela: DataFrame ou iterável de DataFrames com as mesmas colunas (os
+    lotes de logic_sped.iter_lotes_efd, por exemplo).
+    destino: caminho ou arquivo binário aberto.
+    Retorna os nomes das abas criadas.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    linhas_por_aba = max(1, min(linhas_por_aba, LIMITE_LINHAS_EXCEL - 1))
+    abas = []
+    wb = xlsxwriter.Workbook(destino, _OPCOES_EXCEL)
+    try:
+        negrito = wb.add_format({"bold": True})
+        for nome, tabela in tabelas.items():
+            ws = None
+            n_aba = 0
+            linha = 0
+            for lote in _lotes(tabela, tamanho_lote):
+                with medidor.etapa("exportacao.excel"):
+                    colunas = _valores_excel(lote)
+                    inicio = 0
+                    while inicio < len(lote):
+                        if ws is None or linha > linhas_por_aba:
+                            n_aba += 1
+                            ws = wb.add_worksheet(_nome_aba(nome, n_aba))
+                            abas.append(ws.name)
+                            ws.write_row(0, 0, [str(c) for c in lote.columns], negrito)
+                            linha = 1
+                        fim = min(len(lote), inicio + linhas_por_aba - linha + 1)
+                        for valores in zip(*(c[inicio:fim] for c in colunas)):
+                            ws.write_row(linha, 0, valores)
+                            linha += 1
+                        inicio = fim
+                medidor.contar("exportacao.linhas", len(lote))
+    finally:
+        with medidor.etapa("exportacao.excel"):
+            wb.close()
+    return abas
+
+
+def _csv_gz(tabela, arquivo, tamanho_lote, medidor):
+    """Escreve a tabela como CSV (; e vírgula decimal, como o Excel brasileiro) gzip em `arquivo`."""
+    with gzip.GzipFile(fileobj=arquivo, mode="wb") as gz, io.TextIOWrapper(gz, encoding="utf-8-sig", newline="") as txt:
+        cabecalho = True
+        for lote in _lotes(tabela, tamanho_lote):
+            with medidor.etapa("exportacao.csv_gz"):
+                lote.to_csv(txt, sep=";", decimal=",", date_format="%d/%m/%Y", index=False, header=cabecalho)
+            cabecalho = False
+            medidor.contar("exportacao.linhas", len(lote))
+
+
+def _esquema_parquet(df):
+    """
+    Schema Arrow da tabela inteira, montado uma vez pelos dtypes (e não pelos
+    valores de um lote): coluna object vira string, mesmo que o primeiro lote
+    só tenha vazios (que o Arrow inferiria como null), e category vira
+    dicionário com índice int32, que cabe as categorias de todos os lotes.
+    """
+    base = _pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    campos = []
+    for campo in base:
+        dtype = df[campo.name].dtype
+        if dtype == object:
+            campo = campo.with_type(_pa.string())
+        elif isinstance(dtype, pd.CategoricalDtype):
+            valores = campo.type.value_type
+            if _pa.types.is_null(valores) or dtype.categories.dtype == object:
+                valores = _pa.string()
+            campo = campo.with_type(_pa.dictionary(_pa.int32(), valores))
+        campos.append(campo)
+    return _pa.schema(campos, metadata=base.metadata)
+
+
+def _parquet(tabela, caminho, tamanho_lote, medidor):
+    # DataFrame: schema da tabela inteira; lotes: dos dtypes do primeiro
+    # (os lotes de logic_sped têm sempre os mesmos dtypes)
+    esquema = _esquema_parquet(tabela) if isinstance(tabela, pd.DataFrame) else None
+    escritor = None
+    try:
+        for lote in _lotes(tabela, tamanho_lote):
+            with medidor.etapa("exportacao.parquet"):
+                if esquema is None:
+                    esquema = _esquema_parquet(lote)
+                t = _pa.Table.from_pandas(lote, schema=esquema, preserve_index=False)
+                if escritor is None:
+                    escritor = _pq.ParquetWriter(caminho, esquema)
+                escritor.write_table(t)
+            medidor.contar("exportacao.linhas", len(lote))
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return escritor is not None
+
+
+def exportar_zip(tabelas: dict, destino, formato: str, medidor=None, tamanho_lote: int = TAMANHO_LOTE_EXPORTACAO) -> list:
+    """
+    Grava {nome: tabela} num ZIP com um arquivo por tabela não vazia:
+    "<nome>.csv.gz" (formato "csv.gz") ou "<nome>.parquet" (formato
+    "parquet", exige o pyarrow). As tabelas são escritas em lotes de
+    `tamanho_lote` linhas, sem montar o arquivo inteiro na memória; os
+    membros vão sem nova compressão (já estão comprimidos).
+    Retorna os nomes dos arquivos no ZIP.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    if formato not in ("csv.gz", "parquet"):
+        raise ValueError(f"Formato de exportação em ZIP inválido: {formato!r} (use 'csv.gz' ou 'parquet')")
+    if formato == "parquet" and _pq is None:
+        raise ImportError("Exportar em Parquet requer o pyarrow (pip install pyarrow)")
+
+    nomes = []
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for nome, tabela in tabelas.items():
+            membro = f"{nome}.{formato}"
+            if formato == "csv.gz":
+                lotes = _lotes(tabela, tamanho_lote)
+                primeiro = next(lotes, None)
+                if primeiro is None:
+                    continue
+                with zf.open(membro, "w", force_zip64=True) as f:
+                    _csv_gz(chain([primeiro], lotes), f, tamanho_lote, medidor)
+            else:
+                # O ParquetWriter precisa de um arquivo de verdade (com seek)
+                with tempfile.TemporaryDirectory(prefix="exportacao_") as tmp:
+                    caminho = os.path.join(tmp, membro)
+                    if not _parquet(tabela, caminho, tamanho_lote, medidor):
+                        continue
+                    with open(caminho, "rb") as origem, zf.open(membro, "w", force_zip64=True) as f:
+                        shutil.copyfileobj(origem, f, 1 << 20)
+            nomes.append(membro)
+    return nomes
+
+
+def exportar_tabelas(tabelas: dict, destino, formato: str = "xlsx", medidor=None, **kwargs) -> list:
+    """Grava as tabelas no `formato` de FORMATOS_EXPORTACAO (exportar_excel ou exportar_zip)."""
+    if formato == "xlsx":
+        return exportar_excel(tabelas, destino, medidor, **kwargs)
+    if formato in FORMATOS_EXPORTACAO:
+        return exportar_zip(tabelas, destino, formato, medidor, **kwargs)
+    raise ValueError(f"Formato de exportação inválido: {formato!r} (use um de {', '.join(FORMATOS_EXPORTACAO)})")
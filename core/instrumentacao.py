@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Medidor:
+    """
+    Cronômetros por etapa e contadores de um processamento.
+
+        medidor = Medidor()
+        with medidor.etapa("resumo.parse_xml"):
+            ...
+        medidor.contar("resumo.bytes_lidos", len(xml_bytes))
+
+    Cada etapa acumula chamadas, tempo de relógio (wall) e de CPU do processo.
+    Etapas podem ser aninhadas (ex.: a detecção de NFS-e dentro do parse);
+    nesse caso o tempo da interna também entra na externa. Pode ser usado
+    por mais de uma thread ao mesmo tempo.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+        self.contadores = {}
+        self._inicio = time.perf_counter()
+        self._cpu_inicio = time.process_time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nome: str):
+        w0 = time.perf_counter()
+        c0 = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - w0
+            cpu = time.process_time() - c0
+            with self._lock:
+                e = self.etapas.get(nome)
+                if e is None:
+                    e = self.etapas[nome] = [0, 0.0, 0.0]
+                e[0] += 1
+                e[1] += wall
+                e[2] += cpu
+
+    def contar(self, nome: str, n: int = 1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def iterar(self, nome: str, iteravel):
+        """Repassa os itens de `iteravel` cronometrando só o tempo gasto para produzi-los."""
+        it = iter(iteravel)
+        while True:
+            with self.etapa(nome):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def mesclar(self, relatorio: dict):
+        """Soma um relatório (ex.: vindo de um processo filho) a este medidor."""
+        for nome, e in (relatorio or {}).get("etapas", {}).items():
+            with self._lock:
+                atual = self.etapas.get(nome)
+                if atual is None:
+                    atual = self.etapas[nome] = [0, 0.0, 0.0]
+                atual[0] += e["chamadas"]
+                atual[1] += e["wall_s"]
+                atual[2] += e["cpu_s"]
+        for nome, n in (relatorio or {}).get("contadores", {}).items():
+            self.contar(nome, n)
+
+    def relatorio(self) -> dict:
+        with self._lock:
+            return {
+                "total_wall_s": round(time.perf_counter() - self._inicio, 6),
+                "total_cpu_s": round(time.process_time() - self._cpu_inicio, 6),
+                "etapas": {
+                    nome: {"chamadas": c, "wall_s": round(w, 6), "cpu_s": round(cpu, 6)}
+                    for nome, (c, w, cpu) in self.etapas.items()
+                },
+                "contadores": dict(self.contadores),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.relatorio(), ensure_ascii=False, indent=2)
+
+
+class _MedidorNulo:
+    """Mesma interface do Medidor, sem custo: usado quando ninguém pediu medições."""
+
+    _nulo = nullcontext()
+
+    def etapa(self, nome: str):
+        return self._nulo
+
+    def contar(self, nome: str, n: int = 1):
+        pass
+
+    def iterar(self, nome: str, iteravel):
+        return iteravel
+
+    def mesclar(self, relatorio: dict):
+        pass
+
+
+MEDIDOR_NULO = _MedidorNulo()
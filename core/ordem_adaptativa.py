@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+# Quantos provedores (assinaturas) cada memória guarda antes de descartar o mais antigo
+CAPACIDADE_PROVEDORES_PADRAO = 256
+
+
+def assinatura_provedor(root, filhos: int = 6) -> str:
+    """
+    Identifica o "provedor" de um XML: o namespace da raiz ou, sem namespace,
+    a tag da raiz seguida das primeiras tags filhas (mesmo leiaute = mesma
+    assinatura).
+    """
+    tag = root.tag if isinstance(root.tag, str) else ""
+    if tag[:1] == "{":
+        return tag[1:tag.index("}")]
+    partes = [tag]
+    for i, ch in enumerate(root):
+        if i >= filhos:
+            break
+        if isinstance(ch.tag, str):
+            partes.append(ch.tag)
+    return "|".join(partes)
+
+
+class MemoriaProvedor:
+    """
+    Lembra, por provedor e por grupo de candidatos (ex.: os formatos de
+    data), qual candidato deu certo da última vez, para que os próximos
+    documentos do mesmo provedor o tentem primeiro. Lotes grandes de uma
+    mesma prefeitura deixam de repetir, nota a nota, as mesmas tentativas
+    que falham.
+
+        for i in memoria.ordem(provedor, "data", len(formatos)):
+            d = tentar(formatos[i])
+            if d:
+                memoria.registrar(provedor, "data", i)
+                break
+
+    Só serve para candidatos mutuamente exclusivos (no máximo um dá certo
+    por valor): se mais de um puder casar, a ordem muda o resultado, e não
+    só o tempo, e a saída passa a depender da ordem dos documentos.
+
+    Guarda no máximo `capacidade` provedores (LRU). Seguro entre threads.
+    """
+
+    def __init__(self, capacidade: int = CAPACIDADE_PROVEDORES_PADRAO):
+        self.capacidade = max(1, capacidade)
+        self._provedores = OrderedDict()  # provedor -> {grupo: índice vencedor}
+        self._lock = threading.Lock()
+        self._consultas = 0
+        self._resolvidas = 0
+        self._acertos = 0
+        self._descartes = 0
+
+    def ordem(self, provedor: str, grupo: str, n: int) -> list:
+        """Índices 0..n-1 na ordem de tentativa: o último vencedor primeiro."""
+        with self._lock:
+            self._consultas += 1
+            grupos = self._provedores.get(provedor)
+            if grupos is not None:
+                self._provedores.move_to_end(provedor)
+                vencedor = grupos.get(grupo)
+                if vencedor is not None and 0 < vencedor < n:
+                    return [vencedor] + [i for i in range(n) if i != vencedor]
+        return list(range(n))
+
+    def registrar(self, provedor: str, grupo: str, indice: int):
+        """Anota que o candidato `indice` do grupo deu certo para o provedor."""
+        with self._lock:
+            grupos = self._provedores.get(provedor)
+            if grupos is None:
+                grupos = self._provedores[provedor] = {}
+                if len(self._provedores) > self.capacidade:
+                    self._provedores.popitem(last=False)
+                    self._descartes += 1
+            self._resolvidas += 1
+            anterior = grupos.get(grupo, 0)
+            if indice == anterior:
+                self._acertos += 1
+            grupos[grupo] = indice
+
+    def estatisticas(self) -> dict:
+        """
+        consultas: buscas feitas; resolvidas: as que acharam algum candidato;
+        acertos: resolvidas já na 1ª tentativa (taxa_acerto = acertos/resolvidas).
+        """
+        with self._lock:
+            return {
+                "consultas": self._consultas,
+                "resolvidas": self._resolvidas,
+                "acertos": self._acertos,
+                "taxa_acerto": round(self._acertos / self._resolvidas, 4) if self._resolvidas else 0.0,
+                "provedores": len(self._provedores),
+                "descartes": self._descartes,
+            }
+
+    def limpar(self):
+        with self._lock:
+            self._provedores.clear()
+            self._consultas = self._resolvidas = self._acertos = self._descartes = 0
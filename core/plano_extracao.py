@@ -0,0 +1,279 @@
+from core import xml_backend
+
+
+def _nome_local(tag: str):
+    if tag[:1] == "{":
+        uri, _, local = tag[1:].partition("}")
+        return uri, local
+    return None, tag
+
+
+class _PorNome:
+    """Elementos com o nome local dado, em qualquer namespace (inclui o próprio nó)."""
+
+    def __init__(self, local: str):
+        self._tag = "{*}" + local
+
+    def todos(self, no) -> list:
+        return list(no.iter(self._tag))
+
+
+class PlanoExtracao:
+    """
+    Plano de extração: cada tipo de documento declara uma vez os campos que
+    lê (caminhos por nome local, em ordem de preferência) e o plano resolve
+    todos numa única passada pela árvore.
+
+        PLANO = PlanoExtracao({
+            "emit": ("infNFe/emit/CNPJ", "infNFe/emit/CPF"),
+            "data": ("ide/dhEmi", "ide/dEmi"),
+            "id": ("infNFe@Id",),
+        })
+        registro = PLANO.extrair(root)   # {"emit": "...", "data": "...", "id": "..."}
+
+    Sintaxe dos caminhos:
+      - "a/b"  -> b filho direto de a;  "a//b" -> b descendente de a
+      - o caminho pode casar em qualquer ponto da árvore (como "//a/b" no XPath),
+        inclusive na própria raiz passada a extrair()
+      - "a@Id" -> atributo Id do elemento a
+      - "pfx:a" -> exige o namespace mapeado em `namespaces`; sem prefixo,
+        vale qualquer namespace (só o nome local)
+
+    Para cada campo vale o primeiro caminho da lista que tiver valor não vazio;
+    entre os elementos que casam com o mesmo caminho, o primeiro na ordem do
+    documento. Textos são devolvidos sem espaços nas pontas; campo sem valor
+    fica None.
+
+    campos: nome do campo -> caminhos em ordem de preferência.
+    namespaces: prefixo -> URI, para caminhos com "pfx:".
+    elementos: campos que devolvem o próprio Element (primeiro que casar).
+    multiplos: campos que devolvem a lista de todos os textos não vazios,
+        em ordem de documento (só o primeiro caminho que tiver algum).
+    ignorar_caixa: compara nomes locais sem diferenciar maiúsculas.
+    podar: nomes locais de grupos repetidos (ex.: "det") cujas subárvores só
+        são percorridas enquanto algum campo que passa por eles ainda pode
+        melhorar; depois disso os demais grupos são pulados.
+
+    Com o backend lxml (core.xml_backend), planos com todos os caminhos
+    qualificados por namespace (ou de um passo só) viram etree.XPath
+    compilados uma vez e avaliados em C, no lugar da passada em Python.
+    """
+
+    def __init__(
+        self, campos: dict, *, namespaces=None, elementos=(), multiplos=(), ignorar_caixa=False, podar=()
+    ):
+        self.campos = tuple(campos)
+        self.ignorar_caixa = ignorar_caixa
+        self._elementos = set(elementos)
+        self._multiplos = set(multiplos)
+        self._tags = {}  # cache tag -> (uri, nome local)
+        # nome local do último passo -> [(campo, prioridade, passos, atributo)]
+        self._por_local = {}
+        # nome podado -> [(campo, prioridade)] dos caminhos que passam por ele
+        self._podar = {(n.lower() if ignorar_caixa else n): [] for n in podar}
+        # campo -> [(busca, atributo)] em ordem de preferência (só lxml)
+        self._xpaths = {}
+        compilaveis = []
+        for campo, caminhos in campos.items():
+            if isinstance(caminhos, str):
+                caminhos = (caminhos,)
+            for prioridade, caminho in enumerate(caminhos):
+                passos, atributo = self._compilar(caminho, namespaces or {})
+                self._por_local.setdefault(passos[-1][1], []).append((campo, prioridade, passos, atributo))
+                for nome in {p[1] for p in passos}:
+                    if nome in self._podar:
+                        self._podar[nome].append((campo, prioridade))
+                compilaveis.append((campo, passos, atributo))
+        if xml_backend.USA_LXML:
+            self._compilar_xpaths(compilaveis)
+
+    def _compilar_xpaths(self, compilaveis):
+        """
+        Só usa XPath se todos os caminhos tiverem tradução direta; um único
+        caminho sem ela já obrigaria à passada em Python, que aí resolve tudo.
+        """
+        prefixos = {}  # URI -> prefixo gerado
+        buscas = []
+        for campo, passos, atributo in compilaveis:
+            expressao = self._para_xpath(passos, atributo, prefixos)
+            if expressao is not None:
+                buscas.append((campo, expressao, atributo))
+            elif len(passos) == 1 and not self.ignorar_caixa:
+                # Um passo só, sem namespace: iter("{*}nome") do lxml, em C
+                buscas.append((campo, _PorNome(passos[0][1]), atributo))
+            else:
+                return
+        namespaces = {p: uri for uri, p in prefixos.items()}
+        for campo, busca, atributo in buscas:
+            if isinstance(busca, str):
+                busca = xml_backend.Consulta(busca, namespaces)
+            self._xpaths.setdefault(campo, []).append((busca, atributo))
+
+    def _compilar(self, caminho: str, namespaces: dict):
+        caminho = caminho.strip()
+        while caminho.startswith(("./", "/")):
+            caminho = caminho[1:]
+        atributo = None
+        if "@" in caminho:
+            caminho, atributo = caminho.rsplit("@", 1)
+
+        passos = []
+        eixo = "//"
+        for parte in caminho.split("/"):
+            if not parte:
+                # "//": o próximo passo é descendente, não filho
+                eixo = "//"
+                continue
+            prefixo, _, local = parte.rpartition(":")
+            if prefixo and prefixo not in namespaces:
+                raise ValueError(f"Prefixo de namespace desconhecido no caminho {caminho!r}: {prefixo}")
+            uri = namespaces[prefixo] if prefixo else None
+            passos.append((eixo, local.lower() if self.ignorar_caixa else local, uri))
+            eixo = "/"
+        if not passos:
+            raise ValueError(f"Caminho vazio no plano de extração: {caminho!r}")
+        return tuple(passos), atributo
+
+    def _para_xpath(self, passos, atributo, prefixos: dict):
+        """
+        Mesmo caminho em XPath 1.0 (casa em qualquer ponto da subárvore), ou
+        None quando só daria para exprimi-lo com local-name()/translate(): o
+        libxml2 avalia esses predicados nó a nó e fica mais lento que a
+        passada em Python.
+        """
+        if self.ignorar_caixa or any(uri is None for _, _, uri in passos):
+            return None
+        partes = []
+        for i, (eixo, local, uri) in enumerate(passos):
+            nome = f"{prefixos.setdefault(uri, f'p{len(prefixos)}')}:{local}"
+            if i == 0:
+                partes.append(f"descendant-or-self::{nome}")
+            else:
+                partes.append(("/" if eixo == "/" else "/descendant::") + nome)
+        if atributo:
+            partes.append(f"/@{atributo}")
+        return "".join(partes)
+
+    def _extrair_xpath(self, root) -> dict:
+        registro = {}
+        for campo in self.campos:
+            multiplo = campo in self._multiplos
+            valor = [] if multiplo else None
+            for consulta, atributo in self._xpaths.get(campo, ()):
+                achados = consulta.todos(root)
+                if campo in self._elementos:
+                    if achados:
+                        valor = achados[0]
+                        break
+                    continue
+                textos = []
+                for r in achados:
+                    v = r if atributo else r.text
+                    v = v.strip() if v else ""
+                    if v:
+                        textos.append(v)
+                        if not multiplo:
+                            break
+                if textos:
+                    valor = textos if multiplo else textos[0]
+                    break
+            registro[campo] = valor
+        return registro
+
+    @staticmethod
+    def _casa(passos, cadeia) -> bool:
+        """Os passos casam com o fim da cadeia de ancestrais (o último já casou pelo nome)?"""
+
+        def casa(i, j):
+            eixo, local, uri = passos[i]
+            uri_el, local_el = cadeia[j]
+            if local_el != local or (uri is not None and uri_el != uri):
+                return False
+            if i == 0:
+                return True
+            if eixo == "/":
+                return j > 0 and casa(i - 1, j - 1)
+            return any(casa(i - 1, k) for k in range(j - 1, -1, -1))
+
+        return casa(len(passos) - 1, len(cadeia) - 1)
+
+    def extrair(self, root) -> dict:
+        """Registro {campo: valor} com todos os campos do plano (None se ausente)."""
+        melhores = {}  # campo -> (prioridade, valor)
+        multiplos = {}  # campo -> (prioridade, [textos])
+        if root is None:
+            return self._registro(melhores, multiplos)
+        if self._xpaths and xml_backend.eh_lxml(root):
+            return self._extrair_xpath(root)
+
+        por_local = self._por_local
+        podar = self._podar
+        tags = self._tags
+        cadeia = []
+        pilha = [(root, 0)]
+        while pilha:
+            el, profundidade = pilha.pop()
+            tag = el.tag
+            nome = tags.get(tag)
+            if nome is None:
+                if not isinstance(tag, str):  # comentários / instruções
+                    continue
+                uri, local = _nome_local(tag)
+                nome = tags[tag] = (uri, local.lower() if self.ignorar_caixa else local)
+            local = nome[1]
+            del cadeia[profundidade:]
+            cadeia.append(nome)
+
+            for campo, prioridade, passos, atributo in por_local.get(local, ()):
+                if campo in self._multiplos:
+                    atual = multiplos.get(campo)
+                    if atual is not None and atual[0] < prioridade:
+                        continue
+                elif (atual := melhores.get(campo)) is not None and atual[0] <= prioridade:
+                    continue
+                if not self._casa(passos, cadeia):
+                    continue
+
+                if campo in self._elementos:
+                    melhores[campo] = (prioridade, el)
+                    continue
+                valor = el.get(atributo) if atributo else el.text
+                valor = valor.strip() if valor else ""
+                if not valor:
+                    continue
+                if campo in self._multiplos:
+                    if atual is None or atual[0] > prioridade:
+                        multiplos[campo] = (prioridade, [valor])
+                    else:
+                        atual[1].append(valor)
+                else:
+                    melhores[campo] = (prioridade, valor)
+
+            if len(el):
+                if local in podar and not self._pendente(podar[local], melhores, multiplos):
+                    continue
+                pilha.extend((filho, profundidade + 1) for filho in reversed(el))
+
+        return self._registro(melhores, multiplos)
+
+    def _pendente(self, caminhos, melhores, multiplos) -> bool:
+        """Algum dos (campo, prioridade) ainda pode ganhar valor nesta subárvore?"""
+        for campo, prioridade in caminhos:
+            if campo in self._multiplos:
+                atual = multiplos.get(campo)
+                if atual is None or atual[0] >= prioridade:
+                    return True
+                continue
+            atual = melhores.get(campo)
+            if atual is None or atual[0] > prioridade:
+                return True
+        return False
+
+    def _registro(self, melhores, multiplos) -> dict:
+        registro = {}
+        for campo in self.campos:
+            if campo in self._multiplos:
+                registro[campo] = multiplos[campo][1] if campo in multiplos else []
+            else:
+                registro[campo] = melhores[campo][1] if campo in melhores else None
+        return registro
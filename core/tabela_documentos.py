@@ -0,0 +1,157 @@
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Códigos da coluna P/T
+PT_CODIGOS = {"P": 0, "T": 1}
+PT_VALORES = ("P", "T")
+
+
+class _Dicionario:
+    """Codifica valores repetidos (CNPJ, modelo, CFOP) como inteiros."""
+
+    def __init__(self, valores=()):
+        self.codigos = {}
+        self.valores = []
+        for v in valores:
+            self.codigo(v)
+
+    def codigo(self, valor) -> int:
+        c = self.codigos.get(valor)
+        if c is None:
+            c = len(self.valores)
+            self.codigos[valor] = c
+            self.valores.append(valor)
+        return c
+
+
+class TabelaDocumentos:
+    """
+    Tabela colunar com um registro por documento aceito no Resumo (Aba 2).
+
+    Colunas de tamanho fixo em `array`:
+      cnpj / modelo / cfop -> códigos de dicionário (viram Categorical)
+      ano (0 = sem data), mes (0 = sem data), pt (0 = P, 1 = T)
+      no_resumo / no_detalhe -> em quais saídas o documento entra
+    A chave fica em um único buffer de bytes + offsets (texto de tamanho variável).
+    """
+
+    def __init__(self):
+        self.dic_cnpj = _Dicionario()
+        self.dic_modelo = _Dicionario()
+        self.dic_cfop = _Dicionario()
+        self.cnpj = array("I")
+        self.modelo = array("B")
+        self.cfop = array("I")
+        self.ano = array("H")
+        self.mes = array("B")
+        self.pt = array("B")
+        self.no_resumo = array("B")
+        self.no_detalhe = array("B")
+        self.chave_dados = bytearray()
+        self.chave_offsets = array("Q", [0])
+
+    def __len__(self):
+        return len(self.cnpj)
+
+    def adicionar(self, *, cnpj, modelo, cfop, ano, mes, pt, chave, no_resumo, no_detalhe):
+        self.cnpj.append(self.dic_cnpj.codigo(cnpj or ""))
+        self.modelo.append(self.dic_modelo.codigo(modelo or ""))
+        self.cfop.append(self.dic_cfop.codigo(cfop or ""))
+        self.ano.append(ano or 0)
+        self.mes.append(mes or 0)
+        self.pt.append(PT_CODIGOS[pt])
+        self.no_resumo.append(1 if no_resumo else 0)
+        self.no_detalhe.append(1 if no_detalhe else 0)
+        self.chave_dados += (chave or "").encode("utf-8")
+        self.chave_offsets.append(len(self.chave_dados))
+
+    _COLUNAS = ("cnpj", "modelo", "cfop", "ano", "mes", "pt", "no_resumo", "no_detalhe", "chave_offsets")
+
+    def exportar(self):
+        """
+        (metadados em JSON, {nome: bytes}) para salvar a tabela sem pickle.
+        As colunas vão como bytes brutos do `array`, com typecode/itemsize e
+        ordem de bytes registrados para validar a leitura.
+        """
+        meta = {
+            "byteorder": sys.byteorder,
+            "linhas": len(self),
+            "colunas": {
+                nome: {"typecode": getattr(self, nome).typecode, "itemsize": getattr(self, nome).itemsize}
+                for nome in self._COLUNAS
+            },
+            "dicionarios": {
+                "cnpj": self.dic_cnpj.valores,
+                "modelo": self.dic_modelo.valores,
+                "cfop": self.dic_cfop.valores,
+            },
+        }
+        blobs = {nome: getattr(self, nome).tobytes() for nome in self._COLUNAS}
+        blobs["chave_dados"] = bytes(self.chave_dados)
+        return meta, blobs
+
+    @classmethod
+    def importar(cls, meta: dict, blobs: dict):
+        """Inverso de exportar; ValueError se os dados não forem consistentes."""
+        t = cls()
+        try:
+            t.dic_cnpj = _Dicionario(str(v) for v in meta["dicionarios"]["cnpj"])
+            t.dic_modelo = _Dicionario(str(v) for v in meta["dicionarios"]["modelo"])
+            t.dic_cfop = _Dicionario(str(v) for v in meta["dicionarios"]["cfop"])
+            linhas = int(meta["linhas"])
+            for nome in cls._COLUNAS:
+                col = array(getattr(t, nome).typecode)
+                info = meta["colunas"][nome]
+                if info["typecode"] != col.typecode or info["itemsize"] != col.itemsize:
+                    raise ValueError(f"coluna {nome} com tipo incompatível")
+                col.frombytes(blobs[nome])
+                if meta["byteorder"] != sys.byteorder:
+                    col.byteswap()
+                setattr(t, nome, col)
+            t.chave_dados = bytearray(blobs["chave_dados"])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Tabela de documentos inválida: {e}") from e
+
+        tamanhos = {len(getattr(t, nome)) for nome in cls._COLUNAS if nome != "chave_offsets"}
+        if (
+            tamanhos != {linhas}
+            or len(t.chave_offsets) != linhas + 1
+            or t.chave_offsets[-1] != len(t.chave_dados)
+            or max(t.cnpj, default=-1) >= len(t.dic_cnpj.valores)
+            or max(t.modelo, default=-1) >= len(t.dic_modelo.valores)
+            or max(t.cfop, default=-1) >= len(t.dic_cfop.valores)
+            or max(t.pt, default=-1) >= len(PT_VALORES)
+        ):
+            raise ValueError("Tabela de documentos inválida: colunas inconsistentes")
+        return t
+
+    def chave(self, i: int) -> str:
+        return self.chave_dados[self.chave_offsets[i]:self.chave_offsets[i + 1]].decode("utf-8")
+
+    def to_frame(self, *, incluir_chave: bool = False) -> pd.DataFrame:
+        """DataFrame com colunas categóricas/inteiras, sem cópia por documento em dict."""
+
+        def _cat(codigos, dic):
+            return pd.Categorical.from_codes(
+                np.frombuffer(codigos, dtype=np.dtype(codigos.typecode)).astype("int32"),
+                categories=pd.Index(dic.valores, dtype=object),
+            )
+
+        dados = {
+            "cnpj": _cat(self.cnpj, self.dic_cnpj),
+            "modelo": _cat(self.modelo, self.dic_modelo),
+            "cfop": _cat(self.cfop, self.dic_cfop),
+            "ano": np.frombuffer(self.ano, dtype=np.uint16),
+            "mes": np.frombuffer(self.mes, dtype=np.uint8),
+            "pt": pd.Categorical.from_codes(
+                np.frombuffer(self.pt, dtype=np.uint8).astype("int8"), categories=list(PT_VALORES)
+            ),
+            "no_resumo": np.frombuffer(self.no_resumo, dtype=np.uint8).astype(bool),
+            "no_detalhe": np.frombuffer(self.no_detalhe, dtype=np.uint8).astype(bool),
+        }
+        if incluir_chave:
+            dados["chave"] = [self.chave(i) for i in range(len(self))]
+        return pd.DataFrame(dados)
@@ -0,0 +1,141 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as _lxml
+except ImportError:  # lxml é opcional
+    _lxml = None
+
+# Backend escolhido na importação: lxml quando instalado, senão a stdlib.
+# CENTRAL_XML_BACKEND=stdlib (ou lxml) força um dos dois.
+_PEDIDO = os.environ.get("CENTRAL_XML_BACKEND", "").strip().lower()
+if _PEDIDO not in ("", "lxml", "stdlib"):
+    raise ValueError(f"CENTRAL_XML_BACKEND inválido: {_PEDIDO!r} (use 'lxml' ou 'stdlib')")
+if _PEDIDO == "lxml" and _lxml is None:
+    raise ImportError("CENTRAL_XML_BACKEND=lxml, mas o lxml não está instalado")
+
+BACKEND = "lxml" if _lxml is not None and _PEDIDO != "stdlib" else "stdlib"
+USA_LXML = BACKEND == "lxml"
+
+# Erros de XML malformado em qualquer backend
+ERROS_PARSE = (ET.ParseError, _lxml.XMLSyntaxError) if _lxml is not None else (ET.ParseError,)
+
+# Declaração <?xml ... ?>: o lxml recusa str com encoding declarado
+_RE_DECLARACAO = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def _opcoes_lxml() -> dict:
+    # Mesmo comportamento do ElementTree: sem comentários/instruções na
+    # árvore, entidades internas expandidas, nada de rede ou arquivos externos.
+    opcoes = dict(remove_comments=True, remove_pis=True, no_network=True, huge_tree=True)
+    try:
+        _lxml.XMLParser(resolve_entities="internal")
+        opcoes["resolve_entities"] = "internal"
+    except (TypeError, ValueError):  # lxml < 5
+        opcoes["resolve_entities"] = False
+    return opcoes
+
+
+if USA_LXML:
+    _OPCOES_LXML = _opcoes_lxml()
+    _PARSER_LXML = _lxml.XMLParser(**_OPCOES_LXML)
+
+
+def fromstring(dados):
+    """Raiz do XML em `dados` (bytes ou str)."""
+    if USA_LXML:
+        if isinstance(dados, str):
+            dados = _RE_DECLARACAO.sub("", dados, count=1)
+        elif isinstance(dados, (bytearray, memoryview)):
+            dados = bytes(dados)
+        return _lxml.fromstring(dados, _PARSER_LXML)
+    return ET.fromstring(dados)
+
+
+def parse(origem):
+    """Raiz do XML de um caminho ou arquivo aberto."""
+    if USA_LXML:
+        return _lxml.parse(origem, _PARSER_LXML).getroot()
+    return ET.parse(origem).getroot()
+
+
+class _PullLxml:
+    """XMLPullParser do lxml com a mesma interface do ElementTree."""
+
+    def __init__(self, events, tags=None):
+        if tags:
+            self._p = _lxml.XMLPullParser(events=events, tag=list(tags), **_OPCOES_LXML)
+        else:
+            self._p = _lxml.XMLPullParser(events=events, **_OPCOES_LXML)
+
+    def feed(self, dados):
+        self._p.feed(bytes(dados))
+
+    def read_events(self):
+        return self._p.read_events()
+
+    def close(self):
+        self._p.close()
+
+
+def pull_parser(events=("end",), tags=None):
+    """
+    Parser incremental (feed/read_events/close) do backend ativo. `tags`
+    ("{ns}nome" ou "{*}nome") só filtra eventos no lxml; na stdlib chegam
+    os eventos de todos os elementos e quem consome precisa ignorá-los.
+    """
+    if USA_LXML:
+        return _PullLxml(events, tags)
+    return ET.XMLPullParser(events=events)
+
+
+def eh_lxml(el) -> bool:
+    return _lxml is not None and isinstance(el, _lxml._Element)
+
+
+class Consulta:
+    """
+    Caminho (subconjunto comum ElementPath/XPath: "ns:a/ns:b", ".//ns:det")
+    compilado uma vez. No lxml vira um etree.XPath; na stdlib usa o
+    find/findall do ElementTree (que guarda o caminho já interpretado).
+    """
+
+    def __init__(self, caminho: str, namespaces: dict | None = None):
+        self.caminho = caminho
+        self.namespaces = dict(namespaces or {})
+        self._xpath = (
+            _lxml.XPath(caminho, namespaces=self.namespaces, smart_strings=False) if USA_LXML else None
+        )
+
+    def todos(self, no) -> list:
+        if no is None:
+            return []
+        if self._xpath is not None and eh_lxml(no):
+            return self._xpath(no)
+        return no.findall(self.caminho, self.namespaces)
+
+    def primeiro(self, no):
+        if no is None:
+            return None
+        if self._xpath is not None and eh_lxml(no):
+            r = self._xpath(no)
+            return r[0] if r else None
+        return no.find(self.caminho, self.namespaces)
+
+    def texto(self, no) -> str:
+        """Texto do primeiro elemento ("" se não houver), como findtext."""
+        el = self.primeiro(no)
+        return (el.text or "") if el is not None else ""
+
+
+_CONSULTAS = {}
+
+
+def consulta(caminho: str, namespaces: dict | None = None) -> Consulta:
+    """Consulta compilada e guardada para reuso (caminhos montados em tempo de execução)."""
+    chave = (caminho, tuple(sorted((namespaces or {}).items())))
+    c = _CONSULTAS.get(chave)
+    if c is None:
+        c = _CONSULTAS[chave] = Consulta(caminho, namespaces)
+    return c
@@ -2,6 +2,7 @@ import pandas as pd
 import xml.etree.ElementTree as ET
 import os
 import re
+from core.instrumentacao import MEDIDOR_NULO
 
 def carregar_dicionario_servicos(caminho_planilha):
     """
@@ -65,30 +66,36 @@ def adicionar_campo(parent, tag, valor):
     elem.text = texto
     return elem
 
-def converter_txt_para_xml_lote(input_path, output_dir, path_ref_custom=None):
+def converter_txt_para_xml_lote(input_path, output_dir, path_ref_custom=None, medidor=None):
     """
     input_path: Arquivo TXT/CSV/ZIP enviado pelo usuário.
     output_dir: Pasta temporária no servidor para gerar os XMLs.
     path_ref_custom: Caminho da planilha Excel de referência enviada via Aba 5.
+    medidor: core.instrumentacao.Medidor opcional (tempos por etapa e contadores).
     """
+    medidor = medidor or MEDIDOR_NULO
     try:
         # PRIORIDADE: Usa o arquivo que o usuário subiu na Aba 5. 
         # FALLBACK: Tenta o caminho local (apenas para testes no seu PC).
         path_referencia = path_ref_custom or r"C:\Users\joao.moraes_sankhya\Documents\Resumo XML\Cod.-de-servico-SP-x-Campinas.xlsx"
         
-        dic_servicos = carregar_dicionario_servicos(path_referencia)
+        with medidor.etapa("conversor.planilha_referencia"):
+            dic_servicos = carregar_dicionario_servicos(path_referencia)
         
         extensao = os.path.splitext(input_path)[1].lower()
         
         # Leitura do arquivo (TXT ou CSV)
-        if extensao == ".txt":
-            df = pd.read_csv(input_path, sep="\t", dtype=str, encoding="ISO-8859-1").fillna("")
-        elif extensao == ".csv":
-            df = pd.read_csv(input_path, sep=";", dtype=str, encoding="ISO-8859-1").fillna("")
-            if len(df.columns) <= 1:
-                df = pd.read_csv(input_path, sep=",", dtype=str, encoding="ISO-8859-1").fillna("")
-        else:
-            return f"Erro: Formato {extensao} não suportado."
+        with medidor.etapa("conversor.leitura"):
+            if extensao == ".txt":
+                df = pd.read_csv(input_path, sep="\t", dtype=str, encoding="ISO-8859-1").fillna("")
+            elif extensao == ".csv":
+                df = pd.read_csv(input_path, sep=";", dtype=str, encoding="ISO-8859-1").fillna("")
+                if len(df.columns) <= 1:
+                    df = pd.read_csv(input_path, sep=",", dtype=str, encoding="ISO-8859-1").fillna("")
+            else:
+                return f"Erro: Formato {extensao} não suportado."
+        medidor.contar("conversor.bytes_lidos", os.path.getsize(input_path))
+        medidor.contar("conversor.linhas", len(df))
 
         os.makedirs(output_dir, exist_ok=True)
         
@@ -234,19 +241,22 @@ def converter_txt_para_xml_lote(input_path, output_dir, path_ref_custom=None):
                 adicionar_campo(reforma_tag, "AliqEstatualIBS", fmt_v(row.get("Aliquota Estadual IBS", "")))
                 adicionar_campo(reforma_tag, "AliqMunicipalIBS", fmt_v(row.get("Aliquota Municipal IBS", "")))
 
-            xml_tree = ET.ElementTree(root)
-            ET.indent(xml_tree, space="  ", level=0)
-            
-            nome_arquivo = f"NFSe_{nf_num}_{prestador_doc}.xml"
-            caminho_final = os.path.join(output_dir, nome_arquivo)
-            
-            if os.path.exists(caminho_final):
-                nome_arquivo = f"NFSe_{nf_num}_{prestador_doc}_duplicada.xml"
+            with medidor.etapa("conversor.gravar_xml"):
+                xml_tree = ET.ElementTree(root)
+                ET.indent(xml_tree, space="  ", level=0)
+                
+                nome_arquivo = f"NFSe_{nf_num}_{prestador_doc}.xml"
                 caminho_final = os.path.join(output_dir, nome_arquivo)
+                
+                if os.path.exists(caminho_final):
+                    nome_arquivo = f"NFSe_{nf_num}_{prestador_doc}_duplicada.xml"
+                    caminho_final = os.path.join(output_dir, nome_arquivo)
 
-            xml_tree.write(caminho_final, encoding="utf-8", xml_declaration=True)
+                xml_tree.write(caminho_final, encoding="utf-8", xml_declaration=True)
             count += 1
             
+        medidor.contar("conversor.xmls_gerados", count)
         return f"Sucesso! {count} arquivos gerados."
     except Exception as e:
+        medidor.contar("conversor.falhas")
         return f"Erro na conversão: {str(e)}"
\ No newline at end of file
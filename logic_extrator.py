@@ -4,8 +4,26 @@ import tempfile
 import zipfile
 import py7zr
 import io
-import xml.etree.ElementTree as ET
-from datetime import datetime
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+from core.arquivos import (
+    EXTENSOES_COMPACTADAS,
+    ORCAMENTO_MEMORIA_PADRAO,
+    OrcamentoMemoria,
+    abrir_membro_seekable,
+    iter_membros,
+    ler_adiante,
+    tipo_por_assinatura,
+)
+from core.cache_parse import hash_xml
+from core.instrumentacao import MEDIDOR_NULO, Medidor
+from core.plano_extracao import PlanoExtracao
+from core import xml_backend
 from utils import (
     log_message,
     digits,
@@ -14,6 +32,9 @@ from utils import (
     CTE_NS_GLOBAL,
 )
 
+# Mudou parse_xml_bytes_full_data? Incrementar para invalidar o cache persistente.
+VERSAO_PARSER_EXTRATOR = "extrator-1"
+
 def extract_7z(archive_path, destination_path):
     """Extrai .7z de forma compatível com Linux/Cloud"""
     try:
@@ -22,90 +43,276 @@ def extract_7z(archive_path, destination_path):
     except Exception as e:
         raise Exception(f"Erro ao extrair 7z: {e}")
 
-def parse_xml_full_data(xml_file_path):
-    """Analisa o XML extraindo CNPJs (incluindo Tomador CTe), Data e CFOPs"""
+def parse_xml_full_data(xml_file_path, cache=None):
+    """
+    Analisa o XML extraindo CNPJs (incluindo Tomador CTe), Data e CFOPs.
+    Com cache (core.cache_parse.CacheParse), XMLs de conteúdo já visto não
+    são parseados de novo.
+    """
+    if cache is None:
+        return parse_xml_bytes_full_data(xml_file_path)
     try:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-        ns = {'nfe': NFE_NS_GLOBAL, 'cte': CTE_NS_GLOBAL}
-        
-        # Identifica se é NFe ou CTe
-        infNFe = root.find(".//nfe:infNFe", ns)
-        infCTe = root.find(".//cte:infCTe", ns)
+        with open(xml_file_path, "rb") as f:
+            xml_bytes = f.read()
+    except OSError:
+        return None
+    return parse_xml_bytes_com_cache(xml_bytes, cache)
+
+
+def parse_xml_bytes_com_cache(xml_bytes, cache=None):
+    """parse_xml_bytes_full_data consultando/alimentando o cache (se houver)."""
+    if cache is None:
+        return parse_xml_bytes_full_data(xml_bytes)
+    h = hash_xml(xml_bytes)
+    achado, info = _ler_cache_extrator(cache, xml_bytes, h)
+    if achado:
+        return info
+    info = parse_xml_bytes_full_data(xml_bytes)
+    _gravar_cache_extrator(cache, xml_bytes, h, info)
+    return info
+
+
+def _ler_cache_extrator(cache, xml_bytes, h):
+    """(achado, info) do cache; info pode ser None (XML já visto e inválido)."""
+    salvo = cache.get("extrator", VERSAO_PARSER_EXTRATOR, xml_bytes, chave=h)
+    if salvo is None:
+        return False, None
+    info = salvo.get("info")
+    if info is not None and info["data"]:
+        info["data"] = date.fromisoformat(info["data"])
+    return True, info
+
+
+def _gravar_cache_extrator(cache, xml_bytes, h, info):
+    valor = dict(info, data=info["data"].isoformat() if info["data"] else None) if info else None
+    cache.set("extrator", VERSAO_PARSER_EXTRATOR, xml_bytes, {"info": valor}, chave=h)
+
+
+# Campos lidos de NFe/CTe pelo Extrator (uma passada pela árvore)
+_NS_EXTRATOR = {'nfe': NFE_NS_GLOBAL, 'cte': CTE_NS_GLOBAL}
+PLANO_EXTRATOR = PlanoExtracao(
+    {
+        'infNFe': ('nfe:infNFe',),
+        'infCTe': ('cte:infCTe',),
+        'nfe_emit': ('nfe:infNFe//nfe:emit/nfe:CNPJ',),
+        'nfe_dest': ('nfe:infNFe//nfe:dest/nfe:CNPJ',),
+        'nfe_data': ('nfe:infNFe//nfe:ide/nfe:dhEmi', 'nfe:infNFe//nfe:ide/nfe:dEmi'),
+        'cte_emit': ('cte:infCTe//cte:emit/cte:CNPJ',),
+        'cte_dest': ('cte:infCTe//cte:dest/cte:CNPJ',),
+        'cte_data': ('cte:infCTe//cte:ide/cte:dhEmi',),
+        # Tomador do CTe (toma3 aponta um dos papéis; toma4 traz o CNPJ)
+        'toma3': ('cte:infCTe//cte:toma3/cte:toma',),
+        'toma4': ('cte:infCTe//cte:toma4',),
+        'toma4_cnpj': ('cte:infCTe//cte:toma4//cte:CNPJ',),
+        'rem': ('cte:infCTe//cte:rem/cte:CNPJ',),
+        'exped': ('cte:infCTe//cte:exped/cte:CNPJ',),
+        'receb': ('cte:infCTe//cte:receb/cte:CNPJ',),
+        # Todos os CFOPs do XML, em qualquer namespace
+        'cfops': ('CFOP',),
+    },
+    namespaces=_NS_EXTRATOR,
+    elementos=('infNFe', 'infCTe', 'toma3', 'toma4'),
+    multiplos=('cfops',),
+)
+
+
+def parse_xml_bytes_full_data(xml_source):
+    """Mesma análise de parse_xml_full_data, a partir de um caminho ou dos bytes do XML."""
+    try:
+        if isinstance(xml_source, (bytes, bytearray)):
+            root = xml_backend.fromstring(xml_source)
+        else:
+            root = xml_backend.parse(xml_source)
+        campos = PLANO_EXTRATOR.extrair(root)
         
         emit_cnpj = ""
         dest_cnpj = ""
         data_str = ""
         # Coleta todos os CFOPs presentes no XML (independente de ser NFe ou CTe)
-        cfops = [c.text for c in root.findall(".//{*}CFOP") if c.text]
+        cfops = campos['cfops']
 
-        if infNFe is not None:
-            emit_cnpj = digits(infNFe.findtext(".//nfe:emit/nfe:CNPJ", namespaces=ns) or "")
-            dest_cnpj = digits(infNFe.findtext(".//nfe:dest/nfe:CNPJ", namespaces=ns) or "")
-            data_str = infNFe.findtext(".//nfe:ide/nfe:dhEmi", namespaces=ns) or \
-                       infNFe.findtext(".//nfe:ide/nfe:dEmi", namespaces=ns) or ""
+        # Identifica se é NFe ou CTe
+        if campos['infNFe'] is not None:
+            emit_cnpj = digits(campos['nfe_emit'] or "")
+            dest_cnpj = digits(campos['nfe_dest'] or "")
+            data_str = campos['nfe_data'] or ""
             
-        elif infCTe is not None:
-            emit_cnpj = digits(infCTe.findtext(".//cte:emit/cte:CNPJ", namespaces=ns) or "")
-            dest_cnpj = digits(infCTe.findtext(".//cte:dest/cte:CNPJ", namespaces=ns) or "")
-            data_str = infCTe.findtext(".//cte:ide/cte:dhEmi", namespaces=ns) or ""
+        elif campos['infCTe'] is not None:
+            emit_cnpj = digits(campos['cte_emit'] or "")
+            dest_cnpj = digits(campos['cte_dest'] or "")
+            data_str = campos['cte_data'] or ""
             
             # --- LÓGICA TOMADOR CTe (Tom3 / Tom4) ---
             # Se o nosso CNPJ não for o emitente, verificamos se somos o Tomador
-            toma3 = infCTe.find(".//cte:toma3/cte:toma", namespaces=ns)
-            toma4 = infCTe.find(".//cte:toma4", namespaces=ns)
+            toma3 = campos['toma3']
+            toma4 = campos['toma4']
             
             if toma3 is not None:
                 # toma3: 0-Remetente, 1-Expedidor, 2-Recebedor, 3-Destinatário
-                papel = toma3.text 
-                tag_map = {'0': 'rem', '1': 'exped', '2': 'receb', '3': 'dest'}
+                papel = (toma3.text or "").strip()
+                tag_map = {'0': 'rem', '1': 'exped', '2': 'receb', '3': 'cte_dest'}
                 tag_toma = tag_map.get(papel)
                 if tag_toma:
-                    cnpj_toma = digits(infCTe.findtext(f".//cte:{tag_toma}/cte:CNPJ", namespaces=ns) or "")
+                    cnpj_toma = digits(campos[tag_toma] or "")
                     if cnpj_toma: 
                         dest_cnpj = cnpj_toma # Atribuímos ao destino para a lógica de 'Terceiros'
             
             elif toma4 is not None:
                 # toma4: Tomador indicado explicitamente (pode ser um terceiro)
-                cnpj_toma4 = digits(toma4.findtext(".//cte:CNPJ", namespaces=ns) or "")
+                cnpj_toma4 = digits(campos['toma4_cnpj'] or "")
                 if cnpj_toma4: 
                     dest_cnpj = cnpj_toma4
 
-        # Conversão de Data para objeto date para comparação
-        data_emissao = None
-        if data_str:
-            try:
-                # Pega YYYY-MM-DD
-                data_emissao = datetime.strptime(data_str[:10], '%Y-%m-%d').date()
-            except: 
-                pass
-
         return {
             'emit': emit_cnpj,
             'dest': dest_cnpj,
-            'data': data_emissao,
+            'data': _data_extrator(data_str),
             'cfops': cfops
         }
     except:
         return None
 
-def move_xml_para_destino_extrator(caminho_origem, nome_arquivo, pasta_destino, log_list):
+def categoria_xml_extrator(info, own_set, data_ini=None, data_fim=None, cfops_filtro=None, medidor=MEDIDOR_NULO):
+    """
+    Pasta de destino de um XML já analisado ('proprios', 'terceiros' ou
+    'outros'), ou None se os filtros de Data/CFOP o descartam.
+    """
+    # --- APLICAÇÃO DOS FILTROS ---
+    if data_ini and info['data'] and info['data'] < data_ini:
+        medidor.contar("extrator.filtrados")
+        return None
+    if data_fim and info['data'] and info['data'] > data_fim:
+        medidor.contar("extrator.filtrados")
+        return None
+    if cfops_filtro and not any(c in cfops_filtro for c in info['cfops']):
+        medidor.contar("extrator.filtrados")
+        return None
+
+    # --- CLASSIFICAÇÃO DE PASTAS ---
+    if info['emit'] in own_set:
+        categoria = 'proprios'
+    elif info['dest'] in own_set:
+        categoria = 'terceiros'
+    else:
+        categoria = 'outros'
+    medidor.contar(f"extrator.documentos.{categoria}")
+    return categoria
+
+def _data_extrator(data_str):
+    """Data de emissão ("YYYY-MM-DD..." do dhEmi/dEmi) como date, ou None."""
+    if not data_str:
+        return None
+    try:
+        return datetime.strptime(data_str[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+# --- Filtro antecipado (Data/CFOP antes do parse completo) ---
+_TAG_INF = {f"{{{NFE_NS_GLOBAL}}}infNFe": NFE_NS_GLOBAL, f"{{{CTE_NS_GLOBAL}}}infCTe": CTE_NS_GLOBAL}
+# Únicos elementos que o filtro olha (no lxml, os demais nem geram evento)
+_TAGS_FILTRO_PREVIO = tuple(_TAG_INF) + tuple(
+    f"{{{ns}}}{local}" for ns in (NFE_NS_GLOBAL, CTE_NS_GLOBAL) for local in ("ide", "dhEmi", "dEmi")
+) + ("{*}CFOP",)
+_BLOCO_FILTRO_PREVIO = 4 * 1024
+
+# Marca, no lugar do info, de XML descartado pelo filtro antecipado
+_FILTRADO_PREVIO = "filtrado"
+
+
+def passa_filtro_previo_extrator(xml_bytes, data_ini=None, data_fim=None, cfops_filtro=None):
+    """
+    Avalia os filtros de Data/CFOP lendo o XML aos poucos (pull parser), com
+    a mesma semântica de PLANO_EXTRATOR + categoria_xml_extrator, e para
+    assim que a resposta é certa: a data sai do ide, logo no início do
+    documento, e a busca de CFOP para no primeiro que estiver no filtro.
+
+    False = o documento seria descartado pelos filtros. True = passou ou é
+    inconclusivo; nesse caso o parse completo decide, como antes. Só descarta
+    depois de ler o XML até o fim sem erro: um XML truncado ou malformado com
+    data fora do período continua indo para o parse completo (e para Outros).
+    """
+    filtra_data = bool(data_ini or data_fim)
+    data_decidida = not filtra_data
+    cfop_ok = not cfops_filtro
+
+    parser = xml_backend.pull_parser(("start", "end"), tags=_TAGS_FILTRO_PREVIO)
+    pilha = []  # tags abertas (no lxml, só as de _TAGS_FILTRO_PREVIO)
+    inf_ns = None  # namespace do primeiro infNFe/infCTe aberto (só ele conta, como no plano)
+    datas_ide = {}  # nome local -> texto dentro do ide
+    descartar = False  # data fora do período: falta só confirmar que o XML é válido
+    try:
+        for i in range(0, len(xml_bytes), _BLOCO_FILTRO_PREVIO):
+            parser.feed(xml_bytes[i:i + _BLOCO_FILTRO_PREVIO])
+            eventos = parser.read_events()
+            if descartar:
+                for _ in eventos:
+                    pass
+                continue
+            for evento, el in eventos:
+                tag = el.tag
+                if not isinstance(tag, str):
+                    continue
+                if evento == "start":
+                    pilha.append(tag)
+                    if inf_ns is None and tag in _TAG_INF:
+                        inf_ns = _TAG_INF[tag]
+                    continue
+
+                pilha.pop()
+                uri, _, local = tag[1:].rpartition("}") if tag[:1] == "{" else ("", "", tag)
+
+                if not cfop_ok and local == "CFOP":
+                    cfop_ok = (el.text or "").strip() in cfops_filtro
+
+                elif not data_decidida and inf_ns is not None and uri == inf_ns:
+                    if local in ("dhEmi", "dEmi"):
+                        # ide/dhEmi: filho direto do ide
+                        if xml_backend.eh_lxml(el):
+                            pai = el.getparent()
+                            pai = pai.tag if pai is not None else None
+                        else:
+                            pai = pilha[-1] if pilha else None
+                        texto = (el.text or "").strip()
+                        if texto and pai == f"{{{inf_ns}}}ide":
+                            datas_ide.setdefault(local, texto)
+                    elif local == "ide" and datas_ide:
+                        # dhEmi tem preferência sobre dEmi (NF-e antiga); um ide basta
+                        data = _data_extrator(datas_ide.get("dhEmi") or datas_ide.get("dEmi"))
+                        if data and ((data_ini and data < data_ini) or (data_fim and data > data_fim)):
+                            descartar = True
+                            break
+                        data_decidida = True
+
+                if data_decidida and cfop_ok:
+                    return True
+        parser.close()
+    except xml_backend.ERROS_PARSE:
+        return True
+    # Fim do documento: data fora do período; sem data (não filtra por data),
+    # CFOP pedido e não achado
+    return not descartar and cfop_ok
+
+
+def move_xml_para_destino_extrator(caminho_origem, nome_arquivo, pasta_destino, log_list, medidor=MEDIDOR_NULO):
     """Copia o arquivo tratando duplicados de nome"""
     try:
-        nome_base, extensao = os.path.splitext(nome_arquivo)
-        caminho_destino_final = os.path.join(pasta_destino, nome_arquivo)
-        contador = 1
-        while os.path.exists(caminho_destino_final):
-            caminho_destino_final = os.path.join(pasta_destino, f"{nome_base}_{contador}{extensao}")
-            contador += 1
-        shutil.copy2(caminho_origem, caminho_destino_final)
+        with medidor.etapa("extrator.copiar_arquivos"):
+            nome_base, extensao = os.path.splitext(nome_arquivo)
+            caminho_destino_final = os.path.join(pasta_destino, nome_arquivo)
+            contador = 1
+            while os.path.exists(caminho_destino_final):
+                caminho_destino_final = os.path.join(pasta_destino, f"{nome_base}_{contador}{extensao}")
+                contador += 1
+            shutil.copy2(caminho_origem, caminho_destino_final)
     except Exception as e:
         log_list = log_message(log_list, f"AVISO: Falha ao copiar {nome_arquivo}: {e}")
     return log_list
 
 def extrair_e_classificar_extrator(caminho_pasta, pastas_destino, own_set, log_list, 
                                   extractors_map, supported_archives_list, 
-                                  data_ini=None, data_fim=None, cfops_filtro=None):
+                                  data_ini=None, data_fim=None, cfops_filtro=None, cache=None,
+                                  medidor=MEDIDOR_NULO):
     """
     Varre a pasta, extrai aninhados e classifica XMLs com filtros de Data e CFOP.
     """
@@ -123,7 +330,7 @@ def extrair_e_classificar_extrator(caminho_pasta, pastas_destino, own_set, log_l
         if os.path.isdir(item_caminho_completo):
             log_list, novos = extrair_e_classificar_extrator(
                 item_caminho_completo, pastas_destino, own_set, log_list, 
-                extractors_map, supported_archives_list, data_ini, data_fim, cfops_filtro
+                extractors_map, supported_archives_list, data_ini, data_fim, cfops_filtro, cache, medidor
             )
             arquivos_movidos += novos
             continue
@@ -133,65 +340,348 @@ def extrair_e_classificar_extrator(caminho_pasta, pastas_destino, own_set, log_l
         # 1. ARQUIVOS COMPACTADOS
         if extensao in supported_archives_list:
             log_list = log_message(log_list, f"Extraindo arquivo: {item_nome_sanitizado}...")
+            medidor.contar("extrator.compactados")
             pasta_temp = tempfile.mkdtemp(prefix=f"ext_{nome_base}_")
             try:
                 extract_func = extractors_map[extensao]
-                extract_func(item_caminho_completo, pasta_temp)
+                with medidor.etapa("extrator.descompactar"):
+                    extract_func(item_caminho_completo, pasta_temp)
                 log_list, novos = extrair_e_classificar_extrator(
                     pasta_temp, pastas_destino, own_set, log_list,
-                    extractors_map, supported_archives_list, data_ini, data_fim, cfops_filtro
+                    extractors_map, supported_archives_list, data_ini, data_fim, cfops_filtro, cache, medidor
                 )
                 arquivos_movidos += novos
             except Exception as e:
+                medidor.contar("extrator.falhas_descompactar")
                 log_list = log_message(log_list, f"AVISO: Falha ao extrair '{item_nome_sanitizado}': {e}")
-                log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['diversos'], log_list)
+                log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['diversos'], log_list, medidor)
             finally:
                 shutil.rmtree(pasta_temp, ignore_errors=True)
 
         # 2. ARQUIVOS XML
         elif extensao == '.xml':
-            info = parse_xml_full_data(item_caminho_completo)
+            medidor.contar("extrator.xmls")
+            with medidor.etapa("extrator.parse_xml"):
+                info = parse_xml_full_data(item_caminho_completo, cache=cache)
             if not info:
                 # Se o XML estiver corrompido ou sem as tags básicas, vai para Outros
-                log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['outros'], log_list)
+                medidor.contar("extrator.falhas_parse")
+                log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['outros'], log_list, medidor)
                 continue
 
-            # --- APLICAÇÃO DOS FILTROS ---
-            if data_ini and info['data'] and info['data'] < data_ini:
-                continue
-            if data_fim and info['data'] and info['data'] > data_fim:
+            categoria = categoria_xml_extrator(info, own_set, data_ini, data_fim, cfops_filtro, medidor)
+            if categoria is None:
                 continue
-            if cfops_filtro and not any(c in cfops_filtro for c in info['cfops']):
-                continue
-
-            # --- CLASSIFICAÇÃO DE PASTAS ---
-            if info['emit'] in own_set:
-                pasta_alvo = pastas_destino['proprios']
-            elif info['dest'] in own_set:
-                pasta_alvo = pastas_destino['terceiros']
-            else:
-                pasta_alvo = pastas_destino['outros']
 
-            log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pasta_alvo, log_list)
+            log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino[categoria], log_list, medidor)
             arquivos_movidos += 1
 
         # 3. ARQUIVOS DIVERSOS (PDF, TXT, ETC)
         else:
-            log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['diversos'], log_list)
+            medidor.contar("extrator.documentos.diversos")
+            log_list = move_xml_para_destino_extrator(item_caminho_completo, item_nome_sanitizado, pastas_destino['diversos'], log_list, medidor)
             arquivos_movidos += 1
 
     return log_list, arquivos_movidos
 
-def processar_extracao_cloud(uploaded_file, modo, cnpjs_proprios, data_ini=None, data_fim=None, cfops_filtro=None):
-    """Função principal integrada ao Streamlit"""
+class SaidaExtrator:
+    """
+    ZIP de saída do Extrator gravado direto, membro a membro: cada arquivo
+    vai para "categoria/nome" com a mesma regra de duplicados de
+    move_xml_para_destino_extrator (nome_1.ext, nome_2.ext, ...).
+    Com dedupe=True, um arquivo de conteúdo idêntico (BLAKE2b) a outro já
+    gravado é ignorado, em qualquer categoria.
+    """
+
+    def __init__(self, zf, medidor=MEDIDOR_NULO, dedupe=False):
+        self.zf = zf
+        self.medidor = medidor
+        self.dedupe = dedupe
+        self._usados = {}  # categoria -> nomes já gravados
+        self._conteudos = set()  # digests já gravados (dedupe)
+        # O zipfile não aceita duas gravações ao mesmo tempo (leitor e gravador em threads)
+        self._lock = threading.Lock()
+
+    def _arcname(self, categoria, nome_arquivo):
+        usados = self._usados.setdefault(categoria, set())
+        nome_base, extensao = os.path.splitext(nome_arquivo)
+        nome_final = nome_arquivo
+        contador = 1
+        while nome_final in usados:
+            nome_final = f"{nome_base}_{contador}{extensao}"
+            contador += 1
+        usados.add(nome_final)
+        return f"{categoria}/{nome_final}"
+
+    @staticmethod
+    def _digest(dados=None, abrir=None):
+        h = hashlib.blake2b(digest_size=16)
+        if dados is not None:
+            h.update(dados)
+        else:
+            with abrir() as src:
+                for bloco in iter(lambda: src.read(1024 * 1024), b""):
+                    h.update(bloco)
+        return h.digest()
+
+    def gravar(self, categoria, nome_arquivo, log_list, *, dados=None, abrir=None, tamanho=0, data_hora=None):
+        """Grava `dados` (bytes) ou o conteúdo de `abrir()` (copiado em blocos)."""
+        try:
+            digest = None
+            if self.dedupe:
+                with self.medidor.etapa("extrator.dedupe"):
+                    digest = self._digest(dados, abrir)
+            with self._lock, self.medidor.etapa("extrator.copiar_arquivos"):
+                if digest is not None:
+                    if digest in self._conteudos:
+                        self.medidor.contar("extrator.duplicados_ignorados")
+                        return log_list
+                    self._conteudos.add(digest)
+                if not data_hora or data_hora[0] < 1980:
+                    data_hora = time.localtime()[:6]
+                zinfo = zipfile.ZipInfo(self._arcname(categoria, nome_arquivo), date_time=data_hora)
+                zinfo.external_attr = 0o100644 << 16
+                if dados is not None:
+                    self.zf.writestr(zinfo, dados)
+                else:
+                    with abrir() as src, self.zf.open(zinfo, "w", force_zip64=tamanho >= zipfile.ZIP64_LIMIT) as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+        except Exception as e:
+            log_list = log_message(log_list, f"AVISO: Falha ao copiar {nome_arquivo}: {e}")
+        return log_list
+
+def _xmls_compactado_extrator(origem, tipo, saida, log_list, medidor, orcamento, contagem):
+    """
+    Percorre o compactado e os aninhados na mesma ordem do modo serial:
+    arquivos diversos (e aninhados que falham) são gravados na hora; cada
+    XML é gerado como (nome, data_hora, bytes) para análise e gravação.
+    """
+    for nome, tamanho, data_hora, abrir in iter_membros(origem, tipo, orcamento):
+        item_nome_sanitizado = nome.rstrip(' \\/').rsplit('/', 1)[-1].rstrip(' \\/')
+        if not item_nome_sanitizado:
+            continue
+        nome_base, extensao = os.path.splitext(item_nome_sanitizado.lower())
+
+        # 1. ARQUIVOS COMPACTADOS
+        if extensao in EXTENSOES_COMPACTADAS:
+            log_message(log_list, f"Extraindo arquivo: {item_nome_sanitizado}...")
+            medidor.contar("extrator.compactados")
+            try:
+                with abrir_membro_seekable(abrir, tamanho, orcamento) as f:
+                    yield from _xmls_compactado_extrator(f, extensao, saida, log_list, medidor, orcamento, contagem)
+            except Exception as e:
+                medidor.contar("extrator.falhas_descompactar")
+                log_message(log_list, f"AVISO: Falha ao extrair '{item_nome_sanitizado}': {e}")
+                saida.gravar('diversos', item_nome_sanitizado, log_list,
+                             abrir=abrir, tamanho=tamanho, data_hora=data_hora)
+
+        # 2. ARQUIVOS XML
+        elif extensao == '.xml':
+            medidor.contar("extrator.xmls")
+            with medidor.etapa("extrator.descompactar"):
+                with abrir() as f:
+                    dados = f.read()
+            yield item_nome_sanitizado, data_hora, dados
+
+        # 3. ARQUIVOS DIVERSOS (PDF, TXT, ETC)
+        else:
+            medidor.contar("extrator.documentos.diversos")
+            saida.gravar('diversos', item_nome_sanitizado, log_list,
+                         abrir=abrir, tamanho=tamanho, data_hora=data_hora)
+            contagem['diversos'] += 1
+
+def _filtrar_e_analisar_extrator(xml_bytes, filtro, medidor, cache=None):
+    """info do XML, ou _FILTRADO_PREVIO se o filtro antecipado já o descarta."""
+    if filtro is not None:
+        with medidor.etapa("extrator.filtro_previo"):
+            passou = passa_filtro_previo_extrator(xml_bytes, *filtro)
+        if not passou:
+            return _FILTRADO_PREVIO
+    with medidor.etapa("extrator.parse_xml"):
+        return parse_xml_bytes_com_cache(xml_bytes, cache)
+
+def _analisar_lote_extrator(lote, filtro=None, medir=False):
+    """
+    Executado nos processos filhos: analisa um lote de bytes de XML.
+    Retorna (infos, relatório do Medidor do filho ou None).
+    """
+    medidor = Medidor() if medir else MEDIDOR_NULO
+    infos = [_filtrar_e_analisar_extrator(xml_bytes, filtro, medidor) for xml_bytes in lote]
+    return infos, (medidor.relatorio() if medir else None)
+
+def _iter_analisados_extrator(xmls, cache, medidor, workers, tamanho_lote, filtro=None):
+    """
+    Gera (nome, data_hora, bytes, info) na ordem de `xmls`. Com workers > 1
+    o parse roda em um pool de processos, em lotes consumidos na ordem em
+    que foram enviados: nomes de saída e logs ficam iguais aos do serial.
+    filtro = (data_ini, data_fim, cfops_filtro) liga o filtro antecipado nos
+    XMLs fora do cache (info = _FILTRADO_PREVIO quando descartados).
+    """
+    def _buscar(xml_bytes):
+        """(hash, achado, info) — hash None sem cache."""
+        if cache is None:
+            return None, False, None
+        h = hash_xml(xml_bytes)
+        return (h,) + _ler_cache_extrator(cache, xml_bytes, h)
+
+    if workers <= 1:
+        for nome, data_hora, dados in xmls:
+            h, achado, info = _buscar(dados)
+            if not achado:
+                info = _filtrar_e_analisar_extrator(dados, filtro, medidor)
+                if cache is not None and info != _FILTRADO_PREVIO:
+                    _gravar_cache_extrator(cache, dados, h, info)
+            yield nome, data_hora, dados, info
+        return
+
+    def _concluir(lote, infos, futuro):
+        if futuro is not None:
+            with medidor.etapa("extrator.espera_processos"):
+                novos, relatorio = futuro.result()
+            medidor.mesclar(relatorio)
+            novos = iter(novos)
+            for i, (h, achado, _info) in enumerate(infos):
+                if not achado:
+                    info = next(novos)
+                    infos[i] = (h, True, info)
+                    if cache is not None and info != _FILTRADO_PREVIO:
+                        _gravar_cache_extrator(cache, lote[i][2], h, info)
+        for (nome, data_hora, dados), (_h, _achado, info) in zip(lote, infos):
+            yield nome, data_hora, dados, info
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pendentes = deque()
+        xmls = iter(xmls)
+        while lote := list(islice(xmls, tamanho_lote)):
+            infos = [_buscar(dados) for _nome, _data_hora, dados in lote]
+            faltantes = [dados for (_n, _d, dados), (_h, achado, _i) in zip(lote, infos) if not achado]
+            futuro = (
+                executor.submit(_analisar_lote_extrator, faltantes, filtro, medidor is not MEDIDOR_NULO)
+                if faltantes
+                else None
+            )
+            pendentes.append((lote, infos, futuro))
+            # Limita os lotes em voo para não ler o compactado inteiro para a memória
+            if len(pendentes) >= workers * 2:
+                yield from _concluir(*pendentes.popleft())
+        while pendentes:
+            yield from _concluir(*pendentes.popleft())
+
+def classificar_compactado_extrator(origem, tipo, saida, own_set, log_list,
+                                    data_ini=None, data_fim=None, cfops_filtro=None, cache=None,
+                                    medidor=MEDIDOR_NULO, orcamento=None, workers=1, tamanho_lote=200):
+    """
+    Versão em fluxo de extrair_e_classificar_extrator: lê os membros do
+    zip/7z `origem` (e dos compactados aninhados) e grava cada um direto na
+    categoria da SaidaExtrator, sem pastas temporárias nem cópias em disco.
+    Um aninhado que falha vai inteiro para 'diversos' (os membros dele já
+    lidos até a falha continuam na saída).
+    workers > 1 distribui o parse dos XMLs em processos (lotes de
+    tamanho_lote) e põe a leitura do compactado numa thread à frente; os
+    XMLs continuam gravados por um só consumidor, na ordem do serial.
+    """
+    orcamento = orcamento or OrcamentoMemoria()
+    contagem = {'diversos': 0}  # somado pela leitura (pode estar em outra thread)
+    movidos = 0
+    xmls = _xmls_compactado_extrator(origem, tipo, saida, log_list, medidor, orcamento, contagem)
+    if workers > 1:
+        xmls = ler_adiante(xmls, limite=max(1, tamanho_lote) * 2)
+
+    filtro = (data_ini, data_fim, cfops_filtro) if (data_ini or data_fim or cfops_filtro) else None
+    analisados = _iter_analisados_extrator(xmls, cache, medidor, workers, max(1, tamanho_lote), filtro)
+    for nome, data_hora, dados, info in analisados:
+        if info == _FILTRADO_PREVIO:
+            medidor.contar("extrator.filtrados")
+            medidor.contar("extrator.filtrados_antes_parse")
+            continue
+        if not info:
+            # Se o XML estiver corrompido ou sem as tags básicas, vai para Outros
+            medidor.contar("extrator.falhas_parse")
+            saida.gravar('outros', nome, log_list, dados=dados, data_hora=data_hora)
+            continue
+
+        categoria = categoria_xml_extrator(info, own_set, data_ini, data_fim, cfops_filtro, medidor)
+        if categoria is None:
+            continue
+        saida.gravar(categoria, nome, log_list, dados=dados, data_hora=data_hora)
+        movidos += 1
+
+    return log_list, movidos + contagem['diversos']
+
+def juntar_compactado_extrator(origem, tipo, saida, log_list, medidor=MEDIDOR_NULO, orcamento=None):
+    """
+    Modo "Juntar Tudo": achata o compactado e os aninhados num só ZIP, XMLs
+    em 'outros' e o resto em 'diversos', sem parsear nenhum XML (sem CNPJs
+    próprios nem filtros, a classificação daria 'outros' para todos).
+    """
+    orcamento = orcamento or OrcamentoMemoria()
+    contagem = {'diversos': 0}
+    movidos = 0
+    for nome, data_hora, dados in _xmls_compactado_extrator(origem, tipo, saida, log_list, medidor, orcamento, contagem):
+        medidor.contar("extrator.documentos.outros")
+        saida.gravar('outros', nome, log_list, dados=dados, data_hora=data_hora)
+        movidos += 1
+    return log_list, movidos + contagem['diversos']
+
+def processar_extracao_cloud(uploaded_file, modo, cnpjs_proprios, data_ini=None, data_fim=None, cfops_filtro=None, cache=None,
+                             medidor=None, em_disco=False, workers=1, tamanho_lote=200, dedupe=False,
+                             orcamento_memoria=ORCAMENTO_MEMORIA_PADRAO):
+    """
+    Função principal integrada ao Streamlit.
+    medidor (core.instrumentacao.Medidor) recebe tempos por etapa e contadores.
+    Os membros vão do compactado enviado (.zip ou .7z) direto para o ZIP de
+    retorno; em_disco=True usa o fluxo antigo, que extrai tudo para pastas.
+    workers > 1 distribui o parse dos XMLs em processos (lotes de tamanho_lote XMLs).
+    dedupe=True deixa de fora arquivos de conteúdo idêntico a um já gravado.
+    Compactados aninhados e membros de 7z ficam em memória até somarem
+    orcamento_memoria bytes; acima disso vão para arquivo temporário.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    if em_disco:
+        return _processar_extracao_em_disco(
+            uploaded_file, modo, cnpjs_proprios, data_ini, data_fim, cfops_filtro, cache, medidor
+        )
+    logs = []
+    own_set = {digits(c) for c in (cnpjs_proprios or [])}
+
+    buffer = uploaded_file.getbuffer()
+    medidor.contar("extrator.bytes_lidos", len(buffer))
+    tipo = tipo_por_assinatura(bytes(buffer[:8])) or ".zip"
+    if isinstance(uploaded_file, io.IOBase) and uploaded_file.seekable():
+        # UploadedFile do Streamlit já é um BytesIO: lido no lugar, sem cópia
+        entrada = uploaded_file
+        entrada.seek(0)
+    else:
+        entrada = io.BytesIO(buffer)
+
+    orcamento = OrcamentoMemoria(orcamento_memoria)
+    output_zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_zip_buffer, "w") as zf:
+        saida = SaidaExtrator(zf, medidor, dedupe=dedupe)
+        if modo == 'Separar pelo Emitente (Classificação)':
+            logs, total = classificar_compactado_extrator(
+                entrada, tipo, saida, own_set, logs, data_ini, data_fim, cfops_filtro, cache, medidor,
+                orcamento, workers=workers, tamanho_lote=tamanho_lote
+            )
+        else:
+            # Modo Juntar Tudo: XMLs para outros, o resto para diversos, sem parse
+            logs, total = juntar_compactado_extrator(entrada, tipo, saida, logs, medidor, orcamento)
+
+    return output_zip_buffer.getvalue(), logs
+
+def _processar_extracao_em_disco(uploaded_file, modo, cnpjs_proprios, data_ini, data_fim, cfops_filtro, cache, medidor):
+    """Fluxo original: grava o upload, extrai para pastas e monta o ZIP no fim."""
     logs = []
     own_set = {digits(c) for c in (cnpjs_proprios or [])}
     output_zip_buffer = io.BytesIO()
 
     with tempfile.TemporaryDirectory() as tmp_dir:
         input_path = os.path.join(tmp_dir, "entrada.zip")
-        with open(input_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        with medidor.etapa("extrator.gravar_upload"):
+            buffer = uploaded_file.getbuffer()
+            medidor.contar("extrator.bytes_lidos", len(buffer))
+            with open(input_path, "wb") as f:
+                f.write(buffer)
 
         pasta_extracao = os.path.join(tmp_dir, "extraido")
         pastas_destino = {
@@ -209,25 +699,28 @@ def processar_extracao_cloud(uploaded_file, modo, cnpjs_proprios, data_ini=None,
         supported = [".zip", ".7z"]
 
         # Extração inicial
-        with zipfile.ZipFile(input_path, 'r') as z:
-            z.extractall(pasta_extracao)
+        with medidor.etapa("extrator.descompactar"):
+            with zipfile.ZipFile(input_path, 'r') as z:
+                z.extractall(pasta_extracao)
 
         if modo == 'Separar pelo Emitente (Classificação)':
             logs, total = extrair_e_classificar_extrator(
                 pasta_extracao, pastas_destino, own_set, logs, extractors_map, supported,
-                data_ini, data_fim, cfops_filtro
+                data_ini, data_fim, cfops_filtro, cache, medidor
             )
         else:
             # Modo Juntar Tudo (simplificado, move tudo para outros/diversos)
             logs, total = extrair_e_classificar_extrator(
-                pasta_extracao, pastas_destino, set(), logs, extractors_map, supported
+                pasta_extracao, pastas_destino, set(), logs, extractors_map, supported,
+                cache=cache, medidor=medidor
             )
 
         # ZIP de retorno
-        with zipfile.ZipFile(output_zip_buffer, "w") as zf:
-            for cat, p in pastas_destino.items():
-                for root_dir, _, files in os.walk(p):
-                    for f in files:
-                        zf.write(os.path.join(root_dir, f), arcname=os.path.join(cat, f))
+        with medidor.etapa("extrator.zip_saida"):
+            with zipfile.ZipFile(output_zip_buffer, "w") as zf:
+                for cat, p in pastas_destino.items():
+                    for root_dir, _, files in os.walk(p):
+                        for f in files:
+                            zf.write(os.path.join(root_dir, f), arcname=os.path.join(cat, f))
 
     return output_zip_buffer.getvalue(), logs
\ No newline at end of file
@@ -1,8 +1,13 @@
 import io
 import zipfile
 import xml.etree.ElementTree as ET
+from core import xml_backend
+from core.instrumentacao import MEDIDOR_NULO
 
-def split_nfse_abrasf(xml_bytes: bytes, filename_original="nota.xml", prefix="sep_"):
+def split_nfse_abrasf(xml_bytes: bytes, filename_original="nota.xml", prefix="sep_", medidor=None):
+    medidor = medidor or MEDIDOR_NULO
+    medidor.contar("nfse_split.arquivos")
+    medidor.contar("nfse_split.bytes_lidos", len(xml_bytes))
     xml_text = None
     try:
         xml_text = xml_bytes.decode('utf-8')
@@ -16,8 +21,10 @@ def split_nfse_abrasf(xml_bytes: bytes, filename_original="nota.xml", prefix="se
         if xml_text:
             xml_text = xml_text.replace('encoding="iso-8859-1"', 'encoding="utf-8"')
             xml_text = xml_text.replace('encoding="ISO-8859-1"', 'encoding="utf-8"')
-        root = ET.fromstring(xml_text)
+        with medidor.etapa("nfse_split.parse_xml"):
+            root = xml_backend.fromstring(xml_text)
     except Exception:
+        medidor.contar("nfse_split.falhas_parse")
         return [(filename_original, xml_bytes)]
 
     saida = []
@@ -38,54 +45,58 @@ def split_nfse_abrasf(xml_bytes: bytes, filename_original="nota.xml", prefix="se
     # Padrões de blocos solicitados
     tags_bloco_nota = ['CompNfse', 'Nfse', 'nfdok', 'Reg20Item']
     
-    candidatos_brutos = [elem for elem in root.iter() if get_local_tag(elem.tag) in tags_bloco_nota]
-    
-    # Filtro pai-filho para evitar duplicidade
-    blocos_finais = []
-    for i, cand in enumerate(candidatos_brutos):
-        is_child = False
-        for j, outro in enumerate(candidatos_brutos):
-            if i != j:
-                if any(cand is child for child in outro.iter()):
-                    is_child = True
-                    break
-        if not is_child:
-            blocos_finais.append(cand)
+    with medidor.etapa("nfse_split.localizar_notas"):
+        # Filtro pai-filho para evitar duplicidade: só os blocos mais externos
+        # (não desce dentro de um bloco já encontrado), em ordem de documento
+        blocos_finais = []
+        pendentes = [root]
+        while pendentes:
+            elem = pendentes.pop()
+            if get_local_tag(elem.tag) in tags_bloco_nota:
+                blocos_finais.append(elem)
+                continue
+            pendentes.extend(reversed(elem))
 
-    # Tags de busca
-    tags_numero = ['Numero', 'NumeroNota', 'NumNf']
-    # Adicionamos 'Cnpj' explicitamente para capturar mesmo em níveis profundos
-    tags_cnpj = ['Cnpj', 'CpfCnpj', 'ClienteCNPJCPF', 'CpfCnpjPre']
+        # Tags de busca
+        tags_numero = ['Numero', 'NumeroNota', 'NumNf']
+        # Adicionamos 'Cnpj' explicitamente para capturar mesmo em níveis profundos
+        tags_cnpj = ['Cnpj', 'CpfCnpj', 'ClienteCNPJCPF', 'CpfCnpjPre']
 
-    blocos_validos = []
-    for bloco in blocos_finais:
-        num_nota = find_deep_text(bloco, tags_numero)
-        if num_nota and num_nota not in numeros_processados:
-            blocos_validos.append(bloco)
-            numeros_processados.add(num_nota)
+        blocos_validos = []
+        for bloco in blocos_finais:
+            num_nota = find_deep_text(bloco, tags_numero)
+            if num_nota and num_nota not in numeros_processados:
+                blocos_validos.append(bloco)
+                numeros_processados.add(num_nota)
 
     if len(blocos_validos) <= 1:
         return [(filename_original, xml_bytes)]
 
-    for nota in blocos_validos:
-        numero = find_deep_text(nota, tags_numero)
-        # O find_deep_text agora varrerá até encontrar o <Cnpj> dentro de <CpfCnpj>
-        cnpj = find_deep_text(nota, tags_cnpj) or "sem_cnpj"
+    with medidor.etapa("nfse_split.serializar"):
+        for nota in blocos_validos:
+            numero = find_deep_text(nota, tags_numero)
+            # O find_deep_text agora varrerá até encontrar o <Cnpj> dentro de <CpfCnpj>
+            cnpj = find_deep_text(nota, tags_cnpj) or "sem_cnpj"
         
-        cnpj_clean = "".join(filter(str.isalnum, cnpj))
-        filename = f"{prefix}{cnpj_clean}_{numero}.xml"
+            cnpj_clean = "".join(filter(str.isalnum, cnpj))
+            filename = f"{prefix}{cnpj_clean}_{numero}.xml"
         
-        try:
-            xml_out = ET.tostring(nota, encoding="utf-8", xml_declaration=True)
-            saida.append((filename, xml_out))
-        except Exception:
-            continue
+            try:
+                # Serialização sempre pelo ElementTree (aceita elementos do lxml),
+                # para a saída não depender do backend
+                xml_out = ET.tostring(nota, encoding="utf-8", xml_declaration=True)
+                saida.append((filename, xml_out))
+            except Exception:
+                continue
 
+    medidor.contar("nfse_split.notas_separadas", len(saida))
     return saida
 
-def make_zip_bytes(files: list[tuple[str, bytes]]) -> bytes:
+def make_zip_bytes(files: list[tuple[str, bytes]], medidor=None) -> bytes:
+    medidor = medidor or MEDIDOR_NULO
     buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for name, content in files:
-            z.writestr(name, content)
+    with medidor.etapa("nfse_split.zip_saida"):
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            for name, content in files:
+                z.writestr(name, content)
     return buf.getvalue()
\ No newline at end of file
@@ -1,10 +1,22 @@
 # logic_resumo.py
 import zipfile
-from io import BytesIO
-import xml.etree.ElementTree as ET
 import re
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from parsers.router import detect_and_parse_nfse
+from parsers.sniffer import CTE, EVENTO, INUT, NFE, NFSE_ABRASF, NFSE_PREFEITURA, sniff_bytes
+from schemas.resumo import ResultadoResumo
+from core.chave_acesso import buscar_chave_acesso, chave_do_id
+from core.cache_parse import CacheParse, hash_xml
+from core.arquivos import ORCAMENTO_MEMORIA_PADRAO, OrcamentoMemoria, iter_xml_compactado
+from core.tabela_documentos import TabelaDocumentos
+from core.dedupe import IndiceChaves
+from core.instrumentacao import MEDIDOR_NULO, Medidor
+from core.plano_extracao import PlanoExtracao
+from core import xml_backend
+from core.xml_backend import Consulta
 
 
 import pandas as pd
@@ -23,6 +35,9 @@ def _digits(s: str) -> str:
 def _mask_cnpj(d: str) -> str:
     return mask_cnpj(d)
 
+# Mudou a extração? Incrementar para invalidar o cache persistente.
+VERSAO_PARSER_RESUMO = "resumo-2"
+
 NS_RESUMO = {
     "ns": "http://www.portalfiscal.inf.br/nfe",
     "nfe": "http://www.portalfiscal.inf.br/nfe",
@@ -30,26 +45,17 @@ NS_RESUMO = {
 }
 
 
-def iter_xml_from_zip_resumo(zf: zipfile.ZipFile, *, max_depth: int = 3):
-    """Gera tuplas (nome_arquivo, bytes_xml) para XMLs em zips (Aba 2)"""
-    if max_depth < 0:
-        return
-    for name in zf.namelist():
-        lname = name.lower()
-        if lname.endswith(".xml"):
-            try:
-                yield name, zf.read(name)
-            except Exception:
-                continue
-        elif lname.endswith(".zip"):
-            try:
-                inner_bytes = zf.read(name)
-                with zipfile.ZipFile(BytesIO(inner_bytes), "r") as inner_zf:
-                    yield from iter_xml_from_zip_resumo(
-                        inner_zf, max_depth=max_depth - 1
-                    )
-            except Exception:
-                continue
+def iter_xml_from_zip_resumo(
+    zf: zipfile.ZipFile, *, max_depth: int = 3, orcamento_memoria: int = ORCAMENTO_MEMORIA_PADRAO
+):
+    """
+    Gera tuplas (nome_arquivo, bytes_xml) para XMLs em zips (Aba 2).
+    Desce em .zip e .7z aninhados; compactados internos maiores que
+    orcamento_memoria são lidos via arquivo temporário, sem ficar na RAM.
+    """
+    yield from iter_xml_compactado(
+        zf, ".zip", max_depth=max_depth, orcamento=OrcamentoMemoria(orcamento_memoria)
+    )
 
 
 def _localname_resumo(tag: str) -> str:
@@ -75,41 +81,113 @@ def _find_first_local_resumo(root, names):
     return cur[0]
 
 
-def _findtext_any_resumo(root, xpath_prefixed, fallback_names):
-    if root is None:
-        return ""
-    el = root.find(xpath_prefixed, NS_RESUMO)
-    if el is not None and el.text is not None:
-        return el.text
-    el2 = _find_first_local_resumo(root, fallback_names)
-    return el2.text if el2 is not None and el2.text is not None else ""
+def _periodo_resumo(dhEmi: str):
+    """Converte dhEmi/dEmi em (ano, mes, data_str)."""
+    ano = mes = None
+    data_str = ""
+    if dhEmi:
+        try:
+            dt = datetime.fromisoformat(dhEmi.replace("Z", "+00:00"))
+            ano, mes = dt.year, dt.month
+            data_str = dt.date().isoformat()
+        except Exception:
+            m = re.search(r"(\d{4})[-/]?(\d{2})[-/]?(\d{2})?", dhEmi)
+            if m:
+                ano = int(m.group(1))
+                mes = int(m.group(2))
+                dia = m.group(3)
+                data_str = (
+                    f"{ano:04d}-{mes:02d}-{int(dia):02d}"
+                    if dia
+                    else f"{ano:04d}-{mes:02d}-01"
+                )
+    return ano, mes, data_str
+
+
+# Tipos (parsers.sniffer) que não têm infNFe/infCTe
+_TIPOS_SEM_CABECALHO_RESUMO = (NFSE_ABRASF, NFSE_PREFEITURA, EVENTO, INUT)
+
+# Campos do cabeçalho de NFe/CTe, resolvidos numa única passada pela árvore.
+# Nomes locais sem diferenciar caixa (há emissores com infCte, p.ex.).
+PLANO_CABECALHO_RESUMO = PlanoExtracao(
+    {
+        "inf": ("infNFe", "infCTe"),
+        "id": ("infNFe@Id", "infCTe@Id"),
+        "mod": ("infNFe//ide/mod", "infCTe//ide/mod"),
+        "emit": ("infNFe/emit/CNPJ", "infCTe/emit/CNPJ", "infNFe/emit/CPF", "infCTe/emit/CPF"),
+        "dest": ("infNFe/dest/CNPJ", "infCTe/dest/CNPJ", "infNFe/dest/CPF", "infCTe/dest/CPF"),
+        "ch_prot": ("protNFe/infProt/chNFe", "protCTe/infProt/chCTe"),
+        "dhEmi": ("infNFe//ide/dhEmi", "infCTe//ide/dhEmi", "infNFe//ide/dEmi", "infCTe//ide/dEmi"),
+        # CFOP do detalhe: 1º item da NFe ou o do cabeçalho do CTe
+        "cfop": ("det/prod/CFOP", "infCTe/ide/CFOP"),
+    },
+    elementos=("inf",),
+    ignorar_caixa=True,
+    podar=("det",),
+)
+
+
+def _chave_resumo(cab: dict, xml_bytes: bytes) -> str:
+    """
+    Resolve a chave de acesso em uma única etapa:
+      1) protNFe/infProt/chNFe (ou protCTe/infProt/chCTe)
+      2) atributo Id de infNFe/infCTe
+      3) primeira sequência de 44 dígitos com DV válido nos bytes originais
+    """
+    if cab["ch_prot"]:
+        return cab["ch_prot"]
+
+    chave = chave_do_id(cab["id"])
+    if chave:
+        return chave
+
+    return buscar_chave_acesso(xml_bytes)
 
 
 # --- ATUALIZADO (PATCH 2): Função _parse_fields_resumo (lógica de CTe e Eventos) ---
-def _parse_fields_resumo(xml_bytes: bytes):
-    """Extrai campos essenciais (Aba 2) para resumo/detalhe/itens."""
+def _parse_fields_resumo(xml_bytes: bytes, *, incremental: bool = False, medidor=MEDIDOR_NULO):
+    """
+    Extrai campos essenciais (Aba 2) para resumo/detalhe/itens.
+    Com incremental=True, NFe/CTe são lidos só até o fim do cabeçalho
+    (ver _parse_fields_incremental_resumo).
+    """
+    tipo = sniff_bytes(xml_bytes)
+    if incremental and tipo in (NFE, CTE, None):
+        campos = _parse_fields_incremental_resumo(xml_bytes)
+        if campos is not None:
+            return campos
     try:
-        root = ET.fromstring(xml_bytes)
+        root = xml_backend.fromstring(xml_bytes)
     except Exception:
+        medidor.contar("resumo.falhas_parse")
         return None, None, None, None, (None, None), ""
+    return _parse_fields_root_resumo(root, xml_bytes, medidor, tipo=tipo)
+
 
-    # 1) Tenta localizar infNFe ou infCTe de forma flexível
+def _parse_fields_root_resumo(root, xml_bytes: bytes, medidor=MEDIDOR_NULO, *, tipo=None, cab=None):
+    """
+    Mesma extração de _parse_fields_resumo, mas sobre uma árvore já montada.
+    `tipo` é a classificação de parsers.sniffer (calculada aqui se omitida):
+    NFS-e vai direto para o roteador com a mesma árvore; eventos e
+    inutilizações nem procuram infNFe/infCTe. `cab` é o registro de
+    PLANO_CABECALHO_RESUMO, se quem chama já o extraiu.
+    """
+    if tipo is None:
+        tipo = sniff_bytes(xml_bytes)
+
+    # 1) Localiza infNFe/infCTe e lê o cabeçalho numa passada só.
     # Isso cobre tanto o modelo completo <nfeProc> quanto o modelo apenas com <NFe>
-    inf = (
-        root.find(".//ns:infNFe", NS_RESUMO)
-        or root.find(".//nfe:infNFe", NS_RESUMO)
-        or root.find(".//cte:infCTe", NS_RESUMO)
-        or _find_first_local_resumo(root, ["NFe", "infNFe"])
-        or _find_first_local_resumo(root, ["infNFe"])
-        or _find_first_local_resumo(root, ["CTe", "infCTe"])
-        or _find_first_local_resumo(root, ["infCTe"])
-    )
+    inf = None
+    if tipo not in _TIPOS_SEM_CABECALHO_RESUMO:
+        if cab is None:
+            cab = PLANO_CABECALHO_RESUMO.extrair(root)
+        inf = cab["inf"]
 
-    # 2) Se não achou NFe/CTe, tenta NFSe
-    if inf is None:    
+    # 2) Se não achou NFe/CTe, tenta NFSe (na mesma árvore, sem novo parse)
+    if inf is None and tipo not in (EVENTO, INUT):
         try:
-            xml_text = xml_bytes.decode("utf-8", errors="ignore")
-            nfse_obj = detect_and_parse_nfse(xml_text)
+            with medidor.etapa("resumo.deteccao_nfse"):
+                nfse_obj = detect_and_parse_nfse(root, tipo)
             if nfse_obj:
                 numero = (nfse_obj.numero or "").strip()
                 verif = (nfse_obj.codigo_verificacao or "").strip()
@@ -150,127 +228,20 @@ def _parse_fields_resumo(xml_bytes: bytes):
             return None, None, "INUT", None, (None, None), ""
         return None, None, None, None, (None, None), ""
 
-    # 4) Extração da CHAVE (Crucial para o arquivo sem <protNFe>)
-    chave = ""
-    # Tenta primeiro pelo protocolo (presente em arquivos completos como o da SNR)
-    ch_node = (
-        root.find(".//ns:protNFe/ns:infProt/ns:chNFe", NS_RESUMO)
-        or root.find(".//nfe:protNFe/nfe:infProt/nfe:chNFe", NS_RESUMO)
-        or root.find(".//cte:protCTe/cte:infProt/cte:chCTe", NS_RESUMO)
-    )
-    if ch_node is not None and ch_node.text:
-        chave = ch_node.text.strip()
-    
-    # Fallback: Se não tem protocolo (caso da Radar), extrai do atributo 'Id' da tag inf
-    if not chave:
-        val_id = inf.get("Id") or ""
-        # Remove letras ("NFe", "CTe") e deixa apenas os 44 números
-        chave = re.sub(r"\D", "", val_id)
-        
-    # 5) IDE + modelo
-    ide = (
-        inf.find(".//ns:ide", NS_RESUMO)
-        or inf.find(".//nfe:ide", NS_RESUMO)
-        or inf.find(".//cte:ide", NS_RESUMO)
-        or _find_first_local_resumo(inf, ["ide"])
-    )
-
-    modelo = ""
-    if ide is not None:
-        mod_el = (
-            ide.find("ns:mod", NS_RESUMO)
-            or ide.find("nfe:mod", NS_RESUMO)
-            or ide.find("cte:mod", NS_RESUMO)
-            or _find_first_local_resumo(ide, ["mod"])
-        )
-        if mod_el is not None and mod_el.text:
-            modelo = mod_el.text.strip()
-
+    # 4) Modelo
+    modelo = cab["mod"] or ""
     if modelo and modelo not in ACCEPTED_MODELS_GLOBAL:
         modelo = "OUT"
 
-    # 3) Emitente (CNPJ ou CPF)
-    emit_cnpj = ""
-    emit_node = (
-        inf.find("ns:emit", NS_RESUMO)
-        or inf.find("nfe:emit", NS_RESUMO)
-        or inf.find("cte:emit", NS_RESUMO)
-        or _find_first_local_resumo(inf, ["emit"])
-    )
-    if emit_node is not None:
-        txt = (
-            _findtext_any_resumo(emit_node, "ns:CNPJ", ["CNPJ"])
-            or _findtext_any_resumo(emit_node, "ns:CPF", ["CPF"])
-        )
-        emit_cnpj = _digits(txt)
-
-    # 4) Destinatário (CNPJ ou CPF)
-    dest_cnpj = ""
-    dest_node = (
-        inf.find("ns:dest", NS_RESUMO)
-        or inf.find("nfe:dest", NS_RESUMO)
-        or inf.find("cte:dest", NS_RESUMO)
-        or _find_first_local_resumo(inf, ["dest"])
-    )
-    if dest_node is not None:
-        txt = (
-            _findtext_any_resumo(dest_node, "ns:CNPJ", ["CNPJ"])
-            or _findtext_any_resumo(dest_node, "ns:CPF", ["CPF"])
-        )
-        dest_cnpj = _digits(txt)
-
-    # 5) Chave (usa protocolo, Id ou regex de 44 dígitos)
-    chave = ""
-    ch = (
-        root.find(".//ns:protNFe/ns:infProt/ns:chNFe", NS_RESUMO)
-        or root.find(
-            ".//nfe:protNFe/nfe:infProt/nfe:chNFe", NS_RESUMO
-        )
-        or root.find(".//cte:protCTe/cte:infProt/cte:chCTe", NS_RESUMO)
-    )
-    if ch is not None and ch.text:
-        chave = ch.text.strip()
-
-    if not chave:
-        _id = inf.get("Id") or ""
-        if _id:
-            chave = (
-                _id.replace("NFe", "")
-                .replace("nfe", "")
-                .replace("CTe", "")
-                .replace("cte", "")
-                .strip()
-            )
+    # 5) Emitente / destinatário (CNPJ ou CPF)
+    emit_cnpj = _digits(cab["emit"] or "")
+    dest_cnpj = _digits(cab["dest"] or "")
 
-    if not chave:
-        m = re.search(r"\d{44}", ET.tostring(root, encoding="unicode"))
-        if m:
-            chave = m.group(0)
+    # 6) Chave (usa protocolo, Id ou busca de 44 dígitos nos bytes)
+    chave = _chave_resumo(cab, xml_bytes)
 
-    # 6) Data / período (ano, mês)
-    ano = mes = None
-    data_str = ""
-    if ide is not None:
-        dhEmi = (
-            _findtext_any_resumo(ide, "ns:dhEmi", ["dhEmi"])
-            or _findtext_any_resumo(ide, "ns:dEmi", ["dEmi"])
-        )
-        if dhEmi:
-            try:
-                dt = datetime.fromisoformat(dhEmi.replace("Z", "+00:00"))
-                ano, mes = dt.year, dt.month
-                data_str = dt.date().isoformat()
-            except Exception:
-                m = re.search(r"(\d{4})[-/]?(\d{2})[-/]?(\d{2})?", dhEmi)
-                if m:
-                    ano = int(m.group(1))
-                    mes = int(m.group(2))
-                    dia = m.group(3)
-                    data_str = (
-                        f"{ano:04d}-{mes:02d}-{int(dia):02d}"
-                        if dia
-                        else f"{ano:04d}-{mes:02d}-01"
-                    )
+    # 7) Data / período (ano, mês)
+    ano, mes, data_str = _periodo_resumo(cab["dhEmi"] or "")
 
     return (
         emit_cnpj or None,
@@ -282,293 +253,378 @@ def _parse_fields_resumo(xml_bytes: bytes):
     )
 
 
-# --- ATUALIZADO (PATCH 3): Função summarize_zipfile_resumo (novos contadores) ---
-def summarize_zipfile_resumo(zf: zipfile.ZipFile, own_set: set):
-    """Gera resumo da tabela (Aba 2) - Atualizado com contadores de Eventos"""
-    counters = {
-        c: {
-            "QTD": 0,
-            "QTDETERC": 0,
-            "P": {"55": 0, "57": 0, "65": 0,"NFSE":0, "OUT": 0},
-            "T": {"55": 0, "57": 0, "65": 0,"NFSE":0, "OUT": 0},
-        }
-        for c in own_set
-    }
-    seen_chaves = set()
-    warns = set()
-    total_docs = 0
-    total_xmls = 0
-    total_dfe = 0
-    seen_dfe = set()
-    min_period = None
-    max_period = None
-    total_eventos_inut = 0  # <- NOVO CONTADOR
-    total_duplicados = 0
-    total_intercompany = 0
-
-    for name, xml_bytes in iter_xml_from_zip_resumo(zf, max_depth=3):
-        total_xmls += 1
-        emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), _ = _parse_fields_resumo(
-            xml_bytes
+# --- Leitura incremental (só cabeçalho) ---
+_RAIZES_INCREMENTAL_RESUMO = {"nfeProc", "NFe", "cteProc", "CTe"}
+# Filhos de infNFe/infCTe que, pelo leiaute, só aparecem depois de ide/emit/dest
+_FIM_CABECALHO_RESUMO = {
+    "det", "total", "transp", "vprest", "imp",
+    "infctenorm", "infctecomp", "infcteanu",
+}
+_BLOCO_INCREMENTAL_RESUMO = 16 * 1024
+
+
+def _split_tag_resumo(tag: str):
+    if tag[:1] == "{":
+        uri, _, local = tag[1:].partition("}")
+        return uri, local
+    return None, tag
+
+
+def _parse_fields_incremental_resumo(xml_bytes: bytes):
+    """
+    Versão incremental (pull-parser) de _parse_fields_resumo para NFe/CTe.
+
+    Lê o XML em blocos e encerra assim que ide/emit/dest e a chave
+    (protNFe/infProt/chNFe ou o Id de infNFe/infCTe) estão disponíveis.
+    Os elementos já lidos são descartados, de modo que tempo e memória não
+    crescem com a quantidade de <det>.
+
+    Retorna None quando o documento foge do formato esperado (NFSe, eventos,
+    XML inválido...), indicando que deve ser usado o parse completo.
+    """
+    parser = xml_backend.pull_parser(events=("start", "end"))
+    pilha = []
+    inf_depth = None
+    inf_id = None
+    chave_prot = ""
+    secao = None
+    secoes_vistas = set()
+    textos = {}
+    cabecalho_ok = False
+
+    def _resultado(chave):
+        modelo = (textos.get(("ide", "mod")) or "").strip()
+        if modelo and modelo not in ACCEPTED_MODELS_GLOBAL:
+            modelo = "OUT"
+        emit_cnpj = _digits(textos.get(("emit", "cnpj")) or textos.get(("emit", "cpf")) or "")
+        dest_cnpj = _digits(textos.get(("dest", "cnpj")) or textos.get(("dest", "cpf")) or "")
+        ano, mes, data_str = _periodo_resumo(
+            textos.get(("ide", "dhemi")) or textos.get(("ide", "demi")) or ""
+        )
+        return (
+            emit_cnpj or None,
+            dest_cnpj or None,
+            (modelo or None),
+            (chave or None),
+            (ano, mes),
+            data_str,
         )
 
-        if modelo in ("EVENTO", "INUT"):
-            total_eventos_inut += 1
+    def _chave_id():
+        return chave_do_id(inf_id)
+
+    view = memoryview(xml_bytes)
+    try:
+        for pos in range(0, len(view), _BLOCO_INCREMENTAL_RESUMO):
+            parser.feed(view[pos:pos + _BLOCO_INCREMENTAL_RESUMO])
+            for evento, el in parser.read_events():
+                if evento == "start":
+                    uri, local = _split_tag_resumo(el.tag)
+                    lname = local.lower()
+                    depth = len(pilha)
+                    if depth == 0 and (
+                        local not in _RAIZES_INCREMENTAL_RESUMO
+                        or uri not in (None, NS_RESUMO["nfe"], NS_RESUMO["cte"])
+                    ):
+                        return None
+
+                    if lname in ("infnfe", "infcte"):
+                        pai = _split_tag_resumo(pilha[-1].tag)[1].lower() if pilha else ""
+                        if inf_depth is not None or pai != lname[3:]:
+                            return None
+                        inf_depth = depth
+                        inf_id = el.get("Id") or ""
+                    elif inf_depth is not None and depth == inf_depth + 1:
+                        if lname in _FIM_CABECALHO_RESUMO:
+                            cabecalho_ok = True
+                        secao = lname if lname not in secoes_vistas else None
+                        secoes_vistas.add(lname)
+
+                    if cabecalho_ok and _chave_id():
+                        return _resultado(_chave_id())
+                    pilha.append(el)
+                    continue
+
+                # evento == "end"
+                pilha.pop()
+                depth = len(pilha)
+                uri, local = _split_tag_resumo(el.tag)
+
+                if inf_depth is not None and depth == inf_depth + 2 and secao:
+                    textos.setdefault((secao, local.lower()), el.text)
+                elif inf_depth is not None and depth == inf_depth + 1:
+                    secao = None
+                    if {"ide", "emit", "dest"} <= secoes_vistas:
+                        cabecalho_ok = True
+                elif (
+                    not chave_prot
+                    and depth >= 2
+                    and (
+                        (uri == NS_RESUMO["nfe"] and local == "chNFe"
+                         and pilha[-1].tag == f"{{{uri}}}infProt"
+                         and pilha[-2].tag == f"{{{uri}}}protNFe")
+                        or (uri == NS_RESUMO["cte"] and local == "chCTe"
+                            and pilha[-1].tag == f"{{{uri}}}infProt"
+                            and pilha[-2].tag == f"{{{uri}}}protCTe")
+                    )
+                ):
+                    chave_prot = (el.text or "").strip()
+
+                if pilha:
+                    pilha[-1].remove(el)
+
+                if inf_depth is not None and depth == inf_depth:
+                    # infNFe/infCTe fechado: o cabeçalho certamente terminou
+                    cabecalho_ok = True
+                if cabecalho_ok and (chave_prot or _chave_id()):
+                    return _resultado(chave_prot or _chave_id())
+        parser.close()
+    except xml_backend.ERROS_PARSE:
+        return None
+
+    if inf_depth is None:
+        return None
+    return _resultado(chave_prot or _chave_id() or buscar_chave_acesso(xml_bytes))
+
+
+# Caminhos dos itens, compilados uma vez (XPath no lxml; ver core.xml_backend)
+_XP_INF_ITENS = Consulta(".//ns:infNFe", NS_RESUMO)
+_XP_DET_ITENS = Consulta(".//ns:det", NS_RESUMO)
+_XP_PROD_ITENS = Consulta("ns:prod", NS_RESUMO)
+_XP_CAMPOS_ITENS = tuple(
+    (Consulta(caminho, NS_RESUMO), [nome])
+    for caminho, nome in (
+        ("ns:cProd", "cProd"),
+        ("ns:xProd", "xProd"),
+        ("ns:qCom", "qCom"),
+        ("ns:NCM", "NCM"),
+        ("ns:uCom", "uCom"),
+        ("ns:rastro/ns:nLote", "nLote"),
+        ("ns:CFOP", "CFOP"),
+    )
+)
+
+
+def _itens_documento_resumo(root) -> list:
+    """
+    Lista os itens (det/prod) de uma NFe/NFCe como tuplas
+    (nItem, cProd, xProd, qCom, NCM, uCom, Lote, CFOP).
+    """
+    inf = _XP_INF_ITENS.primeiro(root)
+    if inf is None:
+        inf = _find_first_local_resumo(root, ["NFe", "infNFe"])
+    if inf is None:
+        inf = _find_first_local_resumo(root, ["infNFe"])
+
+    det_nodes = []
+    if inf is not None:
+        det_nodes = _XP_DET_ITENS.todos(inf)
+        if not det_nodes:
+            det_nodes = [
+                ch
+                for ch in inf.iter()
+                if _localname_resumo(ch.tag).lower() == "det"
+            ]
+
+    itens = []
+    for det in det_nodes:
+        prod = _XP_PROD_ITENS.primeiro(det)
+        if prod is None:
+            for ch in det:
+                if _localname_resumo(ch.tag).lower() == "prod":
+                    prod = ch
+                    break
+        if prod is None:
             continue
 
+        def gx(consulta, names_list):
+            txt = consulta.texto(prod)
+            if txt:
+                return txt.strip()
+            node = _find_first_local_resumo(prod, names_list)
+            return (node.text or "").strip() if node is not None and node.text else ""
+
+        itens.append((det.get("nItem") or "",) + tuple(gx(c, nomes) for c, nomes in _XP_CAMPOS_ITENS))
+    return itens
+
+
+def _extrair_documento_resumo(
+    xml_bytes: bytes, *, com_detalhe: bool = True, com_itens: bool = True, medidor=MEDIDOR_NULO
+):
+    """
+    Lê um XML uma única vez e devolve (campos, cfop, itens):
+      - campos: a mesma tupla de _parse_fields_resumo
+      - cfop: CFOP do detalhe ("" se não pedido/não aplicável)
+      - itens: tuplas de _itens_documento_resumo ([] se não pedido/não aplicável)
+    Quando só os totais são pedidos, usa a leitura incremental do cabeçalho.
+    """
+    if not com_detalhe and not com_itens:
+        return _parse_fields_resumo(xml_bytes, incremental=True, medidor=medidor), "", []
+
+    try:
+        root = xml_backend.fromstring(xml_bytes)
+    except Exception:
+        medidor.contar("resumo.falhas_parse")
+        return (None, None, None, None, (None, None), ""), "", []
+
+    tipo = sniff_bytes(xml_bytes)
+    cab = None if tipo in _TIPOS_SEM_CABECALHO_RESUMO else PLANO_CABECALHO_RESUMO.extrair(root)
+    campos = _parse_fields_root_resumo(root, xml_bytes, medidor, tipo=tipo, cab=cab)
+    modelo, chave = campos[2], campos[3]
+
+    cfop = ""
+    if com_detalhe and modelo in ACCEPTED_MODELS_GLOBAL and chave:
+        cfop = (cab and cab["cfop"]) or ""
+
+    itens = []
+    if com_itens and modelo in {"55", "65"} and chave:
+        itens = _itens_documento_resumo(root)
+
+    return campos, cfop, itens
+
+
+class _AcumuladorResumo:
+    """
+    Consolida, documento a documento, os três resultados da Aba 2
+    (totais/breakdown, detalhe por CFOP e itens) a partir de uma única leitura.
+    Cada saída mantém o seu próprio controle de duplicidade, como nas
+    funções originais.
+
+    Os documentos aceitos vão para uma TabelaDocumentos (colunar); a tabela
+    de totais, o breakdown P/T e o detalhe por CFOP saem de group-bys sobre ela.
+    O controle de duplicidade usa core.dedupe.IndiceChaves (chaves empacotadas;
+    vai para disco se passar de orcamento_dedupe bytes).
+    """
+
+    def __init__(
+        self,
+        own_set: set,
+        *,
+        com_detalhe: bool = True,
+        com_itens: bool = True,
+        orcamento_dedupe: int | None = None,
+    ):
+        self.own_set = own_set
+        self.com_detalhe = com_detalhe
+        self.com_itens = com_itens
+        self.tabela = TabelaDocumentos()
+
+        # --- Resumo (totais) ---
+        self.seen_chaves = IndiceChaves(orcamento_bytes=orcamento_dedupe)
+        self.warns = set()
+        self.total_docs = 0
+        self.total_xmls = 0
+        self.total_dfe = 0
+        self.seen_dfe = IndiceChaves(orcamento_bytes=orcamento_dedupe)
+        self.min_period = None
+        self.max_period = None
+        self.total_eventos_inut = 0
+        self.total_duplicados = 0
+        self.total_intercompany = 0
+
+        # --- Detalhe (CFOP) ---
+        self.seen = IndiceChaves(orcamento_bytes=orcamento_dedupe)
+
+        # --- Itens ---
+        self.item_rows = []
+        self.seen_item = IndiceChaves(com_item=True, orcamento_bytes=orcamento_dedupe)
+
+    def _classificar(self, emit_cnpj, dest_cnpj):
+        if emit_cnpj and emit_cnpj in self.own_set:
+            return "P", emit_cnpj
+        if dest_cnpj and dest_cnpj in self.own_set:
+            return "T", dest_cnpj
+        return None, None
+
+    def adicionar(self, campos, cfop: str = "", itens=()):
+        self.total_xmls += 1
+        no_resumo = self._somar_resumo(campos)
+        no_detalhe = self.com_detalhe and self._somar_detalhe(campos)
+        if no_resumo or no_detalhe:
+            emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), _ = campos
+            pt, cnpj_proprio = self._classificar(emit_cnpj, dest_cnpj)
+            self.tabela.adicionar(
+                cnpj=cnpj_proprio,
+                modelo=modelo,
+                cfop=cfop if no_detalhe else "",
+                ano=ano,
+                mes=mes,
+                pt=pt,
+                chave=chave,
+                no_resumo=no_resumo,
+                no_detalhe=no_detalhe,
+            )
+        if self.com_itens:
+            self._somar_itens(campos, itens)
+
+    def _somar_resumo(self, campos) -> bool:
+        """Atualiza os totais; True se o documento entra na contagem por CNPJ."""
+        emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), _ = campos
+
+        if modelo in ("EVENTO", "INUT"):
+            self.total_eventos_inut += 1
+            return False
+
         if modelo is None:
-            continue
+            return False
         if not chave:
-            continue
-            
-        if chave in seen_chaves:
-            total_duplicados += 1
-            continue
-        seen_chaves.add(chave)
-        
-        total_docs += 1
+            return False
+
+        if not self.seen_chaves.adicionar(chave):
+            self.total_duplicados += 1
+            return False
+
+        self.total_docs += 1
 
         if modelo in ACCEPTED_MODELS_GLOBAL:
-            if chave not in seen_dfe:
-                seen_dfe.add(chave)
-                total_dfe += 1
+            if self.seen_dfe.adicionar(chave):
+                self.total_dfe += 1
                 if ano and mes:
                     cur = (ano, mes)
-                    if (min_period is None) or (cur < min_period):
-                        min_period = cur
-                    if (max_period is None) or (cur > max_period):
-                        max_period = cur
-        
+                    if (self.min_period is None) or (cur < self.min_period):
+                        self.min_period = cur
+                    if (self.max_period is None) or (cur > self.max_period):
+                        self.max_period = cur
+
         if (
             emit_cnpj
             and dest_cnpj
-            and emit_cnpj in own_set
-            and dest_cnpj in own_set
+            and emit_cnpj in self.own_set
+            and dest_cnpj in self.own_set
             and emit_cnpj != dest_cnpj
         ):
-            total_intercompany += 1
-        # ---------------------------------------------------------
-        targets = []
-
-        if emit_cnpj and emit_cnpj in own_set:
-            tag = "P"
-            cnpj_proprio = emit_cnpj
-        elif dest_cnpj and dest_cnpj in own_set:
-            tag = "T"
-            cnpj_proprio = dest_cnpj
-        else:
-            continue
-
-        if cnpj_proprio not in counters:
-            continue
+            self.total_intercompany += 1
 
-        mkey = modelo if modelo in ACCEPTED_MODELS_GLOBAL else "OUT"
-        if tag == "P":
-            counters[cnpj_proprio]["QTD"] += 1
-            counters[cnpj_proprio]["P"][mkey] += 1
-        else:
-            counters[cnpj_proprio]["QTDETERC"] += 1
-            counters[cnpj_proprio]["T"][mkey] += 1
-
-    rows = [
-        {
-            "CNPJ": _mask_cnpj(cnpj),
-            "XMLs Próprios (P)": v["QTD"],
-            "XMLs Terceiros (T)": v["QTDETERC"],
-            "Total Geral": v["QTD"] + v["QTDETERC"]
-        }
-        for cnpj, v in counters.items()
-    ]
-    breakdown = {}
-    for cnpj, v in counters.items():
-        breakdown[_mask_cnpj(cnpj)] = {"P": v["P"], "T": v["T"]}
-
-    # --- LÓGICA DE CONTADORES ATUALIZADA ---
-    # O 'total_outros' que o log antigo mostrava (total_xmls - total_dfe)
-    # agora será dividido em Eventos e Desconhecidos.
-    total_outros_geral = max(total_xmls - total_dfe, 0)
-    total_outros_desconhecidos = max(
-        0, total_outros_geral - total_eventos_inut
-    )
+        tag, _cnpj_proprio = self._classificar(emit_cnpj, dest_cnpj)
+        return tag is not None
 
-    return (
-        rows,
-        breakdown,
-        total_docs,
-        warns,
-        total_xmls,
-        total_outros_desconhecidos,
-        total_eventos_inut,
-        total_duplicados,
-        total_intercompany,
-        min_period,
-        max_period,
-    )
-
-
-# --- ATUALIZADO (PATCH 4): Função build_detail_from_zip_resumo (lógica CFOP CTe) ---
-def build_detail_from_zip_resumo(zf: zipfile.ZipFile, own_set: set):
-    """Gera detalhe agregado (Aba 2) - Atualizado para CFOP de CTe"""
-    rows = []
-    seen = set()
-    for name, xml_bytes in iter_xml_from_zip_resumo(zf, max_depth=3):
-        emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), _ = _parse_fields_resumo(
-            xml_bytes
-        )
+    def _somar_detalhe(self, campos) -> bool:
+        """True se o documento entra no detalhe por CFOP."""
+        emit_cnpj, dest_cnpj, modelo, chave, _periodo, _ = campos
         if not modelo or modelo not in ACCEPTED_MODELS_GLOBAL:
-            continue
-        if not chave or chave in seen:
-            continue
-        seen.add(chave)
-
-        # --- LÓGICA DO CFOP ATUALIZADA ---
-        try:
-            root = ET.fromstring(xml_bytes)
-            cfop = ""
-
-            # 1. Tenta CFOP de NFe (item)
-            cfop_el_nfe = (
-                root.find(".//ns:det/ns:prod/ns:CFOP", NS_RESUMO)
-                or root.find(".//nfe:det/nfe:prod/nfe:CFOP", NS_RESUMO)
-            )
-            if cfop_el_nfe is not None and cfop_el_nfe.text:
-                cfop = cfop_el_nfe.text
-
-            # 2. Se não achou NFe, tenta CFOP de CTe (header)
-            if not cfop:
-                cfop_el_cte = (
-                    root.find(".//cte:infCTe/cte:ide/cte:CFOP", NS_RESUMO)
-                    or _find_first_local_resumo(root, ["infCTe", "ide", "CFOP"])
-                )
-                if cfop_el_cte is not None and cfop_el_cte.text:
-                    cfop = cfop_el_cte.text
-
-            # 3. Fallback para NFe (item) sem namespace
-            if not cfop:
-                inf_nfe = _find_first_local_resumo(root, ["NFe", "infNFe"]) or _find_first_local_resumo(
-                    root, ["infNFe"]
-                )
-                cfop_el_nfe_fallback = (
-                    _find_first_local_resumo(inf_nfe, ["det", "prod", "CFOP"])
-                    if inf_nfe is not None
-                    else None
-                )
-                if cfop_el_nfe_fallback is not None and cfop_el_nfe_fallback.text:
-                    cfop = cfop_el_nfe_fallback.text
-
-        except Exception:
-            cfop = ""
-        # --- FIM DA LÓGICA DO CFOP ---
-
-        if emit_cnpj and emit_cnpj in own_set:
-            emitente = "P"
-            cnpj_proprio = emit_cnpj
-        elif dest_cnpj and dest_cnpj in own_set:
-            emitente = "T"
-            cnpj_proprio = dest_cnpj
-        else:
-            continue
+            return False
+        if not chave or not self.seen.adicionar(chave):
+            return False
 
-        rows.append(
-            {
-                "CNPJ": _mask_cnpj(cnpj_proprio) if cnpj_proprio else "",
-                "MODELO DE DOCUMENTO": modelo,
-                "CFOP": cfop or "",
-                "MES": mes or "",
-                "ANO": ano or "",
-                "EMITENTE (P/T)": emitente,
-                "QUANTIDADE": 1,
-            }
-        )
-    if not rows:
-        return []
-    df = (
-        pd.DataFrame(rows)
-        .groupby(
-            ["CNPJ", "MODELO DE DOCUMENTO", "CFOP", "MES", "ANO", "EMITENTE (P/T)"],
-            dropna=False,
-        )["QUANTIDADE"]
-        .sum()
-        .reset_index()
-    )
-    return df.to_dict("records")
+        emitente, _cnpj_proprio = self._classificar(emit_cnpj, dest_cnpj)
+        return emitente is not None
 
-
-def build_items_from_zip_resumo(zf: zipfile.ZipFile, own_set: set):
-    """Gera planilha de itens (Aba 2)"""
-    rows = []
-    seen_item = set()
-    for name, xml_bytes in iter_xml_from_zip_resumo(zf, max_depth=3):
-        emit_cnpj, dest_cnpj, modelo, chave, (_ano, _mes), data_str = _parse_fields_resumo(
-            xml_bytes
-        )
+    def _somar_itens(self, campos, itens):
+        emit_cnpj, dest_cnpj, modelo, chave, _periodo, data_str = campos
         if modelo not in {"55", "65"}:
-            continue
+            return
         if not chave:
-            continue
-        try:
-            root = ET.fromstring(xml_bytes)
-        except Exception:
-            continue
+            return
 
-        if emit_cnpj and emit_cnpj in own_set:
-            pt = "P"
-            cnpj_ref = emit_cnpj
-        elif dest_cnpj and dest_cnpj in own_set:
-            pt = "T"
-            cnpj_ref = dest_cnpj
-        else:
-            continue
-
-        inf = (
-            root.find(".//ns:infNFe", NS_RESUMO)
-            or root.find(".//nfe:infNFe", NS_RESUMO)
-            or _find_first_local_resumo(root, ["NFe", "infNFe"])
-            or _find_first_local_resumo(root, ["infNFe"])
-        )
+        pt, cnpj_ref = self._classificar(emit_cnpj, dest_cnpj)
+        if pt is None:
+            return
 
-        det_nodes = []
-        if inf is not None:
-            det_nodes = list(inf.findall(".//ns:det", NS_RESUMO)) or []
-            if not det_nodes:
-                det_nodes = [
-                    ch
-                    for ch in inf.iter()
-                    if _localname_resumo(ch.tag).lower() == "det"
-                ]
-
-        for det in det_nodes:
-            prod = det.find("ns:prod", NS_RESUMO)
-            if prod is None:
-                for ch in det:
-                    if _localname_resumo(ch.tag).lower() == "prod":
-                        prod = ch
-                        break
-            if prod is None:
+        for nItem, cProd, xProd, qCom, NCM, uCom, Lote, CFOP in itens:
+            if not self.seen_item.adicionar(chave, nItem):
                 continue
 
-            nItem = det.get("nItem") or ""
-            key = (chave, nItem)
-            if key in seen_item:
-                continue
-            seen_item.add(key)
-
-            def gx(tag_pref, names_list):
-                txt = prod.findtext(tag_pref, default="", namespaces=NS_RESUMO)
-                if txt:
-                    return txt.strip()
-                node = _find_first_local_resumo(prod, names_list)
-                return (node.text or "").strip() if node is not None and node.text else ""
-
-            cProd = gx("ns:cProd", ["cProd"])
-            xProd = gx("ns:xProd", ["xProd"])
-            qCom  = gx("ns:qCom", ["qCom"])
-            NCM = gx("ns:NCM", ["NCM"])
-            uCom = gx("ns:uCom", ["uCom"])
-            CFOP = gx("ns:CFOP", ["CFOP"])
-            Lote = gx("ns:rastro/ns:nLote",["nLote"])
-
-            rows.append(
+            self.item_rows.append(
                 {
                     "CNPJ": _mask_cnpj(cnpj_ref),
                     "Modelo": modelo,
@@ -587,4 +643,479 @@ def build_items_from_zip_resumo(zf: zipfile.ZipFile, own_set: set):
                     "CNPJ_dest": _mask_cnpj(dest_cnpj or ""),
                 }
             )
-    return rows
+
+    def resumo(self):
+        counters = {
+            c: {
+                "QTD": 0,
+                "QTDETERC": 0,
+                "P": {"55": 0, "57": 0, "65": 0, "NFSE": 0, "OUT": 0},
+                "T": {"55": 0, "57": 0, "65": 0, "NFSE": 0, "OUT": 0},
+            }
+            for c in self.own_set
+        }
+
+        df = self.tabela.to_frame()
+        df = df[df["no_resumo"]]
+        if not df.empty:
+            contagem = df.groupby(["cnpj", "pt", "modelo"], observed=True).size()
+            for (cnpj, tag, modelo), qtd in contagem.items():
+                if cnpj not in counters:
+                    continue
+                mkey = modelo if modelo in ACCEPTED_MODELS_GLOBAL else "OUT"
+                counters[cnpj][tag][mkey] += int(qtd)
+                counters[cnpj]["QTD" if tag == "P" else "QTDETERC"] += int(qtd)
+
+        rows = [
+            {
+                "CNPJ": _mask_cnpj(cnpj),
+                "XMLs Próprios (P)": v["QTD"],
+                "XMLs Terceiros (T)": v["QTDETERC"],
+                "Total Geral": v["QTD"] + v["QTDETERC"]
+            }
+            for cnpj, v in counters.items()
+        ]
+        breakdown = {}
+        for cnpj, v in counters.items():
+            breakdown[_mask_cnpj(cnpj)] = {"P": v["P"], "T": v["T"]}
+
+        # --- LÓGICA DE CONTADORES ATUALIZADA ---
+        # O 'total_outros' que o log antigo mostrava (total_xmls - total_dfe)
+        # agora será dividido em Eventos e Desconhecidos.
+        total_outros_geral = max(self.total_xmls - self.total_dfe, 0)
+        total_outros_desconhecidos = max(
+            0, total_outros_geral - self.total_eventos_inut
+        )
+
+        return (
+            rows,
+            breakdown,
+            self.total_docs,
+            self.warns,
+            self.total_xmls,
+            total_outros_desconhecidos,
+            self.total_eventos_inut,
+            self.total_duplicados,
+            self.total_intercompany,
+            self.min_period,
+            self.max_period,
+        )
+
+    def detalhe(self):
+        df = self.tabela.to_frame()
+        df = df[df["no_detalhe"]]
+        if df.empty:
+            return []
+
+        agg = (
+            df.groupby(["cnpj", "modelo", "cfop", "mes", "ano", "pt"], observed=True)
+            .size()
+            .reset_index(name="QUANTIDADE")
+        )
+        agg = agg[agg["QUANTIDADE"] > 0]
+
+        # Mesma ordem do groupby original: textos em ordem alfabética e, em
+        # MES/ANO, números crescentes com os vazios ("") por último.
+        agg = agg.assign(
+            CNPJ=agg["cnpj"].map(lambda c: _mask_cnpj(c) if c else "").astype(object),
+            _mes_vazio=agg["mes"] == 0,
+            _ano_vazio=agg["ano"] == 0,
+        )
+        agg = agg.sort_values(
+            ["CNPJ", "modelo", "cfop", "_mes_vazio", "mes", "_ano_vazio", "ano", "pt"],
+            key=lambda s: s.astype(str) if isinstance(s.dtype, pd.CategoricalDtype) else s,
+            kind="stable",
+        )
+
+        def _num_ou_vazio(s):
+            return pd.Series(
+                [int(v) if v else "" for v in s], index=s.index, dtype=object
+            )
+
+        out = pd.DataFrame(
+            {
+                "CNPJ": agg["CNPJ"],
+                "MODELO DE DOCUMENTO": agg["modelo"].astype(object),
+                "CFOP": agg["cfop"].astype(object),
+                "MES": _num_ou_vazio(agg["mes"]),
+                "ANO": _num_ou_vazio(agg["ano"]),
+                "EMITENTE (P/T)": agg["pt"].astype(object),
+                "QUANTIDADE": agg["QUANTIDADE"].astype("int64"),
+            }
+        )
+        return out.to_dict("records")
+
+    def itens(self):
+        return self.item_rows
+
+
+def _extrair_lote_resumo(lote, com_detalhe: bool, com_itens: bool, medir: bool = False):
+    """
+    Executado nos processos filhos: extrai um lote de (nome, bytes).
+    Retorna (resultados, relatório do Medidor do filho ou None).
+    """
+    medidor = Medidor() if medir else MEDIDOR_NULO
+    resultados = []
+    for _name, xml_bytes in lote:
+        with medidor.etapa("resumo.parse_xml"):
+            resultados.append(
+                _extrair_documento_resumo(
+                    xml_bytes, com_detalhe=com_detalhe, com_itens=com_itens, medidor=medidor
+                )
+            )
+    return resultados, (medidor.relatorio() if medir else None)
+
+
+def _iter_lotes_resumo(iteravel, tamanho_lote: int):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _do_cache_resumo(valor):
+    """Reconstrói (campos, cfop, itens) a partir do JSON salvo no cache."""
+    campos, cfop, itens = valor
+    emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), data_str = campos
+    return (
+        (emit_cnpj, dest_cnpj, modelo, chave, (ano, mes), data_str),
+        cfop,
+        [tuple(item) for item in itens],
+    )
+
+
+def _iter_extraidos_resumo(
+    zf, *, com_detalhe, com_itens, workers, tamanho_lote, cache=None, medidor=MEDIDOR_NULO
+):
+    """
+    Gera (campos, cfop, itens) na ordem do zip. Com workers > 1 a extração
+    roda em um pool de processos, em lotes; os resultados são consumidos na
+    mesma ordem em que os lotes foram enviados, então a redução é idêntica
+    à do modo sequencial.
+    Com cache, XMLs já vistos (mesmo conteúdo) não são parseados de novo.
+    """
+    xmls = medidor.iterar("resumo.leitura_zip", iter_xml_from_zip_resumo(zf, max_depth=3))
+    cache_ns = f"resumo:{int(com_detalhe)}{int(com_itens)}"
+
+    def _buscar(xml_bytes):
+        medidor.contar("resumo.xmls")
+        medidor.contar("resumo.bytes_lidos", len(xml_bytes))
+        if cache is None:
+            return None, None
+        with medidor.etapa("resumo.cache"):
+            h = hash_xml(xml_bytes)
+            valor = cache.get(cache_ns, VERSAO_PARSER_RESUMO, xml_bytes, chave=h)
+        medidor.contar("resumo.cache_acertos" if valor is not None else "resumo.cache_faltas")
+        return h, (_do_cache_resumo(valor) if valor is not None else None)
+
+    def _guardar(h, xml_bytes, resultado):
+        if cache is not None:
+            cache.set(cache_ns, VERSAO_PARSER_RESUMO, xml_bytes, resultado, chave=h)
+
+    if workers <= 1:
+        for _name, xml_bytes in xmls:
+            h, resultado = _buscar(xml_bytes)
+            if resultado is None:
+                with medidor.etapa("resumo.parse_xml"):
+                    resultado = _extrair_documento_resumo(
+                        xml_bytes, com_detalhe=com_detalhe, com_itens=com_itens, medidor=medidor
+                    )
+                _guardar(h, xml_bytes, resultado)
+            yield resultado
+        return
+
+    def _concluir(lote, resultados, hashes, futuro):
+        if futuro is not None:
+            with medidor.etapa("resumo.espera_processos"):
+                novos, relatorio = futuro.result()
+            medidor.mesclar(relatorio)
+            novos = iter(novos)
+            for i, resultado in enumerate(resultados):
+                if resultado is None:
+                    resultados[i] = next(novos)
+                    _guardar(hashes[i], lote[i][1], resultados[i])
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pendentes = deque()
+        for lote in _iter_lotes_resumo(xmls, tamanho_lote):
+            hashes, resultados = [], []
+            for _name, xml_bytes in lote:
+                h, resultado = _buscar(xml_bytes)
+                hashes.append(h)
+                resultados.append(resultado)
+            faltantes = [item for item, r in zip(lote, resultados) if r is None]
+            futuro = (
+                executor.submit(
+                    _extrair_lote_resumo, faltantes, com_detalhe, com_itens, medidor is not MEDIDOR_NULO
+                )
+                if faltantes
+                else None
+            )
+            pendentes.append((lote, resultados, hashes, futuro))
+            # Limita os lotes em voo para não ler o zip inteiro para a memória
+            if len(pendentes) >= workers * 2:
+                yield from _concluir(*pendentes.popleft())
+        while pendentes:
+            yield from _concluir(*pendentes.popleft())
+
+
+# --- Estado incremental (pacotes de XML que chegam ao longo do mês) ---
+VERSAO_ESTADO_RESUMO = 1
+_FORMATO_ESTADO_RESUMO = "central-xml/estado-resumo"
+_INDICES_ESTADO_RESUMO = ("seen_chaves", "seen_dfe", "seen", "seen_item")
+_TOTAIS_ESTADO_RESUMO = (
+    "total_docs", "total_xmls", "total_dfe",
+    "total_eventos_inut", "total_duplicados", "total_intercompany",
+)
+
+
+class EstadoResumo:
+    """
+    Estado acumulado da Aba 2 (totais, índices de duplicidade, período,
+    tabela de documentos e itens), que pode receber novos zips sem
+    reprocessar os anteriores e ser salvo/recarregado entre sessões.
+
+        estado = EstadoResumo.carregar("marco.resumo", own_set)  # ou EstadoResumo(own_set)
+        estado.mesclar_zip(zf_novo)
+        resultado = estado.resultado()
+        estado.salvar("marco.resumo")
+
+    Duplicados entre pacotes continuam sendo detectados, pois os índices de
+    chaves fazem parte do estado. O arquivo salvo é um zip com um manifesto
+    JSON e as colunas em binário (sem pickle: o arquivo pode vir de upload).
+    O estado fica vinculado aos CNPJs próprios com que foi criado.
+    """
+
+    def __init__(
+        self,
+        own_set: set,
+        *,
+        com_detalhe: bool = True,
+        com_itens: bool = True,
+        orcamento_dedupe: int | None = None,
+    ):
+        self.own_set = own_set
+        self.com_detalhe = com_detalhe
+        self.com_itens = com_itens
+        self.pacotes = []
+        self._acc = _AcumuladorResumo(
+            own_set, com_detalhe=com_detalhe, com_itens=com_itens, orcamento_dedupe=orcamento_dedupe
+        )
+
+    def mesclar_zip(
+        self,
+        zf: zipfile.ZipFile,
+        *,
+        nome: str | None = None,
+        workers: int = 1,
+        tamanho_lote: int = 200,
+        cache: CacheParse | None = None,
+        medidor: Medidor | None = None,
+    ):
+        """Acrescenta os XMLs de um zip ao estado (só o zip novo é lido)."""
+        medidor = medidor or MEDIDOR_NULO
+        acc = self._acc
+        xmls_antes = acc.total_xmls
+        for campos, cfop, itens in _iter_extraidos_resumo(
+            zf,
+            com_detalhe=self.com_detalhe,
+            com_itens=self.com_itens,
+            workers=workers,
+            tamanho_lote=max(1, tamanho_lote),
+            cache=cache,
+            medidor=medidor,
+        ):
+            medidor.contar(f"resumo.documentos.{campos[2] or 'nao_reconhecido'}")
+            with medidor.etapa("resumo.acumulacao"):
+                acc.adicionar(campos, cfop, itens)
+
+        self.pacotes.append(
+            {
+                "nome": nome or getattr(zf, "filename", None) or f"pacote_{len(self.pacotes) + 1}",
+                "xmls": acc.total_xmls - xmls_antes,
+                "em": datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+        return self
+
+    def resultado(self, medidor: Medidor | None = None) -> ResultadoResumo:
+        medidor = medidor or MEDIDOR_NULO
+        with medidor.etapa("resumo.agregacao_pandas"):
+            return ResultadoResumo(
+                resumo=self._acc.resumo(),
+                detalhe=self._acc.detalhe() if self.com_detalhe else [],
+                itens=self._acc.itens() if self.com_itens else [],
+            )
+
+    # --- Persistência ---
+    def salvar(self, destino):
+        """Grava o estado em `destino` (caminho ou arquivo binário aberto)."""
+        acc = self._acc
+        meta_tabela, blobs_tabela = acc.tabela.exportar()
+        indices = {}
+        arquivos = {}
+        for nome in _INDICES_ESTADO_RESUMO:
+            empacotadas, outras = getattr(acc, nome).exportar()
+            indices[nome] = {"outras": outras}
+            arquivos[f"indices/{nome}.bin"] = empacotadas
+        for nome, dados in blobs_tabela.items():
+            arquivos[f"tabela/{nome}.bin"] = dados
+
+        manifesto = {
+            "formato": _FORMATO_ESTADO_RESUMO,
+            "versao": VERSAO_ESTADO_RESUMO,
+            "versao_parser": VERSAO_PARSER_RESUMO,
+            "own_set": sorted(self.own_set),
+            "com_detalhe": self.com_detalhe,
+            "com_itens": self.com_itens,
+            "totais": {nome: getattr(acc, nome) for nome in _TOTAIS_ESTADO_RESUMO},
+            "warns": sorted(acc.warns),
+            "min_period": list(acc.min_period) if acc.min_period else None,
+            "max_period": list(acc.max_period) if acc.max_period else None,
+            "pacotes": self.pacotes,
+            "tabela": meta_tabela,
+            "indices": indices,
+        }
+
+        with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr("manifesto.json", json.dumps(manifesto, ensure_ascii=False))
+            for nome, dados in arquivos.items():
+                z.writestr(nome, dados)
+            z.writestr("itens.json", json.dumps(acc.item_rows, ensure_ascii=False))
+
+    @classmethod
+    def carregar(cls, origem, own_set: set, *, orcamento_dedupe: int | None = None):
+        """
+        Lê um estado salvo por `salvar`. ValueError se o arquivo não for um
+        estado válido, se tiver sido gerado por outra VERSAO_PARSER_RESUMO
+        ou para outros CNPJs próprios.
+        """
+        try:
+            with zipfile.ZipFile(origem, "r") as z:
+                manifesto = json.loads(z.read("manifesto.json"))
+                if manifesto.get("formato") != _FORMATO_ESTADO_RESUMO:
+                    raise ValueError("O arquivo não é um estado do Resumo.")
+                if manifesto.get("versao") != VERSAO_ESTADO_RESUMO:
+                    raise ValueError(
+                        f"Versão de estado não suportada: {manifesto.get('versao')}."
+                    )
+                if manifesto.get("versao_parser") != VERSAO_PARSER_RESUMO:
+                    # Linhas de outra versão da extração não se misturam com as novas
+                    raise ValueError(
+                        f"Estado gerado por outra versão da leitura dos XMLs "
+                        f"({manifesto.get('versao_parser')}; atual: {VERSAO_PARSER_RESUMO})."
+                    )
+                if set(manifesto["own_set"]) != set(own_set):
+                    raise ValueError(
+                        "O estado salvo foi gerado para outros CNPJs próprios: "
+                        + ", ".join(_mask_cnpj(c) for c in manifesto["own_set"])
+                    )
+
+                estado = cls(
+                    own_set,
+                    com_detalhe=bool(manifesto["com_detalhe"]),
+                    com_itens=bool(manifesto["com_itens"]),
+                    orcamento_dedupe=orcamento_dedupe,
+                )
+                acc = estado._acc
+                for nome in _TOTAIS_ESTADO_RESUMO:
+                    setattr(acc, nome, int(manifesto["totais"][nome]))
+                acc.warns = set(manifesto["warns"])
+                acc.min_period = tuple(int(v) for v in manifesto["min_period"]) if manifesto["min_period"] else None
+                acc.max_period = tuple(int(v) for v in manifesto["max_period"]) if manifesto["max_period"] else None
+                estado.pacotes = list(manifesto["pacotes"])
+
+                meta_tabela = manifesto["tabela"]
+                blobs = {
+                    nome: z.read(f"tabela/{nome}.bin")
+                    for nome in list(meta_tabela["colunas"]) + ["chave_dados"]
+                }
+                acc.tabela = TabelaDocumentos.importar(meta_tabela, blobs)
+
+                for nome in _INDICES_ESTADO_RESUMO:
+                    getattr(acc, nome).importar(
+                        z.read(f"indices/{nome}.bin"), manifesto["indices"][nome]["outras"]
+                    )
+
+                itens = json.loads(z.read("itens.json"))
+                if not isinstance(itens, list) or not all(isinstance(r, dict) for r in itens):
+                    raise ValueError("Lista de itens inválida.")
+                acc.item_rows = itens
+        except ValueError:
+            raise
+        except (zipfile.BadZipFile, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Estado do Resumo inválido ou corrompido: {e}") from e
+        return estado
+
+
+def analisar_zip_resumo(
+    zf: zipfile.ZipFile,
+    own_set: set,
+    *,
+    com_detalhe: bool = True,
+    com_itens: bool = True,
+    workers: int = 1,
+    tamanho_lote: int = 200,
+    cache: CacheParse | None = None,
+    orcamento_dedupe: int | None = None,
+    medidor: Medidor | None = None,
+):
+    """
+    Motor único da Aba 2: lê e parseia cada XML do zip uma única vez e
+    alimenta, na mesma passada, os totais, o detalhe por CFOP e os itens.
+    workers > 1 distribui o parse em processos (lotes de tamanho_lote XMLs).
+    cache (core.cache_parse.CacheParse) reaproveita parses de uploads anteriores.
+    orcamento_dedupe limita a memória de cada índice de duplicidade (None = sem limite).
+    medidor (core.instrumentacao.Medidor) recebe tempos por etapa e contadores.
+    Para acumular vários zips, ver EstadoResumo.
+    """
+    estado = EstadoResumo(
+        own_set, com_detalhe=com_detalhe, com_itens=com_itens, orcamento_dedupe=orcamento_dedupe
+    )
+    estado.mesclar_zip(
+        zf, workers=workers, tamanho_lote=tamanho_lote, cache=cache, medidor=medidor
+    )
+    return estado.resultado(medidor)
+
+
+# --- ATUALIZADO (PATCH 3): Função summarize_zipfile_resumo (novos contadores) ---
+def summarize_zipfile_resumo(
+    zf: zipfile.ZipFile, own_set: set, *, workers: int = 1, tamanho_lote: int = 200, cache=None, medidor=None,
+    orcamento_dedupe: int | None = None,
+):
+    """Gera resumo da tabela (Aba 2) - Atualizado com contadores de Eventos"""
+    return analisar_zip_resumo(
+        zf, own_set, com_detalhe=False, com_itens=False,
+        workers=workers, tamanho_lote=tamanho_lote, cache=cache, medidor=medidor,
+        orcamento_dedupe=orcamento_dedupe,
+    ).resumo
+
+
+# --- ATUALIZADO (PATCH 4): Função build_detail_from_zip_resumo (lógica CFOP CTe) ---
+def build_detail_from_zip_resumo(
+    zf: zipfile.ZipFile, own_set: set, *, workers: int = 1, tamanho_lote: int = 200, cache=None, medidor=None,
+    orcamento_dedupe: int | None = None,
+):
+    """Gera detalhe agregado (Aba 2) - Atualizado para CFOP de CTe"""
+    return analisar_zip_resumo(
+        zf, own_set, com_itens=False,
+        workers=workers, tamanho_lote=tamanho_lote, cache=cache, medidor=medidor,
+        orcamento_dedupe=orcamento_dedupe,
+    ).detalhe
+
+
+def build_items_from_zip_resumo(
+    zf: zipfile.ZipFile, own_set: set, *, workers: int = 1, tamanho_lote: int = 200, cache=None, medidor=None,
+    orcamento_dedupe: int | None = None,
+):
+    """Gera planilha de itens (Aba 2)"""
+    return analisar_zip_resumo(
+        zf, own_set, com_detalhe=False,
+        workers=workers, tamanho_lote=tamanho_lote, cache=cache, medidor=medidor,
+        orcamento_dedupe=orcamento_dedupe,
+    ).itens
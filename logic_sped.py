@@ -1,7 +1,19 @@
+import codecs
 import io
+import mmap
+import os
+import re
+import tempfile
 import zipfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import docx  # Importação necessária para ler .docx
+from core.exportacao import exportar_tabelas
+from core.instrumentacao import MEDIDOR_NULO, Medidor
+from schemas.sped import CATEGORIA, DECIMAL, TIPOS_C100_C170_C190, TIPOS_EFD
 
 def _decode_sped_bytes(data: bytes) -> str:
     """
@@ -25,145 +37,787 @@ def _extract_text_from_docx(data: bytes) -> str:
     # Une os parágrafos com quebra de linha para simular o formato do TXT
     return "\n".join([para.text for para in doc.paragraphs])
 
-def _parse_efd_icms_ipi_txt(txt_bytes: bytes, source_name: str | None = None, is_text: bool = False):
+# --- Leiautes (campos na ordem do Guia Prático) dos registros lidos ---
+COLS_0190 = ["REG", "UNID", "DESCR"]
+COLS_0200 = ["REG", "COD_ITEM", "DESCR_ITEM", "COD_BARRA", "COD_ANT_ITEM", "UNID_INV", "TIPO_ITEM", "COD_NCM", "EX_IPI", "COD_GEN", "COD_LST", "ALIQ_ICMS"]
+COLS_C100 = ["REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_MOD", "COD_SIT", "SER", "NUM_DOC", "CHV_NFE", "DT_DOC", "DT_E_S", "VL_DOC"]
+COLS_C170 = ["REG", "NUM_ITEM", "COD_ITEM", "DESCR_COMPL", "QTD", "UNID", "VL_ITEM", "VL_DESC", "IND_MOV", "CST_ICMS", "CFOP", "COD_NAT"]
+COLS_C190 = ["REG", "CST_ICMS", "CFOP", "ALIQ_ICMS", "VL_OPR", "VL_BC_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "VL_ICMS_ST", "VL_RED_BC", "VL_IPI", "COD_OBS"]
+COLS_0150 = ["REG", "COD_PART", "NOME", "COD_PAIS", "CNPJ", "CPF", "IE", "COD_MUN", "SUFRAMA", "END", "NUM", "COMPL", "BAIRRO"]
+COLS_D100 = ["REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_MOD", "COD_SIT", "SER", "SUB", "NUM_DOC", "CHV_CTE", "DT_DOC", "DT_A_P", "TP_CTE", "CHV_CTE_REF", "VL_DOC", "VL_DESC", "IND_FRT", "VL_SERV", "VL_BC_ICMS", "VL_ICMS", "VL_NT", "COD_INF", "COD_CTA", "COD_MUN_ORIG", "COD_MUN_DEST"]
+COLS_D190 = ["REG", "CST_ICMS", "CFOP", "ALIQ_ICMS", "VL_OPR", "VL_BC_ICMS", "VL_ICMS", "VL_RED_BC", "COD_OBS"]
+COLS_E110 = ["REG", "VL_TOT_DEBITOS", "VL_AJ_DEBITOS", "VL_TOT_AJ_DEBITOS", "VL_ESTORNOS_CRED", "VL_TOT_CREDITOS", "VL_AJ_CREDITOS", "VL_TOT_AJ_CREDITOS", "VL_ESTORNOS_DEB", "VL_SLD_CREDOR_ANT", "VL_SLD_APURADO", "VL_TOT_DED", "VL_ICMS_RECOLHER", "VL_SLD_CREDOR_TRANSPORTAR", "DEB_ESP"]
+COLS_H010 = ["REG", "COD_ITEM", "UNID", "QTD", "VL_UNIT", "VL_ITEM", "IND_PROP", "COD_PART", "TXT_COMPL", "COD_CTA", "VL_ITEM_IR"]
+
+# Registro -> leiaute conhecido (os demais saem como REG, CAMPO_02, CAMPO_03...)
+LEIAUTES_EFD = {
+    "0150": COLS_0150, "0190": COLS_0190, "0200": COLS_0200,
+    "C100": COLS_C100, "C170": COLS_C170, "C190": COLS_C190,
+    "D100": COLS_D100, "D190": COLS_D190, "E110": COLS_E110, "H010": COLS_H010,
+}
+
+# Prefixo das colunas *_EXTRA_n (campos além do leiaute): o do parser
+# original no 0190/0200 ("B0190_EXTRA_4"); nos demais, o próprio registro
+PREFIXOS_EXTRA_EFD = {"0190": "B0190", "0200": "B0200"}
+
+# Registro filho -> registro pai (o filho pertence ao último pai lido antes dele)
+PAIS_EFD = {
+    "0175": "0150",
+    "0205": "0200", "0206": "0200", "0210": "0200", "0220": "0200",
+    **dict.fromkeys(
+        ("C101", "C105", "C110", "C120", "C130", "C140", "C160", "C165", "C170", "C180", "C185", "C190", "C195"), "C100"
+    ),
+    **dict.fromkeys(("D101", "D110", "D130", "D140", "D150", "D160", "D170", "D180", "D190", "D195"), "D100"),
+    "E111": "E110", "E115": "E110", "E116": "E110",
+    "H010": "H005", "H020": "H010",
+}
+
+# Colunas da tabela C100 + C170/C190 (cada linha: um C100 com um filho)
+COLS_C100_C170_C190 = (
+    [f"C100_{c}" for c in COLS_C100] + [f"C170_{c}" for c in COLS_C170] + [f"C190_{c}" for c in COLS_C190]
+)
+
+# Tipos de lote emitidos por iter_lotes_efd
+REGISTROS_LOTE = ("0190", "0200", "C100", "C170", "C190")
+
+# --- Leitura em fluxo ---
+# Bytes lidos e decodificados por vez
+TAMANHO_BLOCO_SPED = 1 << 20
+# Máximo de linhas de cada DataFrame emitido por iter_lotes_efd
+TAMANHO_LOTE_SPED = 100_000
+
+# Fins de linha reconhecidos por str.splitlines()
+_QUEBRAS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_VAZIO_12 = [""] * 12
+
+
+def _blocos_de_linhas(origem, tamanho_bloco=TAMANHO_BLOCO_SPED, medidor=MEDIDOR_NULO, etapa_leitura="sped.ler_arquivo",
+                      manter_quebras=False):
     """
-    Lê um conteúdo de EFD ICMS/IPI. 
-    'is_text' indica se o dado já vem como string (útil para docx).
+    Linhas do arquivo em listas, um bloco de bytes por vez: juntas, são as
+    mesmas de texto.splitlines() do arquivo inteiro (a linha incompleta no
+    fim de um bloco passa para o próximo, inclusive um CR LF partido ao meio).
+    Com `manter_quebras`, cada linha traz o próprio fim de linha (em latin-1,
+    len(linha) é o tamanho em bytes: somados, dão o offset da seguinte).
+
+    origem: bytes, arquivo binário aberto, caminho (os.PathLike) ou str já
+    decodificada (texto extraído de .docx). Bytes são lidos como latin-1,
+    que aceita qualquer byte (a primeira tentativa de _decode_sped_bytes).
     """
-    if is_text:
-        texto = txt_bytes # Aqui txt_bytes já é a string extraída
-    else:
-        texto = _decode_sped_bytes(txt_bytes)
-        
-    linhas = texto.splitlines()
-
-    # --- (O RESTANTE DA SUA LÓGICA DE PARSE PERMANECE IGUAL) ---
-    # Acúmulos
-    rows_0190: list[list[str]] = []
-    rows_0200: list[list[str]] = []
-    c100_atual: list[str] | None = None
-    rows_c100_only: list[list[str]] = []
-    rows_c100_c170_pairs: list[tuple[list[str], list[str]]] = []
-    rows_c100_c190_pairs: list[tuple[list[str], list[str]]] = []
-
-    cols_0190_layout = ["REG", "UNID", "DESCR"]
-    cols_0200_layout = ["REG", "COD_ITEM", "DESCR_ITEM", "COD_BARRA", "COD_ANT_ITEM", "UNID_INV", "TIPO_ITEM", "COD_NCM", "EX_IPI", "COD_GEN", "COD_LST", "ALIQ_ICMS"]
-    c100_cols_layout = ["REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_MOD", "COD_SIT", "SER", "NUM_DOC", "CHV_NFE", "DT_DOC", "DT_E_S", "VL_DOC"]
-    c170_cols_layout = ["REG", "NUM_ITEM", "COD_ITEM", "DESCR_COMPL", "QTD", "UNID", "VL_ITEM", "VL_DESC", "IND_MOV", "CST_ICMS", "CFOP", "COD_NAT"]
-    c190_cols_layout = ["REG", "CST_ICMS", "CFOP", "ALIQ_ICMS", "VL_OPR", "VL_BC_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "VL_ICMS_ST", "VL_RED_BC", "VL_IPI", "COD_OBS"]
-
-    for linha in linhas:
-        linha = linha.strip()
-        if not linha or "|" not in linha: continue
-        if not linha.startswith("|"): continue
-        partes = linha.split("|")
-        if len(partes) < 3: continue
-        campos = partes[1:-1]
-        if not campos: continue
-        reg = campos[0].upper()
-
-        if reg == "0190": rows_0190.append(campos)
-        elif reg == "0200": rows_0200.append(campos)
-        elif reg == "C100":
-            c100_atual = campos
-            rows_c100_only.append(campos)
-        elif reg == "C170" and c100_atual is not None:
-            rows_c100_c170_pairs.append((c100_atual, campos))
-        elif reg == "C190" and c100_atual is not None:
-            rows_c100_c190_pairs.append((c100_atual, campos))
-
-    def build_df_fixed(rows, layout_cols, prefix_extra):
-        if not rows: return pd.DataFrame()
-        max_len = max(len(r) for r in rows)
-        padded = [r + [""] * (max_len - len(r)) for r in rows]
-        if max_len <= len(layout_cols):
-            cols = layout_cols[:max_len]
-        else:
-            extras = [f"{prefix_extra}_EXTRA_{i}" for i in range(len(layout_cols) + 1, max_len + 1)]
-            cols = layout_cols + extras
-        return pd.DataFrame(padded, columns=cols)
-
-    df_0190 = build_df_fixed(rows_0190, cols_0190_layout, "B0190")
-    df_0200 = build_df_fixed(rows_0200, cols_0200_layout, "B0200")
-    rows_c100_c170_c190: list[list[str]] = []
-
-    if rows_c100_c170_pairs or rows_c100_c190_pairs:
-        for c100_row, c170_row in rows_c100_c170_pairs:
-            c100_cols = (c100_row + [""] * 12)[:12]
-            c170_cols = (c170_row + [""] * 12)[:12]
-            rows_c100_c170_c190.append(c100_cols + c170_cols + ([""] * 12))
-        for c100_row, c190_row in rows_c100_c190_pairs:
-            c100_cols = (c100_row + [""] * 12)[:12]
-            c190_cols = (c190_row + [""] * 12)[:12]
-            rows_c100_c170_c190.append(c100_cols + ([""] * 12) + c190_cols)
-    elif rows_c100_only:
-        for c100_row in rows_c100_only:
-            c100_cols = (c100_row + [""] * 12)[:12]
-            rows_c100_c170_c190.append(c100_cols + ([""] * 12) + ([""] * 12))
-
-    if rows_c100_c170_c190:
-        max_len = max(len(r) for r in rows_c100_c170_c190)
-        padded = [r + [""] * (max_len - len(r)) for r in rows_c100_c170_c190]
-        cols_c100 = [f"C100_{c}" for c in c100_cols_layout]
-        cols_c170 = [f"C170_{c}" for c in c170_cols_layout]
-        cols_c190 = [f"C190_{c}" for c in c190_cols_layout]
-        base_cols = cols_c100 + cols_c170 + cols_c190
-        cols = base_cols + [f"C_EXTRAS_{i}" for i in range(len(base_cols) + 1, max_len + 1)] if max_len > len(base_cols) else base_cols[:max_len]
-        df_c100_c170 = pd.DataFrame(padded, columns=cols)
+    if isinstance(origem, str):
+        yield origem.splitlines(manter_quebras)
+        return
+    if isinstance(origem, os.PathLike):
+        with open(origem, "rb") as f:
+            yield from _blocos_de_linhas(f, tamanho_bloco, medidor, etapa_leitura, manter_quebras)
+        return
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        origem = io.BytesIO(origem)
+
+    decoder = codecs.getincrementaldecoder("latin-1")()
+    pendente = ""
+    while True:
+        with medidor.etapa(etapa_leitura):
+            bloco = origem.read(tamanho_bloco)
+        with medidor.etapa("sped.decodificar"):
+            texto = pendente + decoder.decode(bloco, final=not bloco)
+            linhas = texto.splitlines(manter_quebras)
+            pendente = ""
+            if bloco and texto:
+                ultimo = texto[-1]
+                if ultimo == "\r":
+                    pendente = linhas.pop() + ("" if manter_quebras else "\r")
+                elif ultimo not in _QUEBRAS:
+                    pendente = linhas.pop()
+        if linhas:
+            yield linhas
+        if not bloco:
+            return
+
+
+def _df_registro(rows, layout_cols, prefix_extra):
+    """DataFrame de um registro simples: linhas curtas completadas com "", campos a mais em *_EXTRA_n."""
+    tamanhos = {len(r) for r in rows}
+    max_len = max(tamanhos)
+    padded = rows if len(tamanhos) == 1 else [r + [""] * (max_len - len(r)) for r in rows]
+    if max_len <= len(layout_cols):
+        cols = layout_cols[:max_len]
     else:
-        df_c100_c170 = pd.DataFrame()
+        extras = [f"{prefix_extra}_EXTRA_{i}" for i in range(len(layout_cols) + 1, max_len + 1)]
+        cols = layout_cols + extras
+    return pd.DataFrame(padded, columns=cols)
+
+
+def _df_c100_c170_c190(rows):
+    df = pd.DataFrame(rows, columns=COLS_C100_C170_C190)
+    for col in ["C100_DT_DOC", "C100_DT_E_S"]:
+        s = df[col].astype(str).str.strip().str.extract(r"(\d{8})", expand=False)
+        df[col] = pd.to_datetime(s, format="%d%m%Y", errors="coerce")
+    return df
 
+
+def decimal_br(serie: pd.Series) -> pd.Series:
+    """
+    Valores no padrão brasileiro ("1.234,56", "1234,56") em float64, com
+    operações vetorizadas sobre a coluna inteira. Texto sem vírgula vai como
+    está ("1234.56"); vazio ou inválido vira NaN.
+    """
+    s = serie.astype(str).str.strip()
+    vazio = s == ""
+    if vazio.all():  # ex.: colunas do C190 nas linhas de C170
+        return pd.Series(float("nan"), index=serie.index, name=serie.name)
+    virgula = s.str.contains(",", regex=False)
+    if virgula.any():
+        br = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+        s = br if virgula.all() else br.where(virgula, s)
+    s = s.where(~vazio)
+    try:
+        return s.astype("float64")
+    except (ValueError, TypeError):
+        # Algum valor inválido: o to_numeric (mais lento) deixa só ele NaN
+        return pd.to_numeric(s, errors="coerce").astype("float64")
+
+
+def _aplicar_tipos(df, tipos: dict):
+    """Converte as colunas de `df` que estão em `tipos` (schemas.sped), no próprio df."""
+    for col, tipo in tipos.items():
+        if col not in df.columns:
+            continue
+        if tipo == DECIMAL:
+            df[col] = decimal_br(df[col])
+        elif tipo == CATEGORIA:
+            s = df[col].astype("category")
+            if "" in s.cat.categories:
+                s = s.cat.remove_categories([""])
+            df[col] = s
+    return df
+
+
+def _montar_lote(registro, rows, source_name, tipado=False):
+    if registro == "0190":
+        df = _df_registro(rows, COLS_0190, PREFIXOS_EXTRA_EFD["0190"])
+    elif registro == "0200":
+        df = _df_registro(rows, COLS_0200, PREFIXOS_EXTRA_EFD["0200"])
+    else:
+        df = _df_c100_c170_c190(rows)
+    if tipado:
+        _aplicar_tipos(df, TIPOS_EFD[registro] if registro in ("0190", "0200") else TIPOS_C100_C170_C190)
     if source_name:
-        for df in (df_0190, df_0200, df_c100_c170):
-            if df is not None and not df.empty:
-                df.insert(0, "ARQUIVO_ORIGEM", source_name)
+        origem = pd.Categorical([source_name]).repeat(len(df)) if tipado else source_name
+        df.insert(0, "ARQUIVO_ORIGEM", origem)
+    return df
+
+
+def iter_lotes_efd(origem, source_name: str | None = None, tamanho_lote: int = TAMANHO_LOTE_SPED,
+                   medidor=None, *, tipado: bool = False, tamanho_bloco: int = TAMANHO_BLOCO_SPED,
+                   etapa_leitura="sped.ler_arquivo"):
+    """
+    Lê uma EFD ICMS/IPI em fluxo e devolve (registro, DataFrame) em lotes de
+    até `tamanho_lote` linhas. Nem o arquivo nem os lotes já emitidos ficam
+    em memória: o pico depende de `tamanho_bloco` e `tamanho_lote`, não do
+    tamanho do arquivo.
+
+    registro (ver REGISTROS_LOTE):
+      "0190", "0200": o registro, com as colunas do leiaute (+ *_EXTRA_n);
+      "C170", "C190": o filho junto do C100 a que pertence (o último C100
+                      lido, mesmo que em outro bloco), nas colunas
+                      COLS_C100_C170_C190, com as do outro filho vazias;
+      "C100":         cada C100, com as colunas de C170 e C190 vazias.
+    Os lotes de um mesmo registro saem na ordem do arquivo. Datas do C100 já
+    vêm convertidas e, com `source_name`, a coluna ARQUIVO_ORIGEM abre a tabela.
+    Com `tipado`, valores viram float64 e códigos viram category conforme
+    schemas.sped (sem ele, todas as outras colunas ficam texto).
+
+    origem: como em _blocos_de_linhas (bytes, arquivo aberto, caminho ou str).
+    """
+    medidor = medidor or MEDIDOR_NULO
+    tamanho_lote = max(1, tamanho_lote)
+    acumulados = {r: [] for r in REGISTROS_LOTE}
+    contagem = dict.fromkeys(REGISTROS_LOTE, 0)
+    c100_atual = None
+    n_linhas = 0
+
+    for linhas in _blocos_de_linhas(origem, tamanho_bloco, medidor, etapa_leitura):
+        n_linhas += len(linhas)
+        prontos = []
+        with medidor.etapa("sped.leitura_linhas"):
+            for linha in linhas:
+                linha = linha.strip()
+                if not linha or "|" not in linha: continue
+                if not linha.startswith("|"): continue
+                partes = linha.split("|")
+                if len(partes) < 3: continue
+                campos = partes[1:-1]
+                if not campos: continue
+                reg = campos[0].upper()
+
+                if reg == "0190" or reg == "0200":
+                    row = campos
+                elif reg == "C100":
+                    c100_atual = (campos + _VAZIO_12)[:12]
+                    row = c100_atual + _VAZIO_12 + _VAZIO_12
+                elif reg == "C170" and c100_atual is not None:
+                    row = c100_atual + (campos + _VAZIO_12)[:12] + _VAZIO_12
+                elif reg == "C190" and c100_atual is not None:
+                    row = c100_atual + _VAZIO_12 + (campos + _VAZIO_12)[:12]
+                else:
+                    continue
+                rows = acumulados[reg]
+                rows.append(row)
+                if len(rows) >= tamanho_lote:
+                    prontos.append((reg, rows))
+                    acumulados[reg] = []
+
+        for reg, rows in prontos:
+            contagem[reg] += len(rows)
+            with medidor.etapa("sped.montar_dataframes"):
+                df = _montar_lote(reg, rows, source_name, tipado)
+            del rows
+            yield reg, df
+
+    for reg, rows in acumulados.items():
+        if rows:
+            contagem[reg] += len(rows)
+            with medidor.etapa("sped.montar_dataframes"):
+                df = _montar_lote(reg, rows, source_name, tipado)
+            yield reg, df
+
+    medidor.contar("sped.arquivos")
+    medidor.contar("sped.linhas", n_linhas)
+    for reg, n in contagem.items():
+        medidor.contar(f"sped.registros.{reg}", n)
+
+
+def gravar_lotes_efd(origem, pasta_destino, source_name: str | None = None, tamanho_lote: int = TAMANHO_LOTE_SPED,
+                     medidor=None, **kwargs) -> dict:
+    """
+    Grava os lotes de iter_lotes_efd em `pasta_destino`, um pickle do pandas
+    por lote (<registro>_<n>.pkl), com só um lote em memória por vez.
+    Devolve {registro: [caminhos na ordem do arquivo]}, que ler_lotes_gravados
+    transforma nas mesmas tabelas de _parse_efd_icms_ipi_txt.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    os.makedirs(pasta_destino, exist_ok=True)
+    arquivos = {r: [] for r in REGISTROS_LOTE}
+    for reg, df in iter_lotes_efd(origem, source_name, tamanho_lote, medidor, **kwargs):
+        caminho = os.path.join(pasta_destino, f"{reg}_{len(arquivos[reg]) + 1:05d}.pkl")
+        with medidor.etapa("sped.gravar_lotes"):
+            df.to_pickle(caminho)
+        arquivos[reg].append(caminho)
+    return arquivos
+
+
+def ler_lotes_gravados(arquivos: dict, medidor=None):
+    """(df_0190, df_0200, df_c100_c170) a partir do retorno de gravar_lotes_efd."""
+    lotes = {r: [pd.read_pickle(c) for c in arquivos.get(r, ())] for r in REGISTROS_LOTE}
+    return _juntar_lotes(lotes, medidor or MEDIDOR_NULO)
+
+
+# Valor de preenchimento, por tipo numpy, das linhas de partes sem a coluna
+_AUSENTE_NUMPY = {"f": np.nan, "M": np.datetime64("NaT"), "m": np.timedelta64("NaT")}
+
+
+def _concat_categorias(partes, tamanhos, total):
+    """
+    Coluna category a partir das partes (None = parte sem a coluna): as
+    categorias são unidas uma vez e os códigos vão, remapeados, para um
+    único array já do tamanho final. (O concat do pandas recodificaria
+    parte a parte ou, com categorias diferentes, devolveria object.)
+    """
+    partes = [p.array if p is not None else None for p in partes]
+    presentes = [p for p in partes if p is not None]
+    categorias = presentes[0].categories
+    iguais = all(p.categories.equals(categorias) for p in presentes)
+    if not iguais:
+        categorias = pd.Index(sorted(set().union(*(p.categories for p in presentes))))
+    codigos = np.empty(total, dtype=np.int32)
+    pos = 0
+    for p, n in zip(partes, tamanhos):
+        if p is None:
+            codigos[pos:pos + n] = -1
+        else:
+            c = p.codes
+            if not iguais and len(p.categories):
+                c = np.where(c >= 0, categorias.get_indexer(p.categories)[c], -1)
+            codigos[pos:pos + n] = c
+        pos += n
+    return pd.Categorical.from_codes(codigos, categories=categorias)
+
+
+def _concat_coluna(partes, tamanhos, total, vazio):
+    """
+    Uma coluna da tabela final a partir das partes (Series; None = parte sem
+    a coluna, preenchida com NaN/NaT ou, se texto, com `vazio`).
+    """
+    presentes = [p for p in partes if p is not None]
+    dtype = presentes[0].dtype
+    if all(isinstance(p.dtype, pd.CategoricalDtype) for p in presentes):
+        return _concat_categorias(partes, tamanhos, total)
+    mesmo_tipo = all(p.dtype == dtype for p in presentes)
+    completa = len(presentes) == len(partes)
+    if mesmo_tipo and isinstance(dtype, np.dtype) and (completa or dtype.kind in "fMmO"):
+        # Array do tamanho final, preenchido parte a parte
+        saida = np.empty(total, dtype=dtype)
+        ausente = vazio if dtype.kind == "O" else _AUSENTE_NUMPY.get(dtype.kind)
+        pos = 0
+        for p, n in zip(partes, tamanhos):
+            saida[pos:pos + n] = p.to_numpy() if p is not None else ausente
+            pos += n
+        return saida
+    # Texto do pandas (str/pyarrow) ou tipos mistos: concat só desta coluna
+    series = [
+        p if p is not None else pd.Series(np.full(n, vazio, dtype=object))
+        for p, n in zip(partes, tamanhos)
+    ]
+    return pd.concat(series, ignore_index=True).array
+
+
+def _concat_tabelas(dfs, vazio=np.nan):
+    """
+    pd.concat(dfs, ignore_index=True) montado coluna a coluna: cada coluna
+    vai para um array já do tamanho final (category: códigos remapeados; ver
+    _concat_categorias) e as partes dela são soltas em seguida, então o pico
+    fica perto da tabela final mais uma coluna, em vez das partes inteiras
+    mais a tabela final. Consome `dfs` (a lista é esvaziada).
+    vazio: valor das colunas de texto nas linhas de partes sem a coluna.
+    """
+    if len(dfs) == 1:
+        return dfs.pop()
+    ordem = list(dict.fromkeys(c for d in dfs for c in d.columns))  # a mesma do pd.concat
+    tamanhos = [len(d) for d in dfs]
+    total = sum(tamanhos)
+    colunas = [{c: d[c] for c in d.columns} for d in dfs]
+    dfs.clear()
+    saida = {}
+    for col in ordem:
+        partes = [cols.pop(col, None) for cols in colunas]
+        saida[col] = _concat_coluna(partes, tamanhos, total, vazio)
+        del partes
+    return pd.DataFrame(saida, columns=ordem, copy=False)
 
-    if not df_c100_c170.empty:
-        for col in ["C100_DT_DOC", "C100_DT_E_S"]:
-            if col in df_c100_c170.columns:
-                s = df_c100_c170[col].astype(str).str.strip().str.extract(r"(\d{8})", expand=False)
-                df_c100_c170[col] = pd.to_datetime(s, format="%d%m%Y", errors="coerce")
 
+def _concat_lotes(dfs):
+    """Tabela a partir dos lotes de um registro (a lista é esvaziada)."""
+    partes = [d for d in dfs if d is not None and not d.empty]
+    dfs.clear()
+    if not partes:
+        return pd.DataFrame()
+    # Lote com linhas mais curtas (ou sem *_EXTRA_n) fica com "" nessas
+    # colunas de texto, como se o arquivo fosse lido de uma vez.
+    return _concat_tabelas(partes, vazio="")
+
+
+def _juntar_lotes(lotes: dict, medidor=MEDIDOR_NULO):
+    """
+    Tabelas finais a partir dos lotes por registro. Na tabela C100, todos os
+    pares C100+C170 vêm antes dos C100+C190; só sem nenhum dos dois ela
+    traz os C100 sozinhos. Esvazia `lotes` (cada lote é solto ao ser copiado).
+    """
+    with medidor.etapa("sped.montar_dataframes"):
+        df_0190 = _concat_lotes(lotes.pop("0190"))
+        df_0200 = _concat_lotes(lotes.pop("0200"))
+        itens = lotes.pop("C170") + lotes.pop("C190") or lotes.pop("C100")
+        lotes.clear()
+        df_c100_c170 = _concat_lotes(itens)
     return df_0190, df_0200, df_c100_c170
 
 
-def parse_sped_from_any(data: bytes, filename: str):
+def _parse_efd_icms_ipi_txt(txt_bytes, source_name: str | None = None, is_text: bool = False,
+                            medidor=MEDIDOR_NULO, etapa_leitura="sped.ler_arquivo", tipado=False):
+    """
+    Lê um conteúdo de EFD ICMS/IPI (bytes, arquivo aberto ou a string já
+    extraída de um docx) e devolve (df_0190, df_0200, df_c100_c170).
+    'is_text' fica por compatibilidade: str já é tratada como texto.
+    Monta as tabelas a partir dos lotes de iter_lotes_efd; quem não precisa
+    delas inteiras deve usar o iterador.
+    """
+    lotes = {r: [] for r in REGISTROS_LOTE}
+    for reg, df in iter_lotes_efd(txt_bytes, source_name, medidor=medidor, tipado=tipado, etapa_leitura=etapa_leitura):
+        lotes[reg].append(df)
+    return _juntar_lotes(lotes, medidor)
+
+
+# --- Índice de registros ---
+class IndiceEFD:
+    """
+    Índice de todos os registros de uma EFD ICMS/IPI, montado numa única
+    leitura do arquivo: para cada tipo de registro, o offset em bytes, o
+    tamanho e o número (1-based) de cada linha, e o índice do pai
+    (PAIS_EFD: C100 -> C170/C190, D100 -> D190, ...). As tabelas são
+    montadas só quando pedidas, lendo direto as linhas indexadas: pedir
+    outro registro ou uma junção pai/filho não relê o arquivo.
+
+        with IndiceEFD(caminho) as indice:
+            indice.contagem()                  # {"0000": 1, "C100": 5000, ...}
+            df_e110 = indice.dataframe("E110")
+            df_itens = indice.juntar("C100", "C170")
+
+    origem: bytes, caminho (str ou Path, lido via mmap) ou arquivo binário
+    com seek.
+    Vale a mesma regra de linhas de iter_lotes_efd (só as que começam com
+    "|", registro em maiúsculas), e um filho sem pai lido antes dele fica
+    com pai -1. As tabelas ficam guardadas após a primeira montagem
+    (limpar() as descarta).
+    """
+
+    def __init__(self, origem, pais=None, medidor=None, tamanho_bloco: int = TAMANHO_BLOCO_SPED):
+        self.medidor = medidor or MEDIDOR_NULO
+        self.pais = dict(PAIS_EFD if pais is None else pais)
+        self._tabelas = {}
+        # registro -> (offsets, tamanhos, linhas, pais)
+        self._registros = {}
+        self._arquivo = None  # aberto aqui (origem = caminho)
+        self._fonte = None    # arquivo com seek, quando não há bytes/mmap
+        if isinstance(origem, (bytes, bytearray, memoryview)):
+            self._dados = bytes(origem) if isinstance(origem, memoryview) else origem
+            fonte = self._dados
+        elif isinstance(origem, (str, os.PathLike)):
+            self._arquivo = fonte = open(origem, "rb")
+        else:
+            self._dados = None
+            self._fonte = fonte = origem
+            origem.seek(0)
+        with self.medidor.etapa("sped.indexar"):
+            self.n_linhas = self._indexar(fonte, tamanho_bloco)
+        if self._arquivo is not None:
+            tamanho = os.fstat(self._arquivo.fileno()).st_size
+            self._dados = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ) if tamanho else b""
+        self.medidor.contar("sped.linhas", self.n_linhas)
+
+    def _indexar(self, fonte, tamanho_bloco) -> int:
+        registros = self._registros
+        pais = self.pais
+        pos = 0
+        n = 0
+        for linhas in _blocos_de_linhas(fonte, tamanho_bloco, self.medidor, manter_quebras=True):
+            for linha in linhas:
+                n += 1
+                tam = len(linha)
+                s = linha.strip()
+                if s[:1] == "|":
+                    j = s.find("|", 1)
+                    if j > 1:
+                        reg = s[1:j].upper()
+                        entrada = registros.get(reg)
+                        if entrada is None:
+                            entrada = registros[reg] = (array("Q"), array("I"), array("Q"), array("i"))
+                        entrada[0].append(pos)
+                        entrada[1].append(tam)
+                        entrada[2].append(n)
+                        pai = pais.get(reg)
+                        if pai is not None:
+                            do_pai = registros.get(pai)
+                            entrada[3].append(len(do_pai[0]) - 1 if do_pai is not None else -1)
+                pos += tam
+        return n
+
+    # --- Consultas ao índice ---
+    def contagem(self) -> dict:
+        """{registro: quantidade de linhas}, na ordem em que aparecem no arquivo."""
+        return {reg: len(e[0]) for reg, e in self._registros.items()}
+
+    def _entrada(self, registro):
+        entrada = self._registros.get(registro.upper())
+        return entrada if entrada is not None else (array("Q"), array("I"), array("Q"), array("i"))
+
+    def offsets(self, registro) -> np.ndarray:
+        return np.frombuffer(self._entrada(registro)[0], dtype=np.uint64)
+
+    def linhas(self, registro) -> np.ndarray:
+        """Números (1-based) das linhas do registro no arquivo."""
+        return np.frombuffer(self._entrada(registro)[2], dtype=np.uint64)
+
+    def pais_de(self, registro) -> np.ndarray:
+        """Para cada linha do registro, a posição do pai entre as linhas de PAIS_EFD[registro] (-1: sem pai)."""
+        if registro.upper() not in self.pais:
+            raise ValueError(f"Registro {registro} sem pai definido no índice")
+        return np.frombuffer(self._entrada(registro)[3], dtype=np.int32)
+
+    def campos(self, registro) -> list:
+        """Campos (como em iter_lotes_efd) de cada linha do registro, lidos pelos offsets."""
+        offsets, tamanhos, _linhas, _pais = self._entrada(registro)
+        if self._dados is not None:
+            dados = self._dados
+            return [
+                dados[o:o + t].decode("latin-1").strip().split("|")[1:-1] for o, t in zip(offsets, tamanhos)
+            ]
+        resultado = []
+        for o, t in zip(offsets, tamanhos):
+            self._fonte.seek(o)
+            resultado.append(self._fonte.read(t).decode("latin-1").strip().split("|")[1:-1])
+        return resultado
+
+    # --- Tabelas sob demanda ---
+    def dataframe(self, registro, tipado: bool = False) -> pd.DataFrame:
+        """
+        Tabela do registro, com as colunas de LEIAUTES_EFD (+ *_EXTRA_n) ou
+        REG, CAMPO_02, CAMPO_03... para registros sem leiaute conhecido.
+        Com `tipado`, aplica os tipos de schemas.sped. Tudo texto nos demais
+        casos, inclusive datas.
+        """
+        registro = registro.upper()
+        chave = (registro, tipado)
+        df = self._tabelas.get(chave)
+        if df is not None:
+            return df
+        with self.medidor.etapa("sped.montar_dataframes"):
+            rows = self.campos(registro)
+            if not rows:
+                df = pd.DataFrame()
+            else:
+                layout = LEIAUTES_EFD.get(registro)
+                if layout is None:
+                    layout = ["REG"] + [f"CAMPO_{i:02d}" for i in range(2, max(len(r) for r in rows) + 1)]
+                df = _df_registro(rows, layout, PREFIXOS_EXTRA_EFD.get(registro, registro))
+                if tipado:
+                    _aplicar_tipos(df, TIPOS_EFD.get(registro, {}))
+        self._tabelas[chave] = df
+        return df
+
+    def juntar(self, pai, filho, tipado: bool = False) -> pd.DataFrame:
+        """
+        Uma linha por `filho` que tenha pai, com as colunas do pai e depois
+        as do filho, prefixadas pelo registro ("C100_NUM_DOC", "C170_CFOP").
+        """
+        pai, filho = pai.upper(), filho.upper()
+        if self.pais.get(filho) != pai:
+            raise ValueError(f"{filho} não é filho de {pai} no índice (PAIS_EFD)")
+        df_filho = self.dataframe(filho, tipado)
+        if df_filho.empty:
+            return pd.DataFrame()
+        idx = self.pais_de(filho)
+        com_pai = idx >= 0
+        if not com_pai.any():
+            return pd.DataFrame()
+        with self.medidor.etapa("sped.juntar"):
+            esquerda = self.dataframe(pai, tipado).add_prefix(f"{pai}_").take(idx[com_pai]).reset_index(drop=True)
+            direita = df_filho.add_prefix(f"{filho}_")[com_pai].reset_index(drop=True)
+            return pd.concat([esquerda, direita], axis=1)
+
+    def limpar(self):
+        """Descarta as tabelas já montadas (o índice continua)."""
+        self._tabelas.clear()
+
+    def fechar(self):
+        self._tabelas.clear()
+        if self._arquivo is not None:
+            if isinstance(self._dados, mmap.mmap):
+                self._dados.close()
+            self._dados = None
+            self._arquivo.close()
+            self._arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+# --- ZIP com vários arquivos (consolidações) ---
+def _membros_sped(zf):
+    return [info for info in zf.infolist() if info.filename.lower().endswith((".txt", ".docx"))]
+
+
+def _pasta_membro(pasta_destino, i, nome):
+    """Subpasta do i-ésimo membro na saída particionada (None sem pasta_destino)."""
+    if not pasta_destino:
+        return None
+    base = re.sub(r"[^\w.-]", "_", os.path.basename(nome.rstrip("/"))) or "membro"
+    return os.path.join(pasta_destino, f"{i:04d}_{base}")
+
+
+def _parse_membro_sped(zf, info, medidor, tipado=False, pasta_destino=None):
+    """
+    Lê um membro .txt/.docx do ZIP: (df_0190, df_0200, df_c100_c170) ou, com
+    pasta_destino, os lotes gravados lá ({registro: [arquivos]}).
+    """
+    if info.filename.lower().endswith(".txt"):
+        # Descompactado em fluxo, junto com o parse
+        with zf.open(info) as f:
+            if pasta_destino:
+                return gravar_lotes_efd(f, pasta_destino, info.filename, medidor=medidor, tipado=tipado,
+                                        etapa_leitura="sped.descompactar")
+            return _parse_efd_icms_ipi_txt(f, source_name=info.filename, medidor=medidor,
+                                           etapa_leitura="sped.descompactar", tipado=tipado)
+    with medidor.etapa("sped.descompactar"):
+        with zf.open(info) as f:
+            conteudo = f.read()
+    with medidor.etapa("sped.ler_docx"):
+        texto = _extract_text_from_docx(conteudo)
+    if pasta_destino:
+        return gravar_lotes_efd(texto, pasta_destino, info.filename, medidor=medidor, tipado=tipado)
+    return _parse_efd_icms_ipi_txt(texto, source_name=info.filename, is_text=True, medidor=medidor, tipado=tipado)
+
+
+def _parse_membro_sped_processo(caminho_zip, nome, tipado, pasta_destino, medir):
+    """
+    Executado nos processos filhos: abre o ZIP pelo caminho e lê um membro.
+    Retorna (resultado de _parse_membro_sped, relatório do Medidor do filho ou None).
+    """
+    medidor = Medidor() if medir else MEDIDOR_NULO
+    with zipfile.ZipFile(caminho_zip) as zf:
+        res = _parse_membro_sped(zf, zf.getinfo(nome), medidor, tipado, pasta_destino)
+    return res, (medidor.relatorio() if medir else None)
+
+
+def iter_sped_zip(zip_origem, workers: int = 1, tipado: bool = False, medidor=None, pasta_destino=None):
+    """
+    Gera (nome do membro, resultado) para cada .txt/.docx do ZIP, na ordem
+    do ZIP. resultado: (df_0190, df_0200, df_c100_c170) do membro ou, com
+    `pasta_destino`, o {registro: [arquivos]} de gravar_lotes_efd numa
+    subpasta por membro (saída particionada: nenhuma tabela fica em memória).
+
+    Com workers > 1 os membros são lidos em um pool de processos, cada um
+    abrindo o ZIP por conta própria (bytes vão antes para um arquivo
+    temporário); no máximo workers*2 membros ficam em voo, e os resultados
+    chegam conforme ficam prontos, sem esperar o ZIP inteiro.
+    zip_origem: bytes do ZIP ou caminho.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    em_memoria = isinstance(zip_origem, (bytes, bytearray, memoryview))
+
+    if workers <= 1:
+        with zipfile.ZipFile(io.BytesIO(zip_origem) if em_memoria else zip_origem) as zf:
+            for i, info in enumerate(_membros_sped(zf)):
+                pasta = _pasta_membro(pasta_destino, i, info.filename)
+                yield info.filename, _parse_membro_sped(zf, info, medidor, tipado, pasta)
+        return
+
+    def _concluir(nome, futuro):
+        with medidor.etapa("sped.espera_processos"):
+            res, relatorio = futuro.result()
+        medidor.mesclar(relatorio)
+        return nome, res
+
+    with tempfile.TemporaryDirectory(prefix="sped_zip_") as tmp:
+        caminho = zip_origem
+        if em_memoria:
+            caminho = os.path.join(tmp, "entrada.zip")
+            with open(caminho, "wb") as f:
+                f.write(zip_origem)
+        with zipfile.ZipFile(caminho) as zf:
+            nomes = [info.filename for info in _membros_sped(zf)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pendentes = deque()
+            for i, nome in enumerate(nomes):
+                futuro = executor.submit(_parse_membro_sped_processo, caminho, nome, tipado,
+                                         _pasta_membro(pasta_destino, i, nome), medidor is not MEDIDOR_NULO)
+                pendentes.append((nome, futuro))
+                # Limita os membros em voo (e as tabelas prontas esperando a vez)
+                if len(pendentes) >= workers * 2:
+                    yield _concluir(*pendentes.popleft())
+            while pendentes:
+                yield _concluir(*pendentes.popleft())
+
+
+def parse_sped_from_any(data: bytes, filename: str, medidor=None, tipado: bool = False, workers: int = 1):
     """
     Suporta TXT, ZIP e agora DOCX.
+    medidor (core.instrumentacao.Medidor) recebe tempos por etapa e contadores.
+    tipado: valores em float64 e códigos em category (schemas.sped).
+    workers: processos para ler os membros de um ZIP em paralelo (iter_sped_zip).
+    Para não montar as tabelas na memória, ver gravar_sped_particionado.
     """
+    medidor = medidor or MEDIDOR_NULO
+    medidor.contar("sped.bytes_lidos", len(data))
     filename_lower = (filename or "").lower()
     dfs_0190, dfs_0200, dfs_c100_c170 = [], [], []
 
     # --- Lógica para TXT ---
     if filename_lower.endswith(".txt"):
-        res = _parse_efd_icms_ipi_txt(data, source_name=filename)
+        res = _parse_efd_icms_ipi_txt(data, source_name=filename, medidor=medidor, tipado=tipado)
         dfs_0190.append(res[0]); dfs_0200.append(res[1]); dfs_c100_c170.append(res[2])
 
     # --- Lógica para DOCX ---
     elif filename_lower.endswith(".docx"):
-        texto_docx = _extract_text_from_docx(data)
+        with medidor.etapa("sped.ler_docx"):
+            texto_docx = _extract_text_from_docx(data)
         # Passamos o texto extraído diretamente
-        res = _parse_efd_icms_ipi_txt(texto_docx, source_name=filename, is_text=True)
+        res = _parse_efd_icms_ipi_txt(texto_docx, source_name=filename, is_text=True, medidor=medidor,
+                                      tipado=tipado)
         dfs_0190.append(res[0]); dfs_0200.append(res[1]); dfs_c100_c170.append(res[2])
 
     # --- Lógica para ZIP ---
     elif filename_lower.endswith(".zip"):
-        with zipfile.ZipFile(io.BytesIO(data)) as zf:
-            for info in zf.infolist():
-                fname = info.filename.lower()
-                if fname.endswith(".txt"):
-                    with zf.open(info) as f:
-                        res = _parse_efd_icms_ipi_txt(f.read(), source_name=info.filename)
-                elif fname.endswith(".docx"):
-                    with zf.open(info) as f:
-                        texto = _extract_text_from_docx(f.read())
-                        res = _parse_efd_icms_ipi_txt(texto, source_name=info.filename, is_text=True)
-                else:
-                    continue
-                dfs_0190.append(res[0]); dfs_0200.append(res[1]); dfs_c100_c170.append(res[2])
+        for _nome, res in iter_sped_zip(data, workers, tipado, medidor):
+            dfs_0190.append(res[0]); dfs_0200.append(res[1]); dfs_c100_c170.append(res[2])
 
     def _concat(dfs):
-        dfs = [d for d in dfs if d is not None and not d.empty]
-        return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+        partes = [d for d in dfs if d is not None and not d.empty]
+        dfs.clear()
+        if not partes:
+            return pd.DataFrame()
+        return _concat_tabelas(partes)
 
-    return _concat(dfs_0190), _concat(dfs_0200), _concat(dfs_c100_c170)
\ No newline at end of file
+    with medidor.etapa("sped.concatenar"):
+        return _concat(dfs_0190), _concat(dfs_0200), _concat(dfs_c100_c170)
+
+
+def gravar_sped_particionado(data: bytes, filename: str, pasta_destino, medidor=None, tipado: bool = False,
+                             workers: int = 1) -> list:
+    """
+    Mesmas entradas de parse_sped_from_any (TXT, ZIP, DOCX), mas sem montar
+    as tabelas: cada TXT/DOCX (ou membro do ZIP) vira uma subpasta de
+    `pasta_destino` com os lotes de gravar_lotes_efd.
+    Retorna [(nome do arquivo, {registro: [lotes gravados]})], na ordem de
+    parse_sped_from_any; tabelas_particionadas monta a saída a partir dele.
+    """
+    medidor = medidor or MEDIDOR_NULO
+    medidor.contar("sped.bytes_lidos", len(data))
+    filename_lower = (filename or "").lower()
+
+    if filename_lower.endswith(".zip"):
+        return list(iter_sped_zip(data, workers, tipado, medidor, pasta_destino))
+    if filename_lower.endswith(".txt"):
+        conteudo = data
+    elif filename_lower.endswith(".docx"):
+        with medidor.etapa("sped.ler_docx"):
+            conteudo = _extract_text_from_docx(data)
+    else:
+        return []
+    pasta = _pasta_membro(pasta_destino, 0, filename)
+    return [(filename, gravar_lotes_efd(conteudo, pasta, filename, medidor=medidor, tipado=tipado))]
+
+
+def _iter_itens_gravados(particoes):
+    for _nome, arquivos in particoes:
+        for caminho in arquivos["C170"] + arquivos["C190"] or arquivos["C100"]:
+            yield pd.read_pickle(caminho)
+
+
+def tabelas_particionadas(particoes, medidor=None):
+    """
+    (df_0190, df_0200, lotes_c100_c170) a partir do retorno de
+    gravar_sped_particionado: 0190 e 0200 (pequenas) montadas; a tabela
+    C100+C170/C190 como iterável que lê um lote do disco por vez, na mesma
+    ordem de parse_sped_from_any (exportar_sped aceita o iterável direto).
+    """
+    medidor = medidor or MEDIDOR_NULO
+    dfs_0190, dfs_0200 = [], []
+    for _nome, arquivos in particoes:
+        with medidor.etapa("sped.ler_lotes"):
+            dfs_0190.append(_concat_lotes([pd.read_pickle(c) for c in arquivos["0190"]]))
+            dfs_0200.append(_concat_lotes([pd.read_pickle(c) for c in arquivos["0200"]]))
+
+    def _concat(dfs):
+        partes = [d for d in dfs if not d.empty]
+        return _concat_tabelas(partes) if partes else pd.DataFrame()
+
+    return _concat(dfs_0190), _concat(dfs_0200), _iter_itens_gravados(particoes)
+
+
+# --- Exportação ---
+# Nomes (abas do Excel / arquivos no ZIP) das tabelas de parse_sped_from_any
+NOMES_TABELAS_SPED = ("Unidades_0190", "Produtos_0200", "Itens_C100_C170")
+
+
+def exportar_sped(tabelas, destino, formato: str = "xlsx", medidor=None) -> list:
+    """
+    Grava (df_0190, df_0200, df_c100_c170) de parse_sped_from_any em
+    `destino` no formato de core.exportacao.FORMATOS_EXPORTACAO: "xlsx"
+    (abas numeradas a cada 1.048.575 linhas), "csv.gz" ou "parquet" (ZIP com
+    um arquivo por tabela). Cada tabela também pode ser um iterável de
+    lotes (iter_lotes_efd), para exportar sem montá-la inteira.
+    """
+    return exportar_tabelas(dict(zip(NOMES_TABELAS_SPED, tabelas)), destino, formato, medidor)
@@ -1,34 +1,51 @@
 from datetime import datetime
 from schemas.nfse import NFSe
+from core.ordem_adaptativa import MemoriaProvedor, assinatura_provedor
+from core.xml_backend import Consulta, consulta
+
+# Formato de data que funcionou por provedor (ver core.ordem_adaptativa)
+MEMORIA_PREFEITURA = MemoriaProvedor()
 
 def _txt(node, path):
     if node is None or not path:
         return None
-    el = node.find(path)
+    el = consulta(path).primeiro(node)
     if el is None and not path.startswith(".//"):
-        el = node.find(".//" + path)
+        el = consulta(".//" + path).primeiro(node)
     if el is None or el.text is None:
         return None
     v = el.text.strip()
     return v if v else None
 
 def _first_txt(node, paths):
+    # Caminhos em ordem de prioridade: como _txt cai em ".//caminho", eles se
+    # sobrepõem (ex.: "Numero" também casa com o número do endereço), então a
+    # ordem é fixa e não entra na memória por provedor.
     for p in paths:
         v = _txt(node, p)
         if v:
             return v
     return None
 
-def _to_date(s: str):
+_FORMATOS_DATA = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d/%m/%Y")
+
+def _to_date(s: str, provedor=None, grupo="data"):
     if not s:
         return None
     s = str(s).strip()
-    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d/%m/%Y"):
+    cut = s[:19] if "T" in s else s
+    ordem = (
+        MEMORIA_PREFEITURA.ordem(provedor, grupo, len(_FORMATOS_DATA))
+        if provedor is not None else range(len(_FORMATOS_DATA))
+    )
+    for i in ordem:
         try:
-            cut = s[:19] if "T" in s else s
-            return datetime.strptime(cut, fmt).date()
+            d = datetime.strptime(cut, _FORMATOS_DATA[i]).date()
         except Exception:
-            pass
+            continue
+        if provedor is not None:
+            MEMORIA_PREFEITURA.registrar(provedor, grupo, i)
+        return d
     return None
 
 def _to_float(s: str):
@@ -46,17 +63,23 @@ def _to_float(s: str):
     except Exception:
         return None
 
+_XP_PRESTADOR = Consulta(".//CPFCNPJPrestador")
+_XP_TOMADOR = Consulta(".//CPFCNPJTomador")
+
 def parse_nfse_prefeitura(root):
+    # formato de data que funcionou para este leiaute é tentado primeiro
+    pv = assinatura_provedor(root)
+
     # busca em profundidade (aguenta variações)
-    prest = root.find(".//CPFCNPJPrestador")
-    tom   = root.find(".//CPFCNPJTomador")
+    prest = _XP_PRESTADOR.primeiro(root)
+    tom   = _XP_TOMADOR.primeiro(root)
 
     nfse = NFSe(
         layout="PREFEITURA_NFE",
         numero=_first_txt(root, ["NumeroNFe", "ChaveNFe/NumeroNFe", "nNFSe", "ChaveNFe/nNFSe", "Numero"]),
         serie=_first_txt(root, ["SerieNFe", "ChaveNFe/SerieNFe", "serie"]),
         codigo_verificacao=_first_txt(root, ["CodigoVerificacao", "ChaveNFe/CodigoVerificacao", "cVerif"]),
-        data_emissao=_to_date(_first_txt(root, ["DataEmissaoNFe", "ChaveNFe/DataEmissaoNFe", "DataEmissao", "dEmi"])),
+        data_emissao=_to_date(_first_txt(root, ["DataEmissaoNFe", "ChaveNFe/DataEmissaoNFe", "DataEmissao", "dEmi"]), pv),
         prestador_cnpjcpf=_first_txt(prest, ["CNPJ", "CPF"]) if prest is not None else None,
         prestador_im=_first_txt(root, ["InscricaoMunicipalPrestador"]) or (_txt(prest, "InscricaoMunicipal") if prest is not None else None),
         prestador_razao=_first_txt(root, ["RazaoSocialPrestador"]) or (_txt(prest, "RazaoSocial") if prest is not None else None),
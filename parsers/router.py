@@ -1,7 +1,12 @@
-import xml.etree.ElementTree as ET
-
+from core import xml_backend
 from parsers.nfse_abrasf import parse_nfse_abrasf # type: ignore
 from parsers.nfse_prefeitura import parse_nfse_prefeitura
+from parsers.sniffer import (
+    CTE, EVENTO, INUT, LIMITE_SNIFF, NFE, NFSE_ABRASF, NFSE_PREFEITURA, sniff_bytes, sniff_raiz,
+)
+
+# Tipos que, pela farejada, certamente não são NFS-e
+_TIPOS_NAO_NFSE = {NFE, CTE, EVENTO, INUT}
 
 def _strip_ns(tag: str) -> str:
     return tag.split("}", 1)[-1] if "}" in tag else tag
@@ -11,33 +16,55 @@ def _ns_uri(tag: str):
         return tag[1:tag.index("}")]
     return None
 
-def _has_local(root, localname: str) -> bool:
-    for e in root.iter():
-        if _strip_ns(e.tag).lower() == localname.lower():
-            return True
-    return False
-
-def _has_abrasf_namespace(root) -> bool:
-    # tenta achar qualquer namespace contendo "abrasf"
+def _varrer_nfse(root):
+    """
+    Uma única passada pela árvore: (existe InfNfse?, existe namespace "abrasf"?).
+    Para assim que as duas respostas forem sim.
+    """
+    tem_inf = tem_abrasf = False
     for e in root.iter():
-        ns = _ns_uri(e.tag)
-        if ns and "abrasf" in ns.lower():
-            return True
-    return False
+        tag = e.tag
+        if not isinstance(tag, str):
+            continue
+        if not tem_inf and _strip_ns(tag).lower() == "infnfse":
+            tem_inf = True
+        if not tem_abrasf:
+            ns = _ns_uri(tag)
+            if ns and "abrasf" in ns.lower():
+                tem_abrasf = True
+        if tem_inf and tem_abrasf:
+            break
+    return tem_inf, tem_abrasf
 
-def detect_and_parse_nfse(xml_text: str):
+def detect_and_parse_nfse(xml, tipo=None):
     """
     Retorna NFSe (schema) ou None se não for NFSe suportada.
+    `xml` pode ser o texto/bytes do documento ou a raiz já montada
+    (Element) — assim quem já parseou não parseia de novo. `tipo` é a
+    classificação de parsers.sniffer, se quem chama já a tiver.
     """
-    try:
-        root = ET.fromstring(xml_text)
-    except Exception:
-        return None
+    if isinstance(xml, (str, bytes, bytearray)):
+        if tipo is None:
+            cabeca = xml[:LIMITE_SNIFF]
+            tipo = sniff_bytes(cabeca.encode("utf-8", "ignore") if isinstance(cabeca, str) else cabeca)
+        # NF-e/CT-e/eventos: nem monta a árvore
+        if tipo in _TIPOS_NAO_NFSE:
+            return None
+        try:
+            root = xml_backend.fromstring(xml)
+        except Exception:
+            return None
+    else:
+        root = xml
+        if tipo is None:
+            tipo = sniff_raiz(root)
+        if tipo in _TIPOS_NAO_NFSE:
+            return None
 
     root_name = _strip_ns(root.tag).lower()
 
     # 1) Modelo prefeitura específico
-    if root_name == "nfe":
+    if tipo == NFSE_PREFEITURA or root_name == "nfe":
         return parse_nfse_prefeitura(root)
 
     # 2) ABRASF "clássico"
@@ -46,9 +73,10 @@ def detect_and_parse_nfse(xml_text: str):
 
     # 3) ABRASF em outras raízes (inclui SOAP)
     # Critério principal: existe InfNfse em qualquer lugar
-    if _has_local(root, "InfNfse"):
-        # opcional: reforço pelo namespace abrasf (evita falso positivo)
-        if _has_abrasf_namespace(root) or root_name in {
+    tem_inf, tem_abrasf = _varrer_nfse(root)
+    if tem_inf:
+        # reforço pelo namespace abrasf (evita falso positivo)
+        if tem_abrasf or tipo == NFSE_ABRASF or root_name in {
             "nfse", "gerarnfseresposta", "consultarnfseresposta", "envelope"
         }:
             return parse_nfse_abrasf(root)
@@ -0,0 +1,91 @@
+import re
+
+# Tipos de documento reconhecidos pela farejada (sniff)
+NFE = "NFE"
+CTE = "CTE"
+NFSE_ABRASF = "NFSE_ABRASF"
+NFSE_PREFEITURA = "NFSE_PREFEITURA"
+EVENTO = "EVENTO"
+INUT = "INUT"
+
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+NS_CTE = "http://www.portalfiscal.inf.br/cte"
+
+# Quanto do início do arquivo é olhado (raiz + declarações de namespace)
+LIMITE_SNIFF = 4 * 1024
+
+_RAIZES_NFE = {"nfeproc", "nfe", "envinfe"}
+_RAIZES_CTE = {"cteproc", "cte", "cteos", "cteosproc", "cteproc_os"}
+
+# Primeira tag de elemento (pula declaração, comentários, DOCTYPE e instruções)
+_RE_PRIMEIRA_TAG = re.compile(
+    rb"^(?:\s|<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^>]*>)*<([A-Za-z_][\w.\-]*(?::[\w.\-]+)?)",
+    re.S,
+)
+_RE_XMLNS = re.compile(rb"""xmlns(?::([\w.\-]+))?\s*=\s*["']([^"']*)["']""")
+
+
+def _tipo_por_raiz(local: str, ns: str | None, namespaces) -> str | None:
+    """
+    Decide o tipo pelo nome local da raiz, pelo namespace dela e pelos
+    namespaces declarados. None = inconclusivo (quem chama usa a detecção
+    completa sobre a árvore).
+    """
+    nome = local.lower()
+    ns = ns or ""
+
+    if ns == NS_NFE or ns == NS_CTE:
+        if "evento" in nome:
+            return EVENTO
+        if "inut" in nome:
+            return INUT
+        if ns == NS_NFE and nome in _RAIZES_NFE:
+            return NFE
+        if ns == NS_CTE and nome in _RAIZES_CTE:
+            return CTE
+        return None
+
+    if nome == "compnfse":
+        return NFSE_ABRASF
+    if any("abrasf" in u.lower() for u in namespaces):
+        return NFSE_ABRASF
+    # "NFe" fora do namespace da SEFAZ = modelo de prefeitura (ex.: São Paulo).
+    # Sem namespace algum fica inconclusivo: pode ser NF-e sem xmlns.
+    if nome == "nfe" and ns:
+        return NFSE_PREFEITURA
+    return None
+
+
+def sniff_bytes(xml_bytes: bytes, limite: int = LIMITE_SNIFF) -> str | None:
+    """
+    Classifica o documento olhando só os primeiros `limite` bytes: a tag
+    raiz e as declarações xmlns. Não monta árvore; None se inconclusivo.
+    """
+    if not xml_bytes:
+        return None
+    cabeca = bytes(xml_bytes[:limite])
+    if cabeca.startswith(b"\xef\xbb\xbf"):
+        cabeca = cabeca[3:]
+    m = _RE_PRIMEIRA_TAG.match(cabeca)
+    if not m:
+        return None
+
+    declarados = {}
+    for prefixo, uri in _RE_XMLNS.findall(cabeca):
+        chave = prefixo.decode("ascii", "ignore")
+        declarados.setdefault(chave, uri.decode("utf-8", "ignore"))
+
+    qname = m.group(1).decode("ascii", "ignore")
+    prefixo, _, local = qname.rpartition(":")
+    ns = declarados.get(prefixo)
+    return _tipo_por_raiz(local, ns, declarados.values())
+
+
+def sniff_raiz(root) -> str | None:
+    """Mesma classificação de sniff_bytes, a partir de uma árvore já montada."""
+    tag = root.tag if isinstance(root.tag, str) else ""
+    if tag[:1] == "{":
+        ns, _, local = tag[1:].partition("}")
+    else:
+        ns, local = None, tag
+    return _tipo_por_raiz(local, ns, (ns,) if ns else ())
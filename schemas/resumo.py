@@ -0,0 +1,12 @@
+from dataclasses import dataclass, field
+
+@dataclass
+class ResultadoResumo:
+    # Tupla retornada por summarize_zipfile_resumo (rows, breakdown, totais, períodos)
+    resumo: tuple
+
+    # Linhas agregadas por CNPJ/Modelo/CFOP/Mês/Ano/P-T
+    detalhe: list = field(default_factory=list)
+
+    # Linhas da planilha de itens (det/prod)
+    itens: list = field(default_factory=list)
@@ -0,0 +1,99 @@
+# Tipos das colunas tipadas da EFD ICMS/IPI (logic_sped, tipado=True, e IndiceEFD).
+# Colunas fora daqui continuam texto; datas do C100 já são convertidas à parte
+# e ARQUIVO_ORIGEM (um valor por arquivo) também vira category.
+DECIMAL = "decimal"      # "1.234,56" / "1234,56" -> float64 ("" vira NaN)
+CATEGORIA = "categoria"  # poucos valores distintos -> category ("" vira NaN)
+
+TIPOS_EFD = {
+    "0190": {
+        "REG": CATEGORIA,
+        "UNID": CATEGORIA,
+    },
+    "0200": {
+        "REG": CATEGORIA,
+        "UNID_INV": CATEGORIA,
+        "TIPO_ITEM": CATEGORIA,
+        "ALIQ_ICMS": DECIMAL,
+    },
+    "C100": {
+        "REG": CATEGORIA,
+        "IND_OPER": CATEGORIA,
+        "IND_EMIT": CATEGORIA,
+        "COD_MOD": CATEGORIA,
+        "COD_SIT": CATEGORIA,
+        "SER": CATEGORIA,
+        "VL_DOC": DECIMAL,
+    },
+    "C170": {
+        "REG": CATEGORIA,
+        "QTD": DECIMAL,
+        "UNID": CATEGORIA,
+        "VL_ITEM": DECIMAL,
+        "VL_DESC": DECIMAL,
+        "IND_MOV": CATEGORIA,
+        "CST_ICMS": CATEGORIA,
+        "CFOP": CATEGORIA,
+    },
+    "C190": {
+        "REG": CATEGORIA,
+        "CST_ICMS": CATEGORIA,
+        "CFOP": CATEGORIA,
+        "ALIQ_ICMS": DECIMAL,
+        "VL_OPR": DECIMAL,
+        "VL_BC_ICMS": DECIMAL,
+        "VL_ICMS": DECIMAL,
+        "VL_BC_ICMS_ST": DECIMAL,
+        "VL_ICMS_ST": DECIMAL,
+        "VL_RED_BC": DECIMAL,
+        "VL_IPI": DECIMAL,
+    },
+    "D100": {
+        "REG": CATEGORIA,
+        "IND_OPER": CATEGORIA,
+        "IND_EMIT": CATEGORIA,
+        "COD_MOD": CATEGORIA,
+        "COD_SIT": CATEGORIA,
+        "SER": CATEGORIA,
+        "VL_DOC": DECIMAL,
+        "VL_DESC": DECIMAL,
+        "VL_SERV": DECIMAL,
+        "VL_BC_ICMS": DECIMAL,
+        "VL_ICMS": DECIMAL,
+        "VL_NT": DECIMAL,
+    },
+    "D190": {
+        "REG": CATEGORIA,
+        "CST_ICMS": CATEGORIA,
+        "CFOP": CATEGORIA,
+        "ALIQ_ICMS": DECIMAL,
+        "VL_OPR": DECIMAL,
+        "VL_BC_ICMS": DECIMAL,
+        "VL_ICMS": DECIMAL,
+        "VL_RED_BC": DECIMAL,
+    },
+    "E110": {
+        "REG": CATEGORIA,
+        **dict.fromkeys(
+            (
+                "VL_TOT_DEBITOS", "VL_AJ_DEBITOS", "VL_TOT_AJ_DEBITOS", "VL_ESTORNOS_CRED", "VL_TOT_CREDITOS",
+                "VL_AJ_CREDITOS", "VL_TOT_AJ_CREDITOS", "VL_ESTORNOS_DEB", "VL_SLD_CREDOR_ANT", "VL_SLD_APURADO",
+                "VL_TOT_DED", "VL_ICMS_RECOLHER", "VL_SLD_CREDOR_TRANSPORTAR", "DEB_ESP",
+            ),
+            DECIMAL,
+        ),
+    },
+    "H010": {
+        "REG": CATEGORIA,
+        "UNID": CATEGORIA,
+        "QTD": DECIMAL,
+        "VL_UNIT": DECIMAL,
+        "VL_ITEM": DECIMAL,
+        "IND_PROP": CATEGORIA,
+        "VL_ITEM_IR": DECIMAL,
+    },
+}
+
+# Tabela C100 + C170/C190: colunas com o prefixo do registro de origem
+TIPOS_C100_C170_C190 = {
+    f"{reg}_{col}": tipo for reg in ("C100", "C170", "C190") for col, tipo in TIPOS_EFD[reg].items()
+}